@@ -1,9 +1,11 @@
-from typing import Annotated, TypedDict
+from typing import Annotated, List, TypedDict
 from langgraph.graph import StateGraph
-from langchain.agents import create_tool_calling_agent, AgentExecutor
 from langchain_openai import ChatOpenAI
 from langchain_core.tools import Tool
-from langchain import hub
+from langchain_core.messages import ToolMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+import os
 import logging
 
 # --- Logging ---
@@ -13,22 +15,50 @@ logging.basicConfig(level=logging.INFO)
 # --- Shared State ---
 class AgentRouterState(TypedDict, total=False):
     input: Annotated[str, "User input"]
+    user_id: Annotated[str, "Owner of the document collection"]
+    route: Annotated[str, "Route chosen by the semantic router"]
+    route_confidence: Annotated[float, "Similarity of the query to the chosen route"]
     result: Annotated[str, "Final output"]
+    tools_used: Annotated[List[str], "Tools the agent ran, in call order"]
 
 # --- Import tools ---
 from app.tools import (
     web_search, wikipedia_search, summarize_text, analyze_csv,
-    transcribe_audio, text_to_speech, create_event, send_email
+    transcribe_audio, text_to_speech, create_event, create_events, send_email
 )
+from app.chat_logic import get_chat_chain
+from app.sessions import get_session_store
+from app.semantic_router import get_semantic_router
+from app.lazy import lazy
+from app.metrics import instrument, stage
+from app.tool_agent import build_tool_agent
 
 # --- LLM & Prompt ---
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
-
-try:
-    tool_calling_prompt = hub.pull("hwchase17/openai-tools-agent")
-except Exception as e:
-    logger.warning(f"Failed to pull prompt from hub: {e}")
-    tool_calling_prompt = None  # Optional fallback logic
+@lazy("agent_llm")
+def agent_llm():
+    return ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+
+# Set USE_HUB_PROMPT=1 to fetch the latest prompt from LangChain Hub instead of the bundled copy
+USE_HUB_PROMPT = os.getenv("USE_HUB_PROMPT", "0") == "1"
+
+def _bundled_tool_calling_prompt() -> ChatPromptTemplate:
+    # Local copy of hwchase17/openai-tools-agent, so startup needs no network
+    return ChatPromptTemplate.from_messages([
+        ("system", "You are a helpful assistant"),
+        MessagesPlaceholder("chat_history", optional=True),
+        ("human", "{input}"),
+        MessagesPlaceholder("agent_scratchpad"),
+    ])
+
+@lazy("tool_calling_prompt")
+def tool_calling_prompt():
+    if USE_HUB_PROMPT:
+        try:
+            from langchain import hub
+            return hub.pull("hwchase17/openai-tools-agent")
+        except Exception as e:
+            logger.warning(f"Failed to pull prompt from hub, using bundled copy: {e}")
+    return _bundled_tool_calling_prompt()
 
 # === Agent 1: RAG Agent ===
 rag_tools = [
@@ -37,20 +67,23 @@ rag_tools = [
     Tool(name="summarize_text", func=summarize_text, description="Summarize text content"),
     Tool(name="send_email", func=send_email, description="Send email using Gmail API")
 ]
-rag_agent = create_tool_calling_agent(llm, rag_tools, tool_calling_prompt)
-rag_executor = AgentExecutor(agent=rag_agent, tools=rag_tools, verbose=True)
+@lazy("rag_executor")
+def rag_executor():
+    # web_search and wikipedia_search requested in one turn run side by side
+    return instrument(build_tool_agent(agent_llm(), rag_tools, tool_calling_prompt()), "agent.research")
 
 # === Agent 2: CSV Agent ===
 csv_tools = [
     Tool(
         name="analyze_csv",
-        func=lambda q: analyze_csv(file_path=q.split("||")[0], question=q.split("||")[1]),
+        func=lambda q: analyze_csv.invoke({"file_path": q.split("||")[0], "question": q.split("||")[1]}),
         description="Analyze a CSV file with a question using LLM. Input format: 'file.csv||What is the revenue?'"
     ),
     Tool(name="summarize_text", func=summarize_text, description="Summarize data or analysis result")
 ]
-csv_agent = create_tool_calling_agent(llm, csv_tools, tool_calling_prompt)
-csv_executor = AgentExecutor(agent=csv_agent, tools=csv_tools, verbose=True)
+@lazy("csv_executor")
+def csv_executor():
+    return instrument(build_tool_agent(agent_llm(), csv_tools, tool_calling_prompt()), "agent.csv")
 
 # === Agent 3: Voice Agent ===
 voice_tools = [
@@ -58,24 +91,34 @@ voice_tools = [
     Tool(name="summarize_text", func=summarize_text, description="Summarize transcribed content"),
     Tool(name="text_to_speech", func=text_to_speech, description="Convert text to speech (TTS)")
 ]
-voice_agent = create_tool_calling_agent(llm, voice_tools, tool_calling_prompt)
-voice_executor = AgentExecutor(agent=voice_agent, tools=voice_tools, verbose=True)
+@lazy("voice_executor")
+def voice_executor():
+    return instrument(build_tool_agent(agent_llm(), voice_tools, tool_calling_prompt()), "agent.voice")
 
 # === Agent 4: Calendar Agent ===
 calendar_tools = [
     Tool(
         name="create_event",
-        func=lambda q: create_event(
-            summary="Meeting",
-            description="Scheduled",
-            start_time=q.split("||")[0],
-            end_time=q.split("||")[1]
-        ),
+        func=lambda q: create_event.invoke({
+            "summary": "Meeting",
+            "description": "Scheduled",
+            "start_time": q.split("||")[0],
+            "end_time": q.split("||")[1],
+        }),
         description="Schedule a calendar event. Input format: '2025-07-11T10:00:00||2025-07-11T11:00:00'"
+    ),
+    Tool(
+        name="create_events",
+        func=lambda q: create_events.invoke({"events_json": q}),
+        description=(
+            "Schedule several calendar events in one call. Input: JSON list of objects with "
+            "summary, description, start_time, end_time (ISO 8601)"
+        )
     )
 ]
-calendar_agent = create_tool_calling_agent(llm, calendar_tools, tool_calling_prompt)
-calendar_executor = AgentExecutor(agent=calendar_agent, tools=calendar_tools, verbose=True)
+@lazy("calendar_executor")
+def calendar_executor():
+    return instrument(build_tool_agent(agent_llm(), calendar_tools, tool_calling_prompt()), "agent.calendar")
 
 # --- Fallback agent tools ---
 # --- Improved Fallback Agent: Multi-tool reasoning assistant ---
@@ -84,10 +127,9 @@ calendar_executor = AgentExecutor(agent=calendar_agent, tools=calendar_tools, ve
 # Reuse the same fallback tools list
 from typing import ClassVar
 from langchain_core.tools import Tool
-from langchain.prompts import ChatPromptTemplate
-from langchain.agents import create_tool_calling_agent, AgentExecutor
 from langchain.tools import BaseTool
 from langchain_openai import ChatOpenAI
+from app.executors import run_in_thread
 
 # --- Fallback Tool Wrappers ---
 class AnalyzeCSVTool(BaseTool):
@@ -97,12 +139,12 @@ class AnalyzeCSVTool(BaseTool):
     def _run(self, input: str) -> str:
         try:
             file_path, question = input.split("||")
-            return analyze_csv(file_path=file_path, question=question)
+            return analyze_csv.invoke({"file_path": file_path, "question": question})
         except Exception as e:
             return f"Error: {str(e)}\nExpected input format: 'filename.csv||your question'"
 
     async def _arun(self, input: str) -> str:
-        return self._run(input)
+        return await run_in_thread(self._run, input)
 
 class CreateEventTool(BaseTool):
     name: ClassVar[str] = "create_event"
@@ -111,12 +153,14 @@ class CreateEventTool(BaseTool):
     def _run(self, input: str) -> str:
         try:
             start_time, end_time = input.split("||")
-            return create_event(summary="Meeting", description="Scheduled", start_time=start_time, end_time=end_time)
+            return create_event.invoke({
+                "summary": "Meeting", "description": "Scheduled", "start_time": start_time, "end_time": end_time,
+            })
         except Exception as e:
             return f"Error: {str(e)}\nExpected input format: 'start_time||end_time'"
 
     async def _arun(self, input: str) -> str:
-        return self._run(input)
+        return await run_in_thread(self._run, input)
 
 # --- Final Fallback Tools List ---
 fallback_tools = [
@@ -142,51 +186,107 @@ Respond clearly with the final result.
 
 prompt_template = ChatPromptTemplate.from_messages([
     ("system", fallback_prompt),
+    MessagesPlaceholder("chat_history", optional=True),
     ("human", "{input}"),
     ("placeholder", "{agent_scratchpad}")
 ])
 
 # --- Fallback Agent & Executor ---
-llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+@lazy("fallback_executor")
+def fallback_executor():
+    return instrument(build_tool_agent(agent_llm(), fallback_tools, prompt_template), "agent.fallback")
 
-formatted_fallback_agent = create_tool_calling_agent(
-    llm=llm,
-    tools=fallback_tools,
-    prompt=prompt_template
-)
 
-fallback_executor = AgentExecutor(agent=formatted_fallback_agent, tools=fallback_tools, verbose=True)
+# === Routing ===
+ROUTE_EXECUTORS = {
+    "csv": csv_executor,
+    "voice": voice_executor,
+    "calendar": calendar_executor,
+    "research": rag_executor,
+    "fallback": fallback_executor,
+}
+
+
+def classify_input(state: AgentRouterState) -> AgentRouterState:
+    with stage("routing"):
+        decision = get_semantic_router().classify(state["input"])
+    logger.info(f"Routing input to {decision['route']} ({decision['method']}, confidence {decision['confidence']})")
+    return {"route": decision["route"], "route_confidence": decision["confidence"]}
+
+
+async def aclassify_input(state: AgentRouterState) -> AgentRouterState:
+    # Embedding the query is a blocking HTTP call (or a SQLite cache hit)
+    return await run_in_thread(classify_input, state)
+
+
+def _agent_output(result: dict) -> AgentRouterState:
+    tools_used = [m.name for m in result.get("scratchpad") or [] if isinstance(m, ToolMessage)]
+    return {"result": result["output"], "tools_used": tools_used}
+
 
+def _make_agent_node(executor):
+    # `executor` is a Lazy: the tool agent graph is built on the first request for this route
+    def run(state: AgentRouterState) -> AgentRouterState:
+        try:
+            history = get_session_store().history_messages(state.get("user_id", "default_user"))
+            result = executor().invoke({"input": state["input"], "chat_history": history})
+            return _agent_output(result)
+        except Exception as e:
+            logger.error(f"Routing failed: {e}")
+            return {"result": f"Routing failed: {str(e)}"}
 
+    async def arun(state: AgentRouterState, config: RunnableConfig = None) -> AgentRouterState:
+        try:
+            history = await run_in_thread(get_session_store().history_messages, state.get("user_id", "default_user"))
+            # Forward the config so astream_events callers see the agent's tool and token events
+            result = await executor().ainvoke({"input": state["input"], "chat_history": history}, config=config)
+            return _agent_output(result)
+        except Exception as e:
+            logger.error(f"Routing failed: {e}")
+            return {"result": f"Routing failed: {str(e)}"}
 
+    return RunnableLambda(run, afunc=arun)
 
-# --- Now route_input function that uses fallback_executor ---
-def route_input(state: AgentRouterState) -> AgentRouterState:
-    prompt = state["input"].lower()
-    logger.info(f"Routing input: {prompt}")
+
+def answer_from_documents(state: AgentRouterState) -> AgentRouterState:
     try:
-        if "csv" in prompt:
-            result = csv_executor.invoke({"input": state["input"]})
-        elif "transcribe" in prompt or "audio" in prompt:
-            result = voice_executor.invoke({"input": state["input"]})
-        elif "calendar" in prompt or ("schedule" in prompt and "meeting" in prompt):
-            result = calendar_executor.invoke({"input": state["input"]})
-        elif "pdf" in prompt or "document" in prompt:
-            result = rag_executor.invoke({"input": state["input"]})
-        else:
-            result = fallback_executor.invoke({"input": state["input"]})
-        return {"input": state["input"], "result": result["output"]}
+        user_id = state.get("user_id", "default_user")
+        chain = get_chat_chain(user_id)
+        history = get_session_store().history_text(user_id)
+        return {"result": chain.invoke({"query": state["input"], "chat_history": history})["result"]}
     except Exception as e:
-        logger.error(f"Routing failed: {e}")
-        return {"input": state["input"], "result": f"Routing failed: {str(e)}"}
+        logger.error(f"Document QA failed: {e}")
+        return {"result": f"Routing failed: {str(e)}"}
+
+
+async def aanswer_from_documents(state: AgentRouterState, config: RunnableConfig = None) -> AgentRouterState:
+    try:
+        user_id = state.get("user_id", "default_user")
+        chain = await run_in_thread(get_chat_chain, user_id)
+        history = await run_in_thread(get_session_store().history_text, user_id)
+        result = await chain.ainvoke({"query": state["input"], "chat_history": history}, config=config)
+        return {"result": result["result"]}
+    except Exception as e:
+        logger.error(f"Document QA failed: {e}")
+        return {"result": f"Routing failed: {str(e)}"}
+
+
+def select_route(state: AgentRouterState) -> str:
+    return state.get("route", "fallback")
 
 
 # === LangGraph Builder ===
 def build_advanced_router():
     graph = StateGraph(AgentRouterState)
-    graph.add_node("AgentRouter", route_input)
-    graph.set_entry_point("AgentRouter")
-    graph.set_finish_point("AgentRouter")
+    # Sync callers get the plain functions, ainvoke/astream callers the async variants
+    graph.add_node("classify", RunnableLambda(classify_input, afunc=aclassify_input))
+    graph.add_node("documents", RunnableLambda(answer_from_documents, afunc=aanswer_from_documents))
+    for route, executor in ROUTE_EXECUTORS.items():
+        graph.add_node(route, _make_agent_node(executor))
+
+    graph.set_entry_point("classify")
+    routes = ["documents", *ROUTE_EXECUTORS]
+    graph.add_conditional_edges("classify", select_route, {route: route for route in routes})
+    for route in routes:
+        graph.set_finish_point(route)
     return graph.compile()
-
-
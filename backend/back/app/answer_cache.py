@@ -0,0 +1,161 @@
+import os
+import re
+import math
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.cache import LRUCache, AsyncSingleFlight
+from app.executors import run_in_thread
+from app.metrics import record_cache
+from app.rag_logic import get_collection_version, get_embeddings, on_collection_change
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "600"))
+# Near-duplicate lookup ("what is this pdf about" ~ "summarize the document") costs one query embedding.
+# Opt-in: at this threshold ada-002 still merges paraphrases with different entities
+# ("email alice" ~ "email bob", "capital of France" ~ "capital of Germany").
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "0") == "1"
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_VECTORS_PER_USER = int(os.getenv("ANSWER_CACHE_VECTORS_PER_USER", "256"))
+# Routes whose answers are safe to replay. Every agent route holds side-effecting tools
+# (research/fallback: send_email; fallback also create_event and text_to_speech), and a
+# replayed "email sent" answer sends nothing, so only document QA is cached by default.
+ANSWER_CACHE_ROUTES = set(os.getenv("ANSWER_CACHE_ROUTES", "documents").split(","))
+# Routes that may be answered by a similar (not identical) question
+ANSWER_CACHE_SEMANTIC_ROUTES = set(os.getenv("ANSWER_CACHE_SEMANTIC_ROUTES", "documents").split(","))
+# Answers from a turn that ran any of these are never stored, whatever the route
+SIDE_EFFECT_TOOLS = set(os.getenv("SIDE_EFFECT_TOOLS", "send_email,create_event,create_events,text_to_speech").split(","))
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", question.lower())).strip()
+
+
+def _normalize_vector(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class AnswerCache:
+    """Per-user answer cache keyed by normalized question + collection version, with singleflight."""
+
+    def __init__(self):
+        self._answers = LRUCache("answers", max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL)
+        # user_id -> [(version, unit vector, normalized question)], newest last
+        self._vectors: Dict[str, List[Tuple[int, List[float], str]]] = {}
+        self._vectors_lock = threading.Lock()
+        self._flight = AsyncSingleFlight()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def _key(self, user_id: str, normalized: str, version: int):
+        return (user_id, version, normalized)
+
+    def lookup(self, user_id: str, question: str) -> Optional[dict]:
+        """Blocking (may embed the question); call from a worker thread.
+
+        Only for questions that stand on their own: follow-ups bypass the cache.
+        """
+        version = get_collection_version(user_id)
+        normalized = normalize_question(question)
+        entry = self._answers.get(self._key(user_id, normalized, version))
+        if entry is not None:
+            self.exact_hits += 1
+            record_cache("answers", "exact")
+            return {**entry, "cache": "exact"}
+
+        if ANSWER_CACHE_SEMANTIC:
+            match = self._semantic_match(user_id, question, version)
+            if match is not None:
+                entry = self._answers.get(self._key(user_id, match, version))
+                if entry is not None and entry.get("route") in ANSWER_CACHE_SEMANTIC_ROUTES:
+                    self.semantic_hits += 1
+                    record_cache("answers", "semantic")
+                    return {**entry, "cache": "semantic"}
+        self.misses += 1
+        record_cache("answers", "miss")
+        return None
+
+    def _semantic_match(self, user_id: str, question: str, version: int) -> Optional[str]:
+        with self._vectors_lock:
+            candidates = [(v, q) for ver, v, q in self._vectors.get(user_id, []) if ver == version]
+        if not candidates:
+            return None
+        try:
+            query = _normalize_vector(get_embeddings().embed_query(question))
+        except Exception as e:
+            logger.warning(f"Answer cache similarity lookup skipped: {e}")
+            return None
+        best_score, best_question = max(
+            ((sum(a * b for a, b in zip(query, vector)), q) for vector, q in candidates),
+            key=lambda item: item[0],
+        )
+        return best_question if best_score >= ANSWER_CACHE_SIMILARITY else None
+
+    def store(self, user_id: str, question: str, result: dict, version: Optional[int] = None):
+        """`result` is {"answer", "route", "tools"}; "tools" names the tools the turn ran."""
+        if result.get("route") not in ANSWER_CACHE_ROUTES:
+            return
+        side_effects = SIDE_EFFECT_TOOLS.intersection(result.get("tools") or ())
+        if side_effects:
+            logger.info(f"Not caching an answer that ran {', '.join(sorted(side_effects))}")
+            return
+        version = get_collection_version(user_id) if version is None else version
+        normalized = normalize_question(question)
+        self._answers.set(self._key(user_id, normalized, version), result)
+        if ANSWER_CACHE_SEMANTIC and result.get("route") in ANSWER_CACHE_SEMANTIC_ROUTES:
+            try:
+                # Usually a SQLite hit: the semantic router already embedded this question
+                vector = _normalize_vector(get_embeddings().embed_query(question))
+            except Exception as e:
+                logger.warning(f"Answer cache could not embed question: {e}")
+                return
+            with self._vectors_lock:
+                entries = self._vectors.setdefault(user_id, [])
+                entries.append((version, vector, normalized))
+                del entries[:-ANSWER_CACHE_VECTORS_PER_USER]
+
+    async def get_or_compute(self, user_id: str, question: str, compute: Callable[[], Awaitable[dict]]) -> dict:
+        """Return a cached answer, join an identical in-flight request, or run compute() once."""
+        cached = await run_in_thread(self.lookup, user_id, question)
+        if cached is not None:
+            return cached
+
+        version = get_collection_version(user_id)
+        key = self._key(user_id, normalize_question(question), version)
+
+        async def run():
+            result = await compute()
+            # Keyed to the version the answer was computed against, not whatever is current now
+            await run_in_thread(self.store, user_id, question, result, version)
+            return result
+
+        return await self._flight.do(key, run)
+
+    def invalidate_user(self, user_id: str, version: Optional[int] = None) -> int:
+        removed = self._answers.invalidate(lambda key: key[0] == user_id)
+        with self._vectors_lock:
+            self._vectors.pop(user_id, None)
+        return removed
+
+    def stats(self) -> dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            **self._answers.stats(),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "coalesced": self._flight.coalesced,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+answer_cache = AnswerCache()
+# New or deleted documents change what the right answer is
+on_collection_change(answer_cache.invalidate_user)
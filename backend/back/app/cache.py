@@ -0,0 +1,228 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """Thread-safe LRU cache with idle-TTL expiry and optional entry-count / byte caps.
+
+    `ttl` is an idle timeout: every hit refreshes the entry. `sizeof` estimates an
+    entry's footprint in bytes and is only consulted when `max_bytes` is set.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = 128,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, list]" = OrderedDict()  # key -> [value, last_access, size]
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._flight = SingleFlight()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _count=False) is not None
+
+    def get(self, key: Hashable, default=None, _count: bool = True):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                if _count:
+                    self.misses += 1
+                return default
+            entry[1] = time.monotonic()
+            self._data.move_to_end(key)
+            if _count:
+                self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any):
+        size = self.sizeof(value) if self.max_bytes else 0
+        with self._lock:
+            if key in self._data:
+                self._remove(key, evicted=False)
+            self._data[key] = [value, time.monotonic(), size]
+            self._bytes += size
+            self._enforce_limits()
+
+    def get_or_create(self, key: Hashable, factory: Callable[[], Any]):
+        value = self.get(key)
+        if value is not None:
+            return value
+        # Concurrent misses on one key share a single build without stalling other keys; the
+        # flight stays registered until the value is in the cache
+        return self._flight.do(key, lambda: self._create(key, factory))
+
+    def _create(self, key: Hashable, factory: Callable[[], Any]):
+        # A caller that missed just before the previous build landed finds its result here
+        value = self.get(key, _count=False)
+        if value is None:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def pop(self, key: Hashable, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._remove(key, evicted=False)
+            return entry[0]
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                self._remove(key, evicted=False)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            keys = [key for key, entry in self._data.items() if self._expired(entry)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+    # --- Internals (caller holds the lock) ---
+    def _expired(self, entry) -> bool:
+        return self.ttl is not None and time.monotonic() - entry[1] > self.ttl
+
+    def _remove(self, key, evicted: bool = True):
+        value, _, size = self._data.pop(key)
+        self._bytes -= size
+        if evicted:
+            self.evictions += 1
+        if self.on_evict:
+            try:
+                self.on_evict(key, value)
+            except Exception as e:
+                logger.warning(f"[{self.name}] on_evict failed for {key}: {e}")
+
+    def _enforce_limits(self):
+        self.purge_expired()
+        while len(self._data) > self.max_entries:
+            self._remove(next(iter(self._data)))
+        if self.max_bytes:
+            # Never evict the entry that was just inserted
+            while self._bytes > self.max_bytes and len(self._data) > 1:
+                self._remove(next(iter(self._data)))
+
+
+class AsyncSingleFlight:
+    """Coalesce concurrent async calls with the same key into one in-flight computation.
+
+    The computation runs as a task no caller owns: a cancelled caller (e.g. a disconnected
+    client) only stops waiting, and the others still get the result or its real exception.
+    The task itself is cancelled once nobody is waiting for it.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, list] = {}  # key -> [task, waiters]
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]):
+        flight = self._inflight.get(key)
+        if flight is None:
+            flight = self._inflight[key] = [asyncio.ensure_future(fn()), 0]
+            flight[0].add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            self.coalesced += 1
+        flight[1] += 1
+        try:
+            # shield: a waiter's cancellation must not reach the shared task
+            return await asyncio.shield(flight[0])
+        finally:
+            flight[1] -= 1
+            if flight[1] == 0 and not flight[0].done():
+                # Forget it now, so a caller arriving while it winds down starts afresh
+                self._forget(key, flight)
+                flight[0].cancel()
+
+    def _forget(self, key: Hashable, flight: list):
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Thread-based AsyncSingleFlight: concurrent calls with the same key share one execution."""
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]):
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import base64
+import uuid
+import random
+import hashlib
+import logging
+import datetime
+from typing import Dict, List, Optional
+
+from googleapiclient.errors import HttpError
+
+from app.google_clients import get_calendar_service, is_retryable_403
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+CALENDAR_TIMEZONE = os.getenv("CALENDAR_TIMEZONE", "Asia/Kathmandu")
+# Google caps Calendar batch requests at 50 calls
+CALENDAR_BATCH_SIZE = min(int(os.getenv("CALENDAR_BATCH_SIZE", "50")), 50)
+CALENDAR_BATCH_RETRIES = int(os.getenv("CALENDAR_BATCH_RETRIES", "3"))
+CALENDAR_RETRY_BASE_SECONDS = float(os.getenv("CALENDAR_RETRY_BASE_SECONDS", "1"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+# --- Normalization ---
+def _normalize_time(value: str, field: str) -> str:
+    value = (value or "").strip()
+    # "2025-07-11T10:00" -> "2025-07-11T10:00:00"
+    if len(value) == 16:
+        value += ":00"
+    try:
+        datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{field} is not an ISO 8601 datetime: {value!r}")
+    return value
+
+
+def normalize_event(summary: str, description: str, start_time: str, end_time: str,
+                    time_zone: Optional[str] = None) -> dict:
+    """Build a Calendar API event body, raising ValueError for anything the API would reject."""
+    start_time = _normalize_time(start_time, "start_time")
+    end_time = _normalize_time(end_time, "end_time")
+    start = datetime.datetime.fromisoformat(start_time.replace("Z", "+00:00"))
+    end = datetime.datetime.fromisoformat(end_time.replace("Z", "+00:00"))
+    if (start.tzinfo is None) == (end.tzinfo is None) and end <= start:
+        raise ValueError("end_time must be after start_time")
+    time_zone = time_zone or CALENDAR_TIMEZONE
+    return {
+        'summary': summary or "Meeting",
+        'description': description or "",
+        'start': {'dateTime': start_time, 'timeZone': time_zone},
+        'end': {'dateTime': end_time, 'timeZone': time_zone},
+    }
+
+
+def event_id(request_key: str, index: int, body: dict) -> str:
+    """Event id that is stable across retries of one request and unique to that request.
+
+    Google keeps the ids of deleted events reserved, so an id derived from the event alone
+    would answer 409 for a re-created event. Calendar ids are base32hex (0-9, a-v), 5-1024 characters.
+    """
+    key = "\x00".join([request_key, str(index), json.dumps(body, sort_keys=True)])
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return base64.b32hexencode(digest).decode("ascii").rstrip("=").lower()
+
+
+# --- Batch insert ---
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        if error.resp.status == 403:
+            return is_retryable_403(error)
+        return error.resp.status in RETRYABLE_STATUSES
+    return True  # transport errors: connection reset, timeout
+
+
+def _already_exists(error: Exception) -> bool:
+    # The id is taken: an earlier attempt of this request got through but its response was lost
+    return isinstance(error, HttpError) and error.resp.status == 409
+
+
+def _existing_event(service, calendar_id: str, body: dict) -> dict:
+    """Result for a 409: created only if the event under our id is really there and live."""
+    try:
+        event = service.events().get(calendarId=calendar_id, eventId=body["id"]).execute()
+    except Exception as e:
+        return {"status": "failed", "error": f"Event id {body['id']} is taken but could not be read: {e}"}
+    if event.get("status") == "cancelled":
+        return {"status": "failed", "error": f"Event id {body['id']} belongs to a deleted event"}
+    return {"status": "created", "event_id": body["id"], "html_link": event.get("htmlLink"), "existing": True}
+
+
+def _send_batch(service, bodies: Dict[int, dict], calendar_id: str) -> Dict[int, object]:
+    """Send one batch; returns index -> created event dict or the exception for that call."""
+    outcomes: Dict[int, object] = {}
+
+    def callback(request_id, response, exception):
+        outcomes[int(request_id)] = exception if exception is not None else response
+
+    batch = service.new_batch_http_request(callback=callback)
+    for index, body in bodies.items():
+        batch.add(service.events().insert(calendarId=calendar_id, body=body), request_id=str(index))
+    try:
+        batch.execute()
+    except Exception as e:
+        # The whole batch failed in transit; every call without a response is retried. Google may
+        # have created some of them already: their ids make the retry answer 409 instead of duplicating
+        for index in bodies:
+            outcomes.setdefault(index, e)
+    for index in bodies:
+        outcomes.setdefault(index, RuntimeError("No response for this call in the batch"))
+    return outcomes
+
+
+def insert_events(events: List[dict], calendar_id: str = 'primary', request_key: Optional[str] = None) -> dict:
+    """Insert many events with batched requests; only failed calls are retried, with backoff.
+
+    Each event is a dict with summary, description, start_time, end_time and optional time_zone.
+    Event ids derive from request_key (random unless the caller passes one, e.g. to make its own
+    retries idempotent), so a retried call can't create a second copy. An event already stored
+    under its id is reported as created with "existing": True once a read confirms it is live.
+    """
+    request_key = request_key or uuid.uuid4().hex
+    results: List[dict] = [{"index": i, "status": "pending"} for i in range(len(events))]
+    pending: Dict[int, dict] = {}
+    for i, event in enumerate(events):
+        try:
+            pending[i] = normalize_event(
+                event.get("summary") or event.get("title", ""),
+                event.get("description", ""),
+                event.get("start_time", ""),
+                event.get("end_time", ""),
+                event.get("time_zone"),
+            )
+        except (ValueError, AttributeError) as e:
+            results[i].update(status="invalid", error=str(e))
+            continue
+        pending[i]["id"] = event_id(request_key, i, pending[i])
+
+    service = get_calendar_service() if pending else None
+    attempt = 0
+    while pending:
+        retry: Dict[int, dict] = {}
+        indexes = list(pending)
+        for offset in range(0, len(indexes), CALENDAR_BATCH_SIZE):
+            chunk = {i: pending[i] for i in indexes[offset:offset + CALENDAR_BATCH_SIZE]}
+            for index, outcome in _send_batch(service, chunk, calendar_id).items():
+                if _already_exists(outcome):
+                    results[index].update(_existing_event(service, calendar_id, chunk[index]))
+                elif isinstance(outcome, Exception):
+                    if _is_retryable(outcome) and attempt < CALENDAR_BATCH_RETRIES:
+                        retry[index] = chunk[index]
+                    else:
+                        results[index].update(status="failed", error=str(outcome))
+                else:
+                    results[index].update(status="created", event_id=outcome.get("id"),
+                                          html_link=outcome.get("htmlLink"))
+        pending = retry
+        if pending:
+            delay = CALENDAR_RETRY_BASE_SECONDS * (2 ** attempt) * (1 + random.random())
+            attempt += 1
+            logger.warning(f"Retrying {len(pending)} calendar inserts in {delay:.1f}s (attempt {attempt})")
+            time.sleep(delay)
+
+    created = sum(1 for r in results if r["status"] == "created")
+    logger.info(f"Bulk calendar insert: {created}/{len(events)} created after {attempt + 1} round(s)")
+    return {
+        "created": created,
+        "failed": len(events) - created,
+        "attempts": attempt + 1,
+        "results": results,
+    }
@@ -1,19 +1,39 @@
-from langchain.memory import ConversationBufferMemory
+import os
+import re
+import logging
+from typing import Any, Dict, List, Optional, Tuple
 from langchain.prompts import PromptTemplate
 from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import Chroma
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun, CallbackManagerForChainRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
 from langchain_openai import ChatOpenAI
-from app.rag_logic import get_vectorstore
-from app.advanced_agent import build_advanced_router  # Final advanced agent import
+from app.cache import LRUCache
+from app.rag_logic import get_vectorstore, get_collection_version, ensure_lexical_index
+from app.document_registry import chunk_id
+from app.lexical_index import query_terms
+from app.tokens import count_tokens
+from app.metrics import instrument
+from app.lazy import lazy
 
-def get_chat_chain(user_id: str):
-    vectordb = get_vectorstore(user_id)
-    retriever = vectordb.as_retriever()
+logger = logging.getLogger(__name__)
+
+# --- Per-user chain cache ---
+CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", "256"))
+CHAIN_CACHE_TTL = float(os.getenv("CHAIN_CACHE_TTL", "1800"))
 
-    system_template = """
+# user_id -> (collection_version, chain)
+_chain_cache = LRUCache("chat_chains", max_entries=CHAIN_CACHE_SIZE, ttl=CHAIN_CACHE_TTL)
+
+system_template = """
     You are a helpful assistant for answering questions about uploaded documents.
     Always answer based on the retrieved context.
     If unsure or unrelated, say 'I don't know based on the document.'
+    Use the conversation so far to resolve follow-up questions.
+    Conversation so far:
+    ---------
+    {chat_history}
+    ---------
     Context:
     ---------
     {context}
@@ -21,24 +41,207 @@ def get_chat_chain(user_id: str):
     Question: {question}
     """
 
-    prompt = PromptTemplate(
-        template=system_template,
-        input_variables=["context", "question"]
-    )
+prompt = PromptTemplate(
+    template=system_template,
+    input_variables=["context", "question", "chat_history"]
+)
+
+@lazy("qa_llm")
+def qa_llm():
+    return ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
+
+# --- Context assembly ---
+# Candidates pulled from the vector store before MMR picks a diverse subset
+CONTEXT_FETCH_K = int(os.getenv("CONTEXT_FETCH_K", "20"))
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", "6"))
+# 1.0 = pure relevance, 0.0 = pure diversity
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Word-trigram Jaccard overlap above which a chunk counts as a near-duplicate
+CONTEXT_DEDUP_SIMILARITY = float(os.getenv("CONTEXT_DEDUP_SIMILARITY", "0.8"))
+# "hybrid" (BM25 + vectors, fused), "vector" or "lexical"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Hybrid skips the query embedding when the best BM25 hit contains every query term
+# and outscores the runner-up by this factor
+HYBRID_DECISIVE_RATIO = float(os.getenv("HYBRID_DECISIVE_RATIO", "2.0"))
+RRF_K = 60
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def drop_near_duplicates(docs: List[Document], threshold: float = CONTEXT_DEDUP_SIMILARITY) -> List[Document]:
+    """Keep the first of any group of chunks whose trigram overlap exceeds threshold."""
+    kept, kept_shingles = [], []
+    for doc in docs:
+        shingles = _shingles(doc.page_content)
+        if any(len(shingles & other) / (len(shingles | other) or 1) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def pack_to_budget(docs: List[Document], budget: int = CONTEXT_TOKEN_BUDGET,
+                   max_chunks: int = CONTEXT_MAX_CHUNKS) -> List[Document]:
+    """Take chunks in rank order while they fit; a chunk too big to fit is skipped, not truncated."""
+    packed, used = [], 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content)
+        if used + tokens > budget:
+            continue
+        packed.append(doc)
+        used += tokens
+        if len(packed) >= max_chunks:
+            break
+    return packed
+
+
+def _doc_key(doc: Document) -> str:
+    # Chroma returns the stored id; older clients don't, but chunk ids are derived from content
+    return getattr(doc, "id", None) or chunk_id(doc.metadata.get("source", ""), doc.metadata.get("page", ""),
+                                                doc.page_content)
+
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[str, Document]]], k: int = RRF_K) -> List[Document]:
+    scores: Dict[str, float] = {}
+    docs: Dict[str, Document] = {}
+    for ranking in rankings:
+        for rank, (key, doc) in enumerate(ranking):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
 
-    llm = ChatOpenAI(model="gpt-3.5-turbo", temperature=0)
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+def lexical_is_decisive(query: str, hits: List[Tuple[str, float, Document]],
+                        ratio: float = HYBRID_DECISIVE_RATIO) -> bool:
+    if not hits or hits[0][1] <= 0:
+        return False
+    content = hits[0][2].page_content.lower()
+    if not all(term in content for term in query_terms(query)):
+        return False
+    return len(hits) == 1 or hits[0][1] >= ratio * max(hits[1][1], 1e-9)
 
-    chain = RetrievalQA.from_chain_type(
-        llm=llm,
+
+class BudgetedRetriever(BaseRetriever):
+    """Hybrid BM25 + MMR retrieval, then near-duplicate removal, then packing to a token budget."""
+
+    vectorstore: Any
+    user_id: Optional[str] = None
+    mode: str = RETRIEVAL_MODE
+    fetch_k: int = CONTEXT_FETCH_K
+    max_chunks: int = CONTEXT_MAX_CHUNKS
+    lambda_mult: float = CONTEXT_MMR_LAMBDA
+    token_budget: int = CONTEXT_TOKEN_BUDGET
+    dedup_similarity: float = CONTEXT_DEDUP_SIMILARITY
+
+    def _vector_candidates(self, query: str) -> List[Document]:
+        # Ask MMR for more than we keep: dedup and packing still need room to choose
+        return self.vectorstore.max_marginal_relevance_search(
+            query, k=min(self.fetch_k, self.max_chunks * 2), fetch_k=self.fetch_k, lambda_mult=self.lambda_mult
+        )
+
+    def _candidates(self, query: str) -> Tuple[str, List[Document]]:
+        if self.mode == "vector" or self.user_id is None:
+            return "vector", self._vector_candidates(query)
+        hits = ensure_lexical_index(self.user_id).search(query, k=self.fetch_k)
+        lexical = [doc for _, _, doc in hits]
+        if self.mode == "lexical" or lexical_is_decisive(query, hits):
+            # No query embedding needed: exact identifiers and names are BM25's strength
+            return "lexical", lexical
+        vector = self._vector_candidates(query)
+        if not hits:
+            return "vector", vector
+        fused = reciprocal_rank_fusion([
+            [(key, doc) for key, _, doc in hits],
+            [(_doc_key(doc), doc) for doc in vector],
+        ])
+        return "hybrid", fused
+
+    def _get_relevant_documents(self, query: str, *, run_manager=None) -> List[Document]:
+        mode, candidates = self._candidates(query)
+        unique = drop_near_duplicates(candidates, self.dedup_similarity)
+        packed = pack_to_budget(unique, self.token_budget, self.max_chunks)
+        candidate_tokens = sum(count_tokens(doc.page_content) for doc in candidates)
+        packed_tokens = sum(count_tokens(doc.page_content) for doc in packed)
+        logger.info(
+            f"Context ({mode}): {len(packed)}/{len(candidates)} chunks ({len(candidates) - len(unique)} near-duplicates), "
+            f"{packed_tokens} tokens, saved {candidate_tokens - packed_tokens} of {candidate_tokens}"
+        )
+        return packed
+
+
+class HistoryRetrievalQA(RetrievalQA):
+    """RetrievalQA that also passes an optional `chat_history` string through to the prompt.
+
+    Retrieval still uses only the question, so history doesn't dilute the search.
+    """
+
+    def _call(self, inputs: Dict[str, Any],
+              run_manager: Optional[CallbackManagerForChainRun] = None) -> Dict[str, Any]:
+        _run_manager = run_manager or CallbackManagerForChainRun.get_noop_manager()
+        question = inputs[self.input_key]
+        docs = self._get_docs(question, run_manager=_run_manager)
+        answer = self.combine_documents_chain.run(
+            input_documents=docs, question=question,
+            chat_history=inputs.get("chat_history") or "(none)",
+            callbacks=_run_manager.get_child(),
+        )
+        if self.return_source_documents:
+            return {self.output_key: answer, "source_documents": docs}
+        return {self.output_key: answer}
+
+    async def _acall(self, inputs: Dict[str, Any],
+                     run_manager: Optional[AsyncCallbackManagerForChainRun] = None) -> Dict[str, Any]:
+        _run_manager = run_manager or AsyncCallbackManagerForChainRun.get_noop_manager()
+        question = inputs[self.input_key]
+        docs = await self._aget_docs(question, run_manager=_run_manager)
+        answer = await self.combine_documents_chain.arun(
+            input_documents=docs, question=question,
+            chat_history=inputs.get("chat_history") or "(none)",
+            callbacks=_run_manager.get_child(),
+        )
+        if self.return_source_documents:
+            return {self.output_key: answer, "source_documents": docs}
+        return {self.output_key: answer}
+
+
+def _build_chat_chain(user_id: str):
+    vectordb = get_vectorstore(user_id)
+    retriever = BudgetedRetriever(vectorstore=vectordb, user_id=user_id)
+
+    chain = HistoryRetrievalQA.from_chain_type(
+        llm=qa_llm(),
         chain_type="stuff",  # or 'map_reduce' if needed
         retriever=retriever,
         return_source_documents=False,
         chain_type_kwargs={"prompt": prompt},
-        memory=memory  # optional, if you want to use memory
     )
 
+    # Times the whole QA call and, through inherited callbacks, its retriever and LLM runs
+    return instrument(chain, "documents_qa")
+
+def get_chat_chain(user_id: str):
+    version = get_collection_version(user_id)
+    cached = _chain_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    chain = _build_chat_chain(user_id)
+    _chain_cache.set(user_id, (version, chain))
     return chain
 
+def invalidate_chat_chain(user_id: str):
+    _chain_cache.pop(user_id)
+
+def get_chain_cache_stats() -> dict:
+    return _chain_cache.stats()
+
 def get_langgraph_agent():
+    # Imported here: advanced_agent imports this module for its document route
+    from app.advanced_agent import build_advanced_router
     return build_advanced_router()
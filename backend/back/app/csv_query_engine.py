@@ -0,0 +1,375 @@
+import re
+import time
+import difflib
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# --- Intent vocabulary ---
+# Order matters: "how many" must win over "max" in "how many max values..."
+AGGREGATIONS: List[Tuple[Tuple[str, ...], str]] = [
+    (("how many", "number of", "count"), "count"),
+    (("average", "mean", "avg"), "mean"),
+    (("median",), "median"),
+    (("total", "sum"), "sum"),
+    (("maximum", "max", "highest", "largest", "biggest", "most expensive"), "max"),
+    (("minimum", "min", "lowest", "smallest", "cheapest"), "min"),
+]
+
+COMPARATORS = {
+    "=": "==", "==": "==", "is": "==", "equals": "==", "equal to": "==",
+    "!=": "!=", "is not": "!=",
+    ">": ">", "above": ">", "over": ">", "greater than": ">", "more than": ">",
+    "<": "<", "below": "<", "under": "<", "less than": "<",
+    ">=": ">=", "at least": ">=",
+    "<=": "<=", "at most": "<=",
+}
+
+# Anything that needs reasoning, charts or modelling goes to the LLM agent
+AGENT_ONLY_WORDS = (
+    "why", "plot", "chart", "graph", "correlat", "trend", "predict", "forecast", "explain",
+    "compare", "relationship", "distribution", "outlier", "regression", "insight", "summar",
+)
+
+# Questions the planner can't represent: the agent answers them rather than a pandas guess
+NEGATION_PATTERN = re.compile(
+    r"\b(?:not|no|none|never|without|excluding|exclude|excludes|except|besides|other than|apart from|aside from|"
+    r"isn t|aren t|doesn t|don t|didn t|wasn t|weren t)\b"
+)
+# "which product ...", "who ...", "what region ..." ask for an entity, not an aggregate
+ENTITY_PATTERN = re.compile(r"\b(?:which|who|whom|whose)\b|\bwhat\s+(?!(?:is|s|are|was|were|the|a|an)\b)\w+")
+# Words that can be left over once a plan has consumed its columns, values and operators
+FILLER_WORDS = {
+    "the", "a", "an", "of", "in", "for", "on", "at", "from", "to", "and", "by", "per", "across", "group", "grouped",
+    "what", "s", "is", "are", "was", "were", "do", "does", "did", "there", "how", "much", "many",
+    "me", "show", "give", "tell", "find", "get", "calculate", "compute", "return", "please", "can", "could",
+    "you", "i", "we", "all", "each", "every", "overall", "value", "values", "rows", "row", "records", "record",
+    "entries", "data", "dataset", "table", "csv", "file", "distinct", "unique", "different",
+}
+GROUP_PATTERN = r"\b(?:by|per|for each|for every|across|grouped by|group by)\s+(.+)$"
+FILTER_CUES = r"where|with|when|if|have|has|having|and"
+
+MAX_RESULT_ROWS = 50
+OPERATION_LABELS = {"mean": "average", "sum": "total", "nunique": "number of distinct", "count": "count"}
+MAX_IMPLICIT_FILTER_VALUES = 1000
+
+
+@dataclass
+class QueryPlan:
+    operation: str
+    metric: Optional[str] = None
+    group_by: Optional[str] = None
+    filters: List[Tuple[str, str, object]] = field(default_factory=list)
+    top_n: Optional[int] = None
+    ascending: bool = False
+
+    def describe(self) -> str:
+        parts = [self.operation]
+        if self.metric:
+            parts.append(f"of {self.metric}")
+        if self.group_by:
+            parts.append(f"by {self.group_by}")
+        if self.top_n:
+            parts.append(f"({'bottom' if self.ascending else 'top'} {self.top_n})")
+        if self.filters:
+            parts.append("where " + " and ".join(f"{c} {op} {v!r}" for c, op, v in self.filters))
+        return " ".join(parts)
+
+
+# --- Parsing helpers ---
+def _normalize(text: str) -> str:
+    text = text.lower().replace("_", " ").replace("-", " ")
+    return re.sub(r"[^a-z0-9<>=!.\s]", " ", re.sub(r"\s+", " ", text)).strip()
+
+
+def _column_aliases(column: str) -> List[str]:
+    name = _normalize(str(column))
+    aliases = {name}
+    if name.endswith("s"):
+        aliases.add(name[:-1])
+    else:
+        aliases.add(name + "s")
+        aliases.add(name + "es")
+    return sorted(aliases, key=len, reverse=True)
+
+
+def match_column(phrase: str, columns: List[str]) -> Optional[str]:
+    """Best column for a phrase: exact alias at the start of the phrase, then fuzzy match."""
+    phrase = _normalize(phrase)
+    best = None
+    for column in columns:
+        for alias in _column_aliases(column):
+            if phrase == alias or phrase.startswith(alias + " "):
+                if best is None or len(alias) > len(best[1]):
+                    best = (column, alias)
+    if best:
+        return best[0]
+    normalized = {_normalize(str(c)): c for c in columns}
+    words = phrase.split()
+    for size in range(min(3, len(words)), 0, -1):
+        candidate = " ".join(words[:size])
+        close = difflib.get_close_matches(candidate, list(normalized), n=1, cutoff=0.85)
+        if close:
+            return normalized[close[0]]
+    return None
+
+
+def mentioned_columns(question: str, columns: List[str]) -> List[str]:
+    q = f" {_normalize(question)} "
+    return [c for c in columns if any(f" {alias} " in q for alias in _column_aliases(c))]
+
+
+def _coerce_value(value: str, series: pd.Series):
+    value = value.strip().strip("'\"")
+    if pd.api.types.is_numeric_dtype(series):
+        try:
+            return float(value.replace(",", ""))
+        except ValueError:
+            return None
+    if pd.api.types.is_datetime64_any_dtype(series):
+        parsed = pd.to_datetime(value, errors="coerce")
+        return None if pd.isna(parsed) else parsed
+    # Case-insensitive lookup of the stored spelling; a value the column doesn't hold is not a filter we can trust
+    for candidate in series.dropna().unique()[:MAX_IMPLICIT_FILTER_VALUES]:
+        if _normalize(str(candidate)) == _normalize(value):
+            return candidate
+    return None
+
+
+def _explicit_filters(q: str, df: pd.DataFrame) -> Optional[Tuple[List[Tuple[str, str, object]], List[str]]]:
+    """'where price over 2', 'rows have price at least 3': the filters and the text each one consumed.
+
+    None when a filter's value can't be represented ("europe or asia", a value the column
+    doesn't contain): the plan holds single-value comparisons only.
+    """
+    filters, spans = [], []
+    comparators = "|".join(sorted((re.escape(k) for k in COMPARATORS), key=len, reverse=True))
+    pattern = (rf"\b(?:{FILTER_CUES})\s+(?:the\s+)?(.+?)\s*(?:is\s+)?({comparators})\s*"
+               rf"(.+?)(?=\s+(?:and|by|per|group)\b|$)")
+    for match in re.finditer(pattern, q):
+        column_phrase, comparator, raw_value = match.groups()
+        column = match_column(column_phrase, list(df.columns))
+        if column is None:
+            continue
+        op = COMPARATORS[comparator]
+        series = df[column]
+        ordered = pd.api.types.is_numeric_dtype(series) or pd.api.types.is_datetime64_any_dtype(series)
+        if op not in ("==", "!=") and not ordered:
+            continue
+        if re.search(r"\b(?:or|and|nor)\b|,", raw_value):
+            return None
+        value = _coerce_value(raw_value, series)
+        if value is None:
+            return None
+        filters.append((column, op, value))
+        spans.append(match.group(0))
+    return filters, spans
+
+
+def _is_text(series: pd.Series) -> bool:
+    # pandas >= 3 stores strings as StringDtype ("str"), not object
+    return (pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series)
+            or isinstance(series.dtype, pd.CategoricalDtype))
+
+
+def _aggregation_words() -> List[str]:
+    return [word for words, _ in AGGREGATIONS for word in words]
+
+
+def _implicit_filters(q: str, df: pd.DataFrame, exclude: List[str]) -> List[Tuple[str, str, object]]:
+    """'revenue in Europe' -> region == 'Europe' when 'europe' is a value of a low-cardinality column."""
+    filters = []
+    padded = f" {q} "
+    for column in df.columns:
+        if column in exclude:
+            continue
+        series = df[column]
+        if not _is_text(series):
+            continue
+        values = series.dropna().unique()
+        if len(values) > MAX_IMPLICIT_FILTER_VALUES:
+            continue
+        for value in values:
+            text = _normalize(str(value))
+            if len(text) < 2 or text in FILLER_WORDS or text in _aggregation_words():
+                continue
+            if f" {text} " in padded and not match_column(text, list(df.columns)):
+                filters.append((column, "==", value))
+                break
+    return filters
+
+
+def _unconsumed_words(q: str, plan: QueryPlan, spans: List[str]) -> List[str]:
+    """Words of the question the plan doesn't account for (beyond filler)."""
+    rest = f" {q} "
+    phrases = list(spans)
+    phrases += _aggregation_words()
+    for column in filter(None, [plan.metric, plan.group_by] + [c for c, _, _ in plan.filters]):
+        phrases += _column_aliases(column)
+    phrases += [_normalize(str(value)) for _, op, value in plan.filters if op == "=="]
+    for phrase in sorted(set(filter(None, phrases)), key=len, reverse=True):
+        rest = re.sub(rf"(?<=\s){re.escape(phrase)}(?=\s)", " ", rest)
+    return [word for word in rest.split() if word not in FILLER_WORDS]
+
+
+def _accept(q: str, plan: QueryPlan, spans: List[str]) -> Optional[QueryPlan]:
+    leftover = _unconsumed_words(q, plan, spans)
+    if leftover:
+        logger.info(f"CSV fast path declined: unparsed words {leftover}")
+        return None
+    return plan
+
+
+def parse_question(question: str, df: pd.DataFrame) -> Optional[QueryPlan]:
+    """A QueryPlan that accounts for every content word of the question, or None.
+
+    Declining is always safe (the agent answers instead); answering a question with part of
+    it ignored -- a negation, a year, an unparsed condition -- is not.
+    """
+    q = _normalize(question)
+    if any(word in q for word in AGENT_ONLY_WORDS):
+        return None
+    if ENTITY_PATTERN.search(q):
+        return None
+    columns = list(df.columns)
+    numeric = [c for c in columns if pd.api.types.is_numeric_dtype(df[c])]
+
+    parsed = _explicit_filters(q, df)
+    if parsed is None:
+        return None
+    filters, spans = parsed
+    # "is not"/"!=" inside a parsed filter is fine; any other negation would be dropped
+    unfiltered = q
+    for span in spans:
+        unfiltered = unfiltered.replace(span, " ")
+    if NEGATION_PATTERN.search(unfiltered):
+        return None
+    filter_columns = [c for c, _, _ in filters]
+
+    # Top-N: "top 5 products by revenue", "bottom 3 regions by average price"
+    top = re.search(r"\b(top|bottom|first|last)\s+(\d+)\s+(.+?)\s+by\s+(.+)$", q)
+    if top:
+        group_col = match_column(top.group(3), columns)
+        metric_phrase = top.group(4)
+        operation = next((op for words, op in AGGREGATIONS if any(w in metric_phrase for w in words)), "sum")
+        for word in _aggregation_words():
+            metric_phrase = re.sub(rf"\b{word}\b", "", metric_phrase).strip()
+        metric = match_column(metric_phrase, numeric)
+        if metric is None:
+            return None
+        plan = QueryPlan(
+            operation=operation if group_col else "rows",
+            metric=metric,
+            group_by=group_col,
+            top_n=int(top.group(2)),
+            ascending=top.group(1) in ("bottom", "last"),
+            filters=filters,
+        )
+        plan.filters += _implicit_filters(q, df, exclude=filter_columns + [group_col, metric])
+        return _accept(q, plan, spans + [top.group(1), top.group(2)])
+
+    operation = None
+    for words, op in AGGREGATIONS:
+        if any(re.search(rf"\b{re.escape(w)}\b", q) for w in words):
+            operation = op
+            break
+    if operation is None:
+        return None
+
+    group_by = None
+    group = re.search(GROUP_PATTERN, q)
+    if group:
+        group_by = match_column(group.group(1), columns)
+        if group_by is None:
+            return None
+
+    candidates = [c for c in mentioned_columns(q, numeric) if c != group_by and c not in filter_columns]
+    metric = candidates[0] if candidates else None
+    if operation == "count":
+        if "rows" not in q and "records" not in q and metric is None and group_by is None:
+            # "how many customers" -> distinct count of a mentioned non-numeric column
+            others = [c for c in mentioned_columns(q, columns) if c != group_by and c not in filter_columns]
+            if others:
+                operation, metric = "nunique", others[0]
+    elif metric is None:
+        return None
+
+    filters += _implicit_filters(q, df, exclude=filter_columns + [group_by, metric])
+    return _accept(q, QueryPlan(operation=operation, metric=metric, group_by=group_by, filters=filters), spans)
+
+
+# --- Execution ---
+def _apply_filters(df: pd.DataFrame, filters) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        series = df[column]
+        if op == "==":
+            mask &= series == value
+        elif op == "!=":
+            mask &= series != value
+        elif op == ">":
+            mask &= series > value
+        elif op == "<":
+            mask &= series < value
+        elif op == ">=":
+            mask &= series >= value
+        elif op == "<=":
+            mask &= series <= value
+    return df[mask]
+
+
+def _format_scalar(value) -> str:
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if isinstance(value, int):
+        return f"{value:,}"
+    return str(value)
+
+
+def execute_plan(plan: QueryPlan, df: pd.DataFrame) -> str:
+    frame = _apply_filters(df, plan.filters) if plan.filters else df
+
+    if plan.operation == "rows":
+        rows = frame.sort_values(plan.metric, ascending=plan.ascending).head(plan.top_n)
+        return rows.to_markdown(index=False)
+
+    if plan.group_by:
+        grouped = frame.groupby(plan.group_by, observed=True)
+        if plan.operation == "count" and plan.metric is None:
+            result = grouped.size()
+        else:
+            result = getattr(grouped[plan.metric], plan.operation)()
+        if plan.top_n:
+            result = result.sort_values(ascending=plan.ascending).head(plan.top_n)
+        else:
+            result = result.sort_values(ascending=False).head(MAX_RESULT_ROWS)
+        label = OPERATION_LABELS.get(plan.operation, plan.operation)
+        return result.rename(f"{label} of {plan.metric}" if plan.metric else "count").to_frame().to_markdown()
+
+    if plan.operation == "count" and plan.metric is None:
+        return f"There are {len(frame):,} rows" + (" matching the filter." if plan.filters else ".")
+    value = getattr(frame[plan.metric], plan.operation)()
+    if hasattr(value, "item"):
+        value = value.item()
+    label = OPERATION_LABELS.get(plan.operation, plan.operation)
+    return f"The {label} of {plan.metric} is {_format_scalar(value)}."
+
+
+def try_fast_answer(question: str, df: pd.DataFrame) -> Optional[dict]:
+    """Answer simple aggregate/filter/group-by/top-N questions with pandas, or return None."""
+    started = time.perf_counter()
+    try:
+        plan = parse_question(question, df)
+        if plan is None:
+            return None
+        answer = execute_plan(plan, df)
+    except Exception as e:
+        logger.info(f"CSV fast path declined ({e}); falling back to agent")
+        return None
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"CSV fast path answered '{question}' via [{plan.describe()}] in {elapsed_ms:.1f} ms")
+    return {"answer": answer, "path": "fast", "operation": plan.describe(), "elapsed_ms": round(elapsed_ms, 2)}
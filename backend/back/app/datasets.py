@@ -0,0 +1,316 @@
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+from app.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+DATASET_DIR = os.getenv("DATASET_DIR", "datasets")
+DATASET_CACHE_SIZE = int(os.getenv("DATASET_CACHE_SIZE", "16"))
+DATASET_CACHE_MAX_MB = int(os.getenv("DATASET_CACHE_MAX_MB", "2048"))
+DATASET_CACHE_TTL = float(os.getenv("DATASET_CACHE_TTL", "3600"))
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "200000"))
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_MAX_RATIO = 0.5
+# ...and at most this many distinct values, which bounds what the first pass keeps per column
+CATEGORY_MAX_VALUES = int(os.getenv("CATEGORY_MAX_VALUES", "100000"))
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    STORAGE_FORMAT = "parquet"
+except ImportError:
+    pa = pq = None
+    STORAGE_FORMAT = "pickle"
+    logger.warning("pyarrow not installed; datasets will be stored as pickle instead of Parquet")
+
+_LATEST_POINTER = "latest"
+_DATASET_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class DatasetNotFoundError(Exception):
+    pass
+
+
+def _frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True).sum())
+
+
+# In-memory DataFrames keyed by (dataset_id, mtime): a re-ingested dataset never serves stale data
+_frames = LRUCache(
+    "datasets",
+    max_entries=DATASET_CACHE_SIZE,
+    ttl=DATASET_CACHE_TTL,
+    max_bytes=DATASET_CACHE_MAX_MB * 1024 * 1024,
+    sizeof=_frame_bytes,
+)
+_write_lock = threading.Lock()
+
+
+# --- Type inference ---
+# Large CSVs are read twice, CSV_CHUNK_ROWS at a time: one pass settles every column's dtype
+# over the whole file, the second converts each chunk to exactly those dtypes and writes it out.
+# Deciding per chunk would type a column int in one chunk and float or object in the next.
+def _new_column_stats() -> dict:
+    return {"non_null": 0, "numeric": True, "integral": True, "min": None, "max": None, "nulls": False,
+            "boolean": True, "dates": 0, "date_format": None, "distinct": set(), "distinct_overflow": False}
+
+
+def _scan_chunk(stats: dict, column: str, series: pd.Series):
+    non_null = series.dropna()
+    stats["nulls"] = stats["nulls"] or len(non_null) < len(series)
+    if non_null.empty:
+        return
+    stats["non_null"] += len(non_null)
+    if stats["numeric"]:
+        numeric = pd.to_numeric(non_null, errors="coerce")
+        if numeric.notna().all():
+            stats["integral"] = stats["integral"] and bool((numeric % 1 == 0).all())
+            low, high = numeric.min(), numeric.max()
+            stats["min"] = low if stats["min"] is None else min(stats["min"], low)
+            stats["max"] = high if stats["max"] is None else max(stats["max"], high)
+        else:
+            stats["numeric"] = False
+    if stats["boolean"]:
+        stats["boolean"] = bool(non_null.str.lower().isin(["true", "false"]).all())
+    if any(token in str(column).lower() for token in ("date", "time", "day", "month")):
+        # One format for the whole file, guessed from its first value, so every chunk parses alike
+        stats["date_format"] = stats["date_format"] or guess_datetime_format(non_null.iloc[0]) or "mixed"
+        stats["dates"] += int(pd.to_datetime(non_null, format=stats["date_format"], errors="coerce").notna().sum())
+    if not stats["distinct_overflow"]:
+        stats["distinct"].update(non_null.unique())
+        if len(stats["distinct"]) > CATEGORY_MAX_VALUES:
+            stats["distinct_overflow"] = True
+            stats["distinct"] = set()
+
+
+def _column_type(stats: dict):
+    """The dtype a whole column is stored as: a numpy dtype, "datetime64[ns]", a CategoricalDtype or "str"."""
+    if stats["non_null"] == 0:
+        return np.dtype("float32")
+    if stats["numeric"]:
+        if stats["integral"] and not stats["nulls"]:
+            for dtype in (np.int8, np.int16, np.int32, np.int64):
+                if np.iinfo(dtype).min <= stats["min"] and stats["max"] <= np.iinfo(dtype).max:
+                    return np.dtype(dtype)
+        return np.dtype("float32")
+    if stats["boolean"] and not stats["nulls"]:
+        return np.dtype("bool")
+    if stats["date_format"] and stats["dates"] / stats["non_null"] > 0.95:
+        return ("datetime64[ns]", stats["date_format"])
+    distinct = stats["distinct"]
+    if not stats["distinct_overflow"] and len(distinct) / stats["non_null"] <= CATEGORY_MAX_RATIO:
+        return pd.CategoricalDtype(sorted(distinct))
+    return "str"
+
+
+def infer_column_types(csv_path: str) -> Dict[str, object]:
+    """First pass over the CSV: every column's storage dtype, decided from all of its rows."""
+    columns: Dict[str, dict] = {}
+    for chunk in pd.read_csv(csv_path, chunksize=CSV_CHUNK_ROWS, dtype=str):
+        for column in chunk.columns:
+            _scan_chunk(columns.setdefault(column, _new_column_stats()), column, chunk[column])
+    if not columns:
+        columns = {column: _new_column_stats() for column in pd.read_csv(csv_path, nrows=0).columns}
+    return {column: _column_type(stats) for column, stats in columns.items()}
+
+
+def _convert_column(series: pd.Series, column_type) -> pd.Series:
+    if isinstance(column_type, tuple):
+        _, date_format = column_type
+        return pd.to_datetime(series, format=date_format, errors="coerce").astype("datetime64[ns]")
+    if isinstance(column_type, pd.CategoricalDtype):
+        return series.astype(column_type)
+    if column_type == "str":
+        return series
+    if column_type == np.dtype("bool"):
+        return series.str.lower() == "true"
+    return pd.to_numeric(series, errors="coerce").astype(column_type)
+
+
+def iter_typed_chunks(csv_path: str, column_types: Dict[str, object]) -> Iterator[pd.DataFrame]:
+    """Second pass: the CSV in chunks of CSV_CHUNK_ROWS, each converted to the same dtypes."""
+    for chunk in pd.read_csv(csv_path, chunksize=CSV_CHUNK_ROWS, dtype=str):
+        yield pd.DataFrame({column: _convert_column(chunk[column], column_types[column]) for column in chunk.columns})
+
+
+def _dtype_name(column_type) -> str:
+    return column_type[0] if isinstance(column_type, tuple) else str(column_type)
+
+
+def read_csv_typed(csv_path: str, column_types: Optional[Dict[str, object]] = None) -> pd.DataFrame:
+    """The whole CSV as one typed DataFrame (held in memory; ingest_csv streams to Parquet instead)."""
+    column_types = column_types or infer_column_types(csv_path)
+    chunks = list(iter_typed_chunks(csv_path, column_types))
+    if not chunks:
+        return pd.DataFrame({column: pd.Series(dtype=_dtype_name(t)) for column, t in column_types.items()})
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _arrow_type(column_type):
+    if isinstance(column_type, tuple):
+        return pa.timestamp("ns")
+    if isinstance(column_type, pd.CategoricalDtype):
+        codes = pd.Categorical([], dtype=column_type).codes.dtype
+        return pa.dictionary(pa.from_numpy_dtype(codes), pa.string())
+    if column_type == "str":
+        return pa.string()
+    return pa.from_numpy_dtype(column_type)
+
+
+# --- Storage ---
+def is_dataset_id(value: str) -> bool:
+    return bool(_DATASET_ID_PATTERN.match(value))
+
+
+def _data_path(dataset_id: str) -> str:
+    if not is_dataset_id(dataset_id):
+        raise DatasetNotFoundError(f"Invalid dataset id: {dataset_id}")
+    extension = "parquet" if STORAGE_FORMAT == "parquet" else "pkl"
+    return os.path.join(DATASET_DIR, f"{dataset_id}.{extension}")
+
+
+def _meta_path(dataset_id: str) -> str:
+    return os.path.join(DATASET_DIR, f"{dataset_id}.json")
+
+
+def _write_frame(df: pd.DataFrame, path: str):
+    tmp_path = f"{path}.tmp"
+    if STORAGE_FORMAT == "parquet":
+        df.to_parquet(tmp_path, index=False)
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _read_frame(path: str) -> pd.DataFrame:
+    if STORAGE_FORMAT == "parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _write_parquet_chunks(csv_path: str, column_types: Dict[str, object], path: str) -> Tuple[int, int]:
+    """Stream the typed chunks into one Parquet file; only a chunk at a time is in memory."""
+    schema = pa.schema([(column, _arrow_type(t)) for column, t in column_types.items()])
+    tmp_path = f"{path}.tmp"
+    rows, memory_bytes = 0, 0
+    with pq.ParquetWriter(tmp_path, schema) as writer:
+        for chunk in iter_typed_chunks(csv_path, column_types):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            rows += len(chunk)
+            memory_bytes += _frame_bytes(chunk)
+    os.replace(tmp_path, path)
+    return rows, memory_bytes
+
+
+def ingest_csv(csv_path: str, filename: Optional[str] = None, dataset_id: Optional[str] = None,
+               make_latest: bool = True) -> dict:
+    """Parse a CSV once, store it columnar, and (by default) make it the latest dataset.
+
+    With Parquet the CSV is streamed chunk by chunk and never held whole; the pickle fallback
+    has to build the full frame, which then also warms the cache.
+    """
+    os.makedirs(DATASET_DIR, exist_ok=True)
+    dataset_id = dataset_id or uuid.uuid4().hex
+    started = time.perf_counter()
+    column_types = infer_column_types(csv_path)
+    data_path = _data_path(dataset_id)
+    df = None
+    with _write_lock:
+        if STORAGE_FORMAT == "parquet":
+            rows, memory_bytes = _write_parquet_chunks(csv_path, column_types, data_path)
+        else:
+            df = read_csv_typed(csv_path, column_types)
+            rows, memory_bytes = len(df), _frame_bytes(df)
+            _write_frame(df, data_path)
+        meta = {
+            "dataset_id": dataset_id,
+            "filename": filename or os.path.basename(csv_path),
+            "rows": rows,
+            "columns": {str(column): _dtype_name(t) for column, t in column_types.items()},
+            "memory_bytes": memory_bytes,
+            "format": STORAGE_FORMAT,
+            "created_at": time.time(),
+        }
+        with open(_meta_path(dataset_id), "w") as f:
+            json.dump(meta, f)
+        if make_latest:
+            _write_latest_pointer(dataset_id)
+    if df is not None:
+        # Warm the cache: the first question right after upload shouldn't re-read from disk
+        _frames.set((dataset_id, os.path.getmtime(data_path)), df)
+    logger.info(f"Ingested dataset {dataset_id} ({meta['rows']} rows) in {time.perf_counter() - started:.2f}s")
+    return meta
+
+
+def _write_latest_pointer(dataset_id: str):
+    with open(os.path.join(DATASET_DIR, _LATEST_POINTER), "w") as f:
+        f.write(dataset_id)
+
+
+def set_latest_dataset(dataset_id: str):
+    """Point "latest" at an existing dataset, e.g. when an identical CSV is uploaded again."""
+    get_dataset_meta(dataset_id)
+    with _write_lock:
+        _write_latest_pointer(dataset_id)
+
+
+def latest_dataset_id() -> Optional[str]:
+    pointer = os.path.join(DATASET_DIR, _LATEST_POINTER)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        return f.read().strip() or None
+
+
+def get_dataset_meta(dataset_id: str) -> dict:
+    path = _meta_path(dataset_id)
+    if not os.path.exists(path):
+        raise DatasetNotFoundError(f"Dataset {dataset_id} not found")
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_dataset(dataset_id: Optional[str] = None) -> pd.DataFrame:
+    dataset_id = dataset_id or latest_dataset_id()
+    if not dataset_id:
+        raise DatasetNotFoundError("No CSV has been uploaded yet")
+    data_path = _data_path(dataset_id)
+    if not os.path.exists(data_path):
+        raise DatasetNotFoundError(f"Dataset {dataset_id} not found")
+    key = (dataset_id, os.path.getmtime(data_path))
+    return _frames.get_or_create(key, lambda: _read_frame(data_path))
+
+
+def _path_dataset_id(csv_path: str) -> str:
+    return "path_" + hashlib.sha256(os.path.abspath(csv_path).encode("utf-8")).hexdigest()[:16]
+
+
+def resolve_dataset(reference: Optional[str]) -> pd.DataFrame:
+    """Accept a dataset id or a raw CSV path (as the agent tools pass); raw paths are ingested once."""
+    reference = (reference or "").strip()
+    if not reference or (is_dataset_id(reference) and os.path.exists(_data_path(reference))):
+        return load_dataset(reference or None)
+    if os.path.exists(reference):
+        dataset_id = _path_dataset_id(reference)
+        data_path = _data_path(dataset_id)
+        if not os.path.exists(data_path) or os.path.getmtime(data_path) < os.path.getmtime(reference):
+            ingest_csv(reference, dataset_id=dataset_id, make_latest=False)
+        return load_dataset(dataset_id)
+    raise DatasetNotFoundError(f"Unknown dataset or file: {reference}")
+
+
+def get_dataset_cache_stats() -> dict:
+    return _frames.stats()
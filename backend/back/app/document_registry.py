@@ -0,0 +1,138 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Iterable, List, Optional, Set
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_REGISTRY_PATH = os.getenv("DOCUMENT_REGISTRY_PATH", "document_registry.sqlite3")
+
+
+def document_id(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id(source: str, page, content: str) -> str:
+    """Stable id: unchanged chunks keep their id across re-uploads, edited ones get a new one."""
+    content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{source}\x00{page}\x00{content_hash}".encode("utf-8")).hexdigest()
+
+
+def assign_chunk_ids(docs: List[Document]) -> List[str]:
+    return [chunk_id(doc.metadata.get("source", ""), doc.metadata.get("page", ""), doc.page_content) for doc in docs]
+
+
+class DocumentRegistry:
+    """Per-user record of which documents and chunk ids live in each Chroma collection."""
+
+    def __init__(self, path: str = DOCUMENT_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                user_id TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                pages INTEGER NOT NULL DEFAULT 0,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user_id, doc_id)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                user_id TEXT NOT NULL,
+                doc_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (user_id, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_doc ON chunks(user_id, doc_id);
+            """
+        )
+        self._conn.commit()
+
+    def upsert_document(self, user_id: str, doc_id: str, filename: str, status: str, pages: int = 0):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO documents (user_id, doc_id, filename, pages, status, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(user_id, doc_id) DO UPDATE SET
+                       filename = excluded.filename, pages = excluded.pages,
+                       status = excluded.status, updated_at = excluded.updated_at""",
+                (user_id, doc_id, filename, pages, status, now, now),
+            )
+            self._conn.commit()
+
+    def finish_document(self, user_id: str, doc_id: str, status: str):
+        with self._lock:
+            self._conn.execute(
+                """UPDATE documents SET status = ?, updated_at = ?,
+                       chunk_count = (SELECT COUNT(*) FROM chunks WHERE user_id = ? AND doc_id = ?)
+                   WHERE user_id = ? AND doc_id = ?""",
+                (status, time.time(), user_id, doc_id, user_id, doc_id),
+            )
+            self._conn.commit()
+
+    def get_chunk_ids(self, user_id: str, doc_id: str) -> Set[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id FROM chunks WHERE user_id = ? AND doc_id = ?", (user_id, doc_id)
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def add_chunks(self, user_id: str, doc_id: str, chunk_ids: Iterable[str]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (user_id, doc_id, chunk_id) VALUES (?, ?, ?)",
+                [(user_id, doc_id, cid) for cid in chunk_ids],
+            )
+            self._conn.commit()
+
+    def remove_chunks(self, user_id: str, chunk_ids: Iterable[str]):
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE user_id = ? AND chunk_id = ?",
+                [(user_id, cid) for cid in chunk_ids],
+            )
+            self._conn.commit()
+
+    def list_documents(self, user_id: str) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT doc_id, filename, pages, chunk_count, status, created_at, updated_at
+                   FROM documents WHERE user_id = ? ORDER BY updated_at DESC""",
+                (user_id,),
+            ).fetchall()
+        keys = ["doc_id", "filename", "pages", "chunk_count", "status", "created_at", "updated_at"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def get_document(self, user_id: str, doc_id: str) -> Optional[dict]:
+        return next((doc for doc in self.list_documents(user_id) if doc["doc_id"] == doc_id), None)
+
+    def delete_document(self, user_id: str, doc_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE user_id = ? AND doc_id = ?", (user_id, doc_id))
+            self._conn.execute("DELETE FROM documents WHERE user_id = ? AND doc_id = ?", (user_id, doc_id))
+            self._conn.commit()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> DocumentRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = DocumentRegistry()
+    return _registry
@@ -0,0 +1,292 @@
+import os
+import time
+import uuid
+import base64
+import random
+import sqlite3
+import logging
+import threading
+from email.mime.text import MIMEText
+from typing import List, Optional
+
+from googleapiclient.errors import HttpError
+
+from app.google_clients import get_gmail_service, is_retryable_403
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+EMAIL_QUEUE_PATH = os.getenv("EMAIL_QUEUE_PATH", "email_queue.sqlite3")
+EMAIL_WORKERS = int(os.getenv("EMAIL_WORKERS", "2"))
+# Sustained sends per second and how many may go out back to back
+EMAIL_RATE_PER_SECOND = float(os.getenv("EMAIL_RATE_PER_SECOND", "2"))
+EMAIL_BURST = int(os.getenv("EMAIL_BURST", "10"))
+# Messages a worker claims and sends in one Gmail batch request
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "10"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "2"))
+EMAIL_RETRY_MAX_SECONDS = float(os.getenv("EMAIL_RETRY_MAX_SECONDS", "600"))
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "1"))
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# Gmail's send has no idempotency key: a send whose response is lost may already have gone out
+DELIVERY_SEMANTICS = "at-least-once"
+_COLUMNS = ["message_id", "to_addr", "subject", "status", "attempts", "next_attempt_at",
+            "last_error", "gmail_id", "created_at", "updated_at"]
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a token is available."""
+
+    def __init__(self, rate: float = EMAIL_RATE_PER_SECOND, capacity: int = EMAIL_BURST):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: int = 1, stop: Optional[threading.Event] = None) -> bool:
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return True
+                wait = (tokens - self._tokens) / self.rate
+            if stop is not None and stop.wait(wait):
+                return False
+            if stop is None:
+                time.sleep(wait)
+
+
+def build_raw_message(to: str, subject: str, body: str) -> str:
+    message = MIMEText(body)
+    message['to'] = to
+    message['subject'] = subject
+    return base64.urlsafe_b64encode(message.as_bytes()).decode()
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        if error.resp.status == 403:
+            # insufficientPermissions and the like won't clear up; only rate limits are retried
+            return is_retryable_403(error)
+        return error.resp.status in RETRYABLE_STATUSES
+    return True
+
+
+class EmailQueue:
+    """Durable outbox: messages are accepted into SQLite and delivered by background workers.
+
+    Delivery is at-least-once. If a send fails in transit (or the process dies mid-send), Gmail
+    may have accepted the message before the error, and the retry sends it again. To keep that to
+    the message that hit the error, only first attempts share a batch request; retries go out one
+    message per request.
+    """
+
+    def __init__(self, path: str = EMAIL_QUEUE_PATH, workers: int = EMAIL_WORKERS,
+                 bucket: Optional[TokenBucket] = None):
+        self.path = path
+        self.workers = workers
+        self.bucket = bucket or TokenBucket()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                message_id TEXT PRIMARY KEY,
+                to_addr TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                gmail_id TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox(status, next_attempt_at);
+            """
+        )
+        # Anything left 'sending' was interrupted by a restart; it goes back in line
+        self._conn.execute("UPDATE outbox SET status = 'queued' WHERE status = 'sending'")
+        self._conn.commit()
+
+    # --- Producer side ---
+    def enqueue(self, to: str, subject: str, body: str) -> str:
+        message_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                """INSERT INTO outbox (message_id, to_addr, subject, body, status, next_attempt_at, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)""",
+                (message_id, to, subject, body, now, now, now),
+            )
+            self._conn.commit()
+        self._wake.set()
+        return message_id
+
+    def get(self, message_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM outbox WHERE message_id = ?", (message_id,)
+            ).fetchone()
+        return {**dict(zip(_COLUMNS, row)), "delivery": DELIVERY_SEMANTICS} if row else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+        return {
+            "queued": counts.get("queued", 0),
+            "sending": counts.get("sending", 0),
+            "sent": counts.get("sent", 0),
+            "failed": counts.get("failed", 0),
+            "workers": len([t for t in self._threads if t.is_alive()]),
+            "rate_per_second": self.bucket.rate,
+            "delivery": DELIVERY_SEMANTICS,
+        }
+
+    # --- Worker side ---
+    def _claim(self, limit: int) -> List[tuple]:
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT message_id, to_addr, subject, body, attempts FROM outbox
+                   WHERE status = 'queued' AND next_attempt_at <= ?
+                   ORDER BY next_attempt_at LIMIT ?""",
+                (now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE outbox SET status = 'sending', updated_at = ? WHERE message_id = ?",
+                [(now, row[0]) for row in rows],
+            )
+            self._conn.commit()
+        return rows
+
+    def _mark_sent(self, message_id: str, attempts: int, gmail_id: str):
+        with self._lock:
+            self._conn.execute(
+                """UPDATE outbox SET status = 'sent', attempts = ?, gmail_id = ?, last_error = NULL, updated_at = ?
+                   WHERE message_id = ?""",
+                (attempts, gmail_id, time.time(), message_id),
+            )
+            self._conn.commit()
+
+    def _mark_failed(self, message_id: str, attempts: int, error: Exception):
+        retry = _is_retryable(error) and attempts < EMAIL_MAX_ATTEMPTS
+        now = time.time()
+        delay = min(EMAIL_RETRY_MAX_SECONDS, EMAIL_RETRY_BASE_SECONDS * (2 ** (attempts - 1))) * (1 + random.random())
+        with self._lock:
+            self._conn.execute(
+                """UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ?
+                   WHERE message_id = ?""",
+                ("queued" if retry else "failed", attempts, now + delay if retry else now, str(error), now, message_id),
+            )
+            self._conn.commit()
+        if retry:
+            logger.warning(f"Email {message_id} attempt {attempts} failed, retrying in {delay:.1f}s: {error}")
+        else:
+            logger.error(f"Email {message_id} failed permanently after {attempts} attempt(s): {error}")
+
+    def _send_batch(self, rows: List[tuple]) -> dict:
+        outcomes = {}
+
+        def callback(request_id, response, exception):
+            outcomes[request_id] = exception if exception is not None else response
+
+        try:
+            service = get_gmail_service()
+            batch = service.new_batch_http_request(callback=callback)
+            for message_id, to, subject, body, _ in rows:
+                raw = build_raw_message(to, subject, body)
+                batch.add(service.users().messages().send(userId='me', body={'raw': raw}), request_id=message_id)
+            batch.execute()
+        except Exception as e:
+            # Gmail may have accepted some of these before the failure; each is retried on its own
+            for row in rows:
+                outcomes.setdefault(row[0], e)
+        return outcomes
+
+    def _send_one(self, row: tuple):
+        message_id, to, subject, body, _ = row
+        try:
+            raw = build_raw_message(to, subject, body)
+            return get_gmail_service().users().messages().send(userId='me', body={'raw': raw}).execute()
+        except Exception as e:
+            return e
+
+    def _send(self, rows: List[tuple]):
+        first = [row for row in rows if row[4] == 0]
+        outcomes = self._send_batch(first) if len(first) > 1 else {row[0]: self._send_one(row) for row in first}
+        # Retries may follow a batch that failed in transit: one request each, so a repeat
+        # failure can't put a whole batch of possibly-delivered messages back in line
+        for row in rows:
+            if row[4] > 0:
+                outcomes[row[0]] = self._send_one(row)
+
+        for message_id, _, _, _, attempts in rows:
+            outcome = outcomes.get(message_id, RuntimeError("No response for this message in the batch"))
+            if isinstance(outcome, Exception):
+                self._mark_failed(message_id, attempts + 1, outcome)
+            else:
+                self._mark_sent(message_id, attempts + 1, outcome.get("id"))
+
+    def _worker(self):
+        while not self._stop.is_set():
+            rows = self._claim(min(EMAIL_BATCH_SIZE, self.bucket.capacity))
+            if not rows:
+                self._wake.wait(EMAIL_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            if not self.bucket.acquire(len(rows), stop=self._stop):
+                # Shutting down: release the claim so the next start picks them up
+                with self._lock:
+                    self._conn.executemany(
+                        "UPDATE outbox SET status = 'queued' WHERE message_id = ?", [(row[0],) for row in rows]
+                    )
+                    self._conn.commit()
+                break
+            self._send(rows)
+
+    def start(self):
+        if any(t.is_alive() for t in self._threads):
+            return
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"email-worker-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Started {self.workers} email workers at {self.bucket.rate}/s (burst {self.bucket.capacity})")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_email_queue() -> EmailQueue:
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = EmailQueue()
+    return _queue
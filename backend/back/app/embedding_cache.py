@@ -0,0 +1,227 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Tuple
+
+from langchain_core.embeddings import Embeddings
+from app.metrics import stage, record_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "1024"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+# Reads only note their access time; it is written with the next insert, or after this many reads/seconds
+EMBEDDING_ACCESS_FLUSH_KEYS = int(os.getenv("EMBEDDING_ACCESS_FLUSH_KEYS", "1000"))
+EMBEDDING_ACCESS_FLUSH_SECONDS = float(os.getenv("EMBEDDING_ACCESS_FLUSH_SECONDS", "60"))
+
+# Hit/miss counters of every enclosing track_embedding_stats() block
+_call_stats: ContextVar[Tuple[Dict[str, int], ...]] = ContextVar("embedding_call_stats", default=())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def track_embedding_stats():
+    """Collect cache hits/misses for every embed_documents call made inside the block."""
+    stats = {"hits": 0, "misses": 0}
+    token = _call_stats.set(_call_stats.get() + (stats,))
+    try:
+        yield stats
+    finally:
+        _call_stats.reset(token)
+
+
+def hit_rate(stats: Dict[str, int]) -> float:
+    total = stats["hits"] + stats["misses"]
+    return round(stats["hits"] / total, 4) if total else 0.0
+
+
+# --- SQLite Store ---
+class EmbeddingStore:
+    """Content-addressed float32 vectors in SQLite with LRU eviction by total size."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: int = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_access ON embeddings(last_access)")
+        self._conn.commit()
+        # The only full scan; afterwards the total is kept up to date incrementally
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+        self._touched: Dict[str, float] = {}  # key -> last access not yet written
+        self._touched_since = time.monotonic()
+
+    @staticmethod
+    def _batches(keys: List[str]):
+        # SQLite caps bound parameters; 500 stays well below every default limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            yield batch, ",".join("?" * len(batch))
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        if not keys:
+            return found
+        with self._lock:
+            for batch, placeholders in self._batches(keys):
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                self._touched.update(dict.fromkeys(found, now))
+                if (len(self._touched) >= EMBEDDING_ACCESS_FLUSH_KEYS
+                        or time.monotonic() - self._touched_since >= EMBEDDING_ACCESS_FLUSH_SECONDS):
+                    self._flush_access()
+                    self._conn.commit()
+        return found
+
+    def _flush_access(self):
+        # Caller holds the lock and commits
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()],
+            )
+            self._touched.clear()
+        self._touched_since = time.monotonic()
+
+    def put_many(self, model: str, items: Dict[str, List[float]]):
+        if not items:
+            return
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = array("f", vector).tobytes()
+            rows.append((key, model, blob, len(blob), now))
+        with self._lock:
+            # Sizes of rows about to be replaced; length() comes from the record header, so the
+            # vector's overflow pages aren't read
+            replaced = 0
+            for batch, placeholders in self._batches(list(items)):
+                replaced += self._conn.execute(
+                    f"SELECT COALESCE(SUM(length(vector)), 0) FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchone()[0]
+            # Pending read times go first, so they can't overwrite the newer time of a replaced row
+            self._flush_access()
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._total_bytes += sum(row[3] for row in rows) - replaced
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # Trim to 90% of the cap so eviction doesn't run on every insert
+        target = int(self.max_bytes * 0.9)
+        removed = 0
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_access ASC LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            self._conn.executemany("DELETE FROM embeddings WHERE key = ?", [(key,) for key, _ in rows])
+            self._total_bytes -= sum(size for _, size in rows)
+            removed += len(rows)
+        logger.info(f"Embedding cache evicted {removed} vectors ({self._total_bytes} bytes remain)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return {"path": self.path, "vectors": count, "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+# --- Embeddings Wrapper ---
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends cache misses to the underlying model, in batches."""
+
+    def __init__(self, underlying: Embeddings, store: EmbeddingStore, batch_size: int = EMBEDDING_BATCH_SIZE):
+        self.underlying = underlying
+        self.store = store
+        self.batch_size = batch_size
+        self.model = getattr(underlying, "model", None) or type(underlying).__name__
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [cache_key(self.model, text) for text in texts]
+        cached = self.store.get_many(list(set(keys)))
+
+        # Deduplicate misses so repeated boilerplate chunks are embedded once
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        if missing:
+            miss_keys = list(missing)
+            fresh: Dict[str, List[float]] = {}
+            for start in range(0, len(miss_keys), self.batch_size):
+                batch_keys = miss_keys[start:start + self.batch_size]
+                with stage("embedding"):
+                    vectors = self.underlying.embed_documents([missing[key] for key in batch_keys])
+                fresh.update(zip(batch_keys, vectors))
+            self.store.put_many(self.model, fresh)
+            cached.update(fresh)
+
+        hits = sum(1 for key in keys if key not in missing)
+        self._record(hits, len(keys) - hits)
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        cached = self.store.get_many([key])
+        if key in cached:
+            self._record(1, 0)
+            return cached[key]
+        self._record(0, 1)
+        with stage("embedding"):
+            vector = self.underlying.embed_query(text)
+        self.store.put_many(self.model, {key: vector})
+        return vector
+
+    def _record(self, hits: int, misses: int):
+        with self._counter_lock:
+            self.hits += hits
+            self.misses += misses
+        record_cache("embeddings", "hit", hits)
+        record_cache("embeddings", "miss", misses)
+        for stats in _call_stats.get():
+            stats["hits"] += hits
+            stats["misses"] += misses
+
+    def stats(self) -> dict:
+        counters = {"hits": self.hits, "misses": self.misses}
+        return {**counters, "hit_rate": hit_rate(counters), "store": self.store.stats()}
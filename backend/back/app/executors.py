@@ -0,0 +1,71 @@
+import os
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# --- Pool Configuration ---
+# Threads handle blocking I/O and GIL-releasing work (OpenAI calls, Chroma, Whisper/torch, pandas).
+# Processes handle pure-Python CPU work that would otherwise hold the GIL (PDF parsing).
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", "16"))
+PROCESS_POOL_SIZE = int(os.getenv("PROCESS_POOL_SIZE", str(max(1, (os.cpu_count() or 2) // 2))))
+
+_thread_pool = None
+_process_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        with _pool_lock:
+            if _thread_pool is None:
+                logger.info(f"Starting thread pool with {THREAD_POOL_SIZE} workers")
+                _thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE, thread_name_prefix="app-worker")
+    return _thread_pool
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        with _pool_lock:
+            if _process_pool is None:
+                logger.info(f"Starting process pool with {PROCESS_POOL_SIZE} workers")
+                # "spawn" avoids forking a process that already runs event loop and pool threads
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=PROCESS_POOL_SIZE,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _process_pool
+
+
+async def run_in_thread(func, *args, **kwargs):
+    """Run a blocking callable on the shared thread pool without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await loop.run_in_executor(get_thread_pool(), call)
+
+
+async def run_in_process(func, *args, **kwargs):
+    """Run a picklable, module-level callable on the shared process pool."""
+    loop = asyncio.get_running_loop()
+    call = functools.partial(func, *args, **kwargs)
+    return await loop.run_in_executor(get_process_pool(), call)
+
+
+def shutdown_pools():
+    global _thread_pool, _process_pool
+    with _pool_lock:
+        if _thread_pool is not None:
+            _thread_pool.shutdown(wait=False, cancel_futures=True)
+            _thread_pool = None
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+            _process_pool = None
+    logger.info("Worker pools shut down")
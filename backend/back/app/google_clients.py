@@ -0,0 +1,204 @@
+import os
+import json
+import pickle
+import logging
+import datetime
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httplib2
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.discovery import build_from_document, DISCOVERY_URI
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+GOOGLE_TOKEN_PATH = os.getenv("GOOGLE_TOKEN_PATH", "token.pickle")
+GOOGLE_CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH", "credentials.json")
+# Refresh this long before expiry so no request goes out with a token about to lapse
+GOOGLE_REFRESH_MARGIN_SECONDS = float(os.getenv("GOOGLE_REFRESH_MARGIN_SECONDS", "300"))
+GOOGLE_HTTP_TIMEOUT = float(os.getenv("GOOGLE_HTTP_TIMEOUT", "30"))
+
+SCOPES_CALENDAR = ['https://www.googleapis.com/auth/calendar']
+SCOPES_GMAIL = ['https://www.googleapis.com/auth/gmail.send']
+# 403 is usually permanent (no access, missing scope, quota off); only its rate-limit reasons are worth a retry
+RETRYABLE_403_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+
+# --- Credentials ---
+class CredentialManager:
+    """Loads token.pickle once and keeps the credentials fresh for every caller."""
+
+    def __init__(self, token_path: str = GOOGLE_TOKEN_PATH, client_secrets_path: str = GOOGLE_CREDENTIALS_PATH,
+                 refresh_margin: float = GOOGLE_REFRESH_MARGIN_SECONDS, request_factory: Callable = Request):
+        self.token_path = token_path
+        self.client_secrets_path = client_secrets_path
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self._request_factory = request_factory
+        self._creds = None
+        self._lock = threading.Lock()
+        self.refreshes = 0
+
+    def _load(self):
+        if os.path.exists(self.token_path):
+            with open(self.token_path, 'rb') as token_file:
+                return pickle.load(token_file)
+        return None
+
+    def _save(self, creds):
+        tmp_path = f"{self.token_path}.tmp"
+        with open(tmp_path, 'wb') as token_file:
+            pickle.dump(creds, token_file)
+        os.replace(tmp_path, self.token_path)
+
+    def _needs_refresh(self, creds) -> bool:
+        if not creds.valid:
+            return True
+        # google-auth stores expiry as naive UTC
+        return creds.expiry is not None and creds.expiry - self.refresh_margin <= datetime.datetime.utcnow()
+
+    def _has_scopes(self, creds, scopes: List[str]) -> bool:
+        granted = set(getattr(creds, "scopes", None) or [])
+        return not granted or set(scopes) <= granted
+
+    def get_credentials(self, scopes: List[str]):
+        """Return shared credentials covering scopes, refreshing (or running the consent flow) if needed."""
+        creds = self._creds
+        if creds is not None and not self._needs_refresh(creds) and self._has_scopes(creds, scopes):
+            return creds
+
+        with self._lock:
+            creds = self._creds or self._load()
+            if creds is not None and not self._has_scopes(creds, scopes):
+                creds = None
+            if creds is None or self._needs_refresh(creds):
+                if creds is not None and creds.refresh_token:
+                    # Refresh mutates the object in place, so every AuthorizedHttp sharing it sees the new token
+                    creds.refresh(self._request_factory())
+                    self.refreshes += 1
+                    logger.info("Refreshed Google credentials")
+                else:
+                    requested = sorted(set(scopes) | set(getattr(creds, "scopes", None) or []))
+                    flow = InstalledAppFlow.from_client_secrets_file(self.client_secrets_path, requested)
+                    creds = flow.run_local_server(port=0)
+                self._save(creds)
+            self._creds = creds
+            return creds
+
+
+# --- Discovery ---
+def fetch_discovery_document(api: str, version: str) -> str:
+    """Bundled discovery document if the client library ships one, otherwise one HTTP fetch."""
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        document = get_static_doc(api, version)
+        if document:
+            return document
+    except ImportError:
+        pass
+    response, content = httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT).request(
+        DISCOVERY_URI.format(api=api, apiVersion=version)
+    )
+    if response.status >= 400:
+        raise RuntimeError(f"Discovery for {api} {version} failed with HTTP {response.status}")
+    return content.decode("utf-8") if isinstance(content, bytes) else content
+
+
+# --- Service pool ---
+class GoogleClientPool:
+    """Built API clients per (api, version, scopes), one per thread.
+
+    The discovery document is fetched and parsed once per API. httplib2 transports are
+    not thread-safe, so each thread gets its own AuthorizedHttp and service object, all
+    sharing one set of credentials. discovery_loader and http_factory can be swapped for
+    local fakes (e.g. googleapiclient.http.HttpMock) in tests.
+    """
+
+    def __init__(self, credentials: Optional[CredentialManager] = None,
+                 discovery_loader: Callable[[str, str], str] = fetch_discovery_document,
+                 http_factory: Optional[Callable[[], httplib2.Http]] = None):
+        self.credentials = credentials or CredentialManager()
+        self._discovery_loader = discovery_loader
+        self._http_factory = http_factory or (lambda: httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT))
+        self._documents: Dict[Tuple[str, str], dict] = {}
+        self._documents_lock = threading.Lock()
+        self._local = threading.local()
+        self.services_built = 0
+
+    def _document(self, api: str, version: str) -> dict:
+        key = (api, version)
+        document = self._documents.get(key)
+        if document is None:
+            with self._documents_lock:
+                document = self._documents.get(key)
+                if document is None:
+                    document = json.loads(self._discovery_loader(api, version))
+                    self._documents[key] = document
+        return document
+
+    def get_service(self, api: str, version: str, scopes: List[str]):
+        creds = self.credentials.get_credentials(scopes)
+        services = getattr(self._local, "services", None)
+        if services is None:
+            services = self._local.services = {}
+        key = (api, version, tuple(sorted(scopes)))
+        cached = services.get(key)
+        # Rebuild only if the consent flow replaced the credentials object
+        if cached is not None and cached[0] is creds:
+            return cached[1]
+        http = AuthorizedHttp(creds, http=self._http_factory())
+        service = build_from_document(self._document(api, version), http=http)
+        services[key] = (creds, service)
+        self.services_built += 1
+        return service
+
+    def stats(self) -> dict:
+        return {
+            "discovery_documents": len(self._documents),
+            "services_built": self.services_built,
+            "credential_refreshes": self.credentials.refreshes,
+        }
+
+
+_pool: Optional[GoogleClientPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool() -> GoogleClientPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = GoogleClientPool()
+    return _pool
+
+
+def set_client_pool(pool: Optional[GoogleClientPool]):
+    """Swap the process-wide pool, e.g. for one backed by fake discovery/HTTP."""
+    global _pool
+    with _pool_lock:
+        _pool = pool
+
+
+def get_calendar_service():
+    return get_client_pool().get_service('calendar', 'v3', SCOPES_CALENDAR)
+
+
+def get_gmail_service():
+    return get_client_pool().get_service('gmail', 'v1', SCOPES_GMAIL)
+
+
+# --- Errors ---
+def error_reasons(error) -> set:
+    """The "reason" fields of an HttpError's JSON body; empty when it has none."""
+    try:
+        details = json.loads(error.content.decode("utf-8"))["error"].get("errors", [])
+        return {detail.get("reason") for detail in details}
+    except (ValueError, KeyError, AttributeError, TypeError):
+        return set()
+
+
+def is_retryable_403(error) -> bool:
+    return bool(error_reasons(error) & RETRYABLE_403_REASONS)
@@ -0,0 +1,214 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from langchain_core.documents import Document
+from app.cache import LRUCache
+from app.executors import run_in_thread, run_in_process
+from app.document_registry import get_registry, document_id, assign_chunk_ids
+from app.rag_logic import count_pdf_pages, load_and_split_pdf_pages, embed_and_store, delete_chunks
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))
+INGEST_JOB_RETENTION = float(os.getenv("INGEST_JOB_RETENTION", "86400"))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class IngestionJob:
+    job_id: str
+    user_id: str
+    filename: str
+    file_path: str
+    status: str = "queued"  # queued -> running -> completed | failed
+    pages_total: int = 0
+    pages_processed: int = 0
+    chunks_processed: int = 0
+    chunks_added: int = 0
+    chunks_unchanged: int = 0
+    chunks_removed: int = 0
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def to_dict(self) -> dict:
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "job_id": self.job_id,
+            "user_id": self.user_id,
+            "filename": self.filename,
+            "status": self.status,
+            "pages_total": self.pages_total,
+            "pages_processed": self.pages_processed,
+            "chunks_processed": self.chunks_processed,
+            "chunks_added": self.chunks_added,
+            "chunks_unchanged": self.chunks_unchanged,
+            "chunks_removed": self.chunks_removed,
+            "elapsed_seconds": round(elapsed, 3),
+            "pages_per_second": round(self.pages_processed / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks_processed / elapsed, 2) if elapsed else 0.0,
+            "error": self.error,
+        }
+
+
+_jobs = LRUCache("ingestion_jobs", max_entries=10000, ttl=INGEST_JOB_RETENTION)
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+
+
+# --- Public API ---
+async def start_ingestion_workers():
+    global _queue
+    if _queue is not None:
+        return
+    _queue = asyncio.Queue(maxsize=INGEST_QUEUE_SIZE)
+    for n in range(INGEST_WORKERS):
+        _workers.append(asyncio.create_task(_worker(n)))
+    logger.info(f"Started {INGEST_WORKERS} ingestion workers (queue size {INGEST_QUEUE_SIZE})")
+
+
+async def stop_ingestion_workers():
+    global _queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+def submit_job(job_id: str, user_id: str, filename: str, file_path: str) -> IngestionJob:
+    if _queue is None:
+        raise RuntimeError("Ingestion workers are not running")
+    job = IngestionJob(job_id=job_id, user_id=user_id, filename=filename, file_path=file_path)
+    try:
+        _queue.put_nowait(job)
+    except asyncio.QueueFull:
+        raise QueueFullError(f"Ingestion queue is full ({INGEST_QUEUE_SIZE} jobs pending)")
+    _jobs.set(job_id, job)
+    logger.info(f"[{user_id}] Queued ingestion job {job_id} for {filename}")
+    return job
+
+
+def get_job(job_id: str) -> Optional[IngestionJob]:
+    return _jobs.get(job_id)
+
+
+def queue_stats() -> dict:
+    return {
+        "queue_depth": _queue.qsize() if _queue else 0,
+        "queue_size": INGEST_QUEUE_SIZE,
+        "workers": INGEST_WORKERS,
+    }
+
+
+# --- Pipeline ---
+async def _worker(n: int):
+    while True:
+        job = await _queue.get()
+        try:
+            await _run_job(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[{job.user_id}] Ingestion job {job.job_id} failed: {e}", exc_info=True)
+            job.status = "failed"
+            job.error = str(e)
+        finally:
+            job.finished_at = time.time()
+            job.done.set()
+            _queue.task_done()
+            if os.path.exists(job.file_path):
+                os.remove(job.file_path)
+
+
+async def _run_job(job: IngestionJob):
+    job.status = "running"
+    job.started_at = time.time()
+    job.pages_total = await run_in_thread(count_pdf_pages, job.file_path)
+
+    registry = get_registry()
+    doc_id = document_id(job.filename)
+    await run_in_thread(registry.upsert_document, job.user_id, doc_id, job.filename, "indexing", job.pages_total)
+    existing = await run_in_thread(registry.get_chunk_ids, job.user_id, doc_id)
+    seen = set()
+
+    # Stage 1: parse + split page slices in the process pool
+    parse_tasks = [
+        asyncio.ensure_future(_parse_slice(job, start, start + INGEST_PAGES_PER_TASK))
+        for start in range(0, job.pages_total, INGEST_PAGES_PER_TASK)
+    ]
+
+    # Stage 2: embed + upsert batches as soon as their slice is parsed
+    embed_limit = asyncio.Semaphore(INGEST_EMBED_CONCURRENCY)
+    embed_tasks = []
+    try:
+        for parsed in asyncio.as_completed(parse_tasks):
+            chunks = await parsed
+            new_chunks, new_ids = [], []
+            for chunk, cid in zip(chunks, assign_chunk_ids(chunks)):
+                if cid in seen:
+                    continue  # identical text repeated on the same page
+                seen.add(cid)
+                if cid in existing:
+                    job.chunks_unchanged += 1
+                    job.chunks_processed += 1
+                else:
+                    new_chunks.append(chunk)
+                    new_ids.append(cid)
+            for start in range(0, len(new_chunks), INGEST_EMBED_BATCH_SIZE):
+                batch = new_chunks[start:start + INGEST_EMBED_BATCH_SIZE]
+                batch_ids = new_ids[start:start + INGEST_EMBED_BATCH_SIZE]
+                embed_tasks.append(asyncio.ensure_future(_embed_batch(job, doc_id, batch, batch_ids, embed_limit)))
+        await asyncio.gather(*embed_tasks)
+    except BaseException:
+        for task in parse_tasks + embed_tasks:
+            task.cancel()
+        await run_in_thread(registry.finish_document, job.user_id, doc_id, "failed")
+        raise
+
+    # Chunks from the previous version of this document that no longer exist
+    stale = list(existing - seen)
+    if stale:
+        await run_in_thread(delete_chunks, job.user_id, stale)
+        await run_in_thread(registry.remove_chunks, job.user_id, stale)
+        job.chunks_removed = len(stale)
+    await run_in_thread(registry.finish_document, job.user_id, doc_id, "indexed")
+
+    job.status = "completed"
+    logger.info(f"[{job.user_id}] Ingestion job {job.job_id} completed: {job.to_dict()}")
+
+
+async def _parse_slice(job: IngestionJob, start: int, end: int) -> List[Document]:
+    chunks = await run_in_process(load_and_split_pdf_pages, job.file_path, start, end, source=job.filename)
+    job.pages_processed += min(end, job.pages_total) - start
+    return chunks
+
+
+async def _embed_batch(job: IngestionJob, doc_id: str, batch: List[Document], ids: List[str], limit: asyncio.Semaphore):
+    async with limit:
+        await run_in_thread(embed_and_store, batch, user_id=job.user_id, ids=ids)
+        # Register per batch so a failed job still knows which chunks it wrote
+        await run_in_thread(get_registry().add_chunks, job.user_id, doc_id, ids)
+    job.chunks_added += len(batch)
+    job.chunks_processed += len(batch)
@@ -0,0 +1,75 @@
+import time
+import logging
+import threading
+from typing import Callable, Dict, Generic, Iterable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# name -> Lazy, in registration order, so warm_up() can build everything
+_resources: Dict[str, "Lazy"] = {}
+
+
+class Lazy(Generic[T]):
+    """Thread-safe, build-once holder for a heavy resource (model, client, agent)."""
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self.name = name
+        self.factory = factory
+        self.init_seconds: Optional[float] = None
+        self._value: Optional[T] = None
+        self._lock = threading.Lock()
+        _resources[name] = self
+
+    @property
+    def initialized(self) -> bool:
+        return self.init_seconds is not None
+
+    def get(self) -> T:
+        if self.init_seconds is None:
+            with self._lock:
+                if self.init_seconds is None:
+                    start = time.perf_counter()
+                    self._value = self.factory()
+                    self.init_seconds = time.perf_counter() - start
+                    logger.info(f"Initialized {self.name} in {self.init_seconds:.2f}s")
+        return self._value
+
+    def __call__(self) -> T:
+        return self.get()
+
+
+def lazy(name: str):
+    """Decorator form: `@lazy("whisper_model")` turns a factory into a Lazy resource."""
+    def wrap(factory: Callable[[], T]) -> Lazy[T]:
+        return Lazy(name, factory)
+    return wrap
+
+
+def warm_up(names: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    """Build the named resources (default: all registered) and report per-resource timings."""
+    report = {}
+    for name in names or list(_resources):
+        resource = _resources.get(name)
+        if resource is None:
+            report[name] = {"status": "unknown"}
+            continue
+        try:
+            already = resource.initialized
+            resource.get()
+            report[name] = {
+                "status": "cached" if already else "initialized",
+                "seconds": round(resource.init_seconds, 3),
+            }
+        except Exception as e:
+            logger.error(f"Warm-up of {name} failed: {e}")
+            report[name] = {"status": "failed", "error": str(e)}
+    return report
+
+
+def resource_status() -> Dict[str, dict]:
+    return {
+        name: {"initialized": resource.initialized, "seconds": resource.init_seconds}
+        for name, resource in _resources.items()
+    }
@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from app.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "lexical_index")
+LEXICAL_INDEX_OPEN_MAX = int(os.getenv("LEXICAL_INDEX_OPEN_MAX", "64"))
+
+# Keep part numbers, clause ids and paths ("AB-1234", "4.2.1", "v2_final") as single tokens
+_TOKENIZER = "unicode61 tokenchars '-_./'"
+_TERM_PATTERN = re.compile(r"[\w][\w\-./]*")
+# Too common to be worth a posting-list scan
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "does", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "the", "this", "to", "was", "what", "when", "where", "which", "who", "why", "with",
+}
+
+
+def query_terms(query: str) -> List[str]:
+    terms = [t.strip("-_./") for t in _TERM_PATTERN.findall(query.lower())]
+    return [t for t in dict.fromkeys(terms) if t and t not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """One user's BM25 index: an SQLite FTS5 table holding chunk text and metadata."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+                   content, metadata UNINDEXED, tokenize="{_TOKENIZER}")"""
+        )
+        # FTS5 columns can't be keyed, so map chunk ids to FTS rowids for O(1) upserts and deletes
+        self._conn.execute("CREATE TABLE IF NOT EXISTS chunk_rows (chunk_id TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.commit()
+
+    def _delete(self, ids: Sequence[str]):
+        for chunk_id in ids:
+            row = self._conn.execute("SELECT row FROM chunk_rows WHERE chunk_id = ?", (chunk_id,)).fetchone()
+            if row is not None:
+                self._conn.execute("DELETE FROM chunks WHERE rowid = ?", row)
+                self._conn.execute("DELETE FROM chunk_rows WHERE chunk_id = ?", (chunk_id,))
+
+    def add(self, ids: Sequence[str], docs: Sequence[Document]):
+        with self._lock:
+            # Re-sent chunks replace themselves instead of double counting in BM25 statistics
+            self._delete(ids)
+            for chunk_id, doc in zip(ids, docs):
+                cursor = self._conn.execute(
+                    "INSERT INTO chunks (content, metadata) VALUES (?, ?)", (doc.page_content, json.dumps(doc.metadata))
+                )
+                self._conn.execute("INSERT INTO chunk_rows (chunk_id, row) VALUES (?, ?)", (chunk_id, cursor.lastrowid))
+            self._conn.commit()
+
+    def remove(self, ids: Sequence[str]):
+        with self._lock:
+            self._delete(ids)
+            self._conn.commit()
+
+    def search(self, query: str, k: int = 20) -> List[Tuple[str, float, Document]]:
+        """Return (chunk_id, score, document), best first; higher score is better."""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT r.chunk_id, c.content, c.metadata, bm25(chunks) FROM chunks c "
+                "JOIN chunk_rows r ON r.row = c.rowid WHERE chunks MATCH ? ORDER BY bm25(chunks) LIMIT ?",
+                (match, k),
+            ).fetchall()
+        # FTS5's bm25() is negated so that ascending order is best-first
+        return [
+            (chunk_id, -score, Document(page_content=content, metadata=json.loads(metadata)))
+            for chunk_id, content, metadata, score in rows
+        ]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunk_rows").fetchone()[0]
+
+
+def _index_path(user_id: str) -> str:
+    # Hash the id: user ids come from requests and must not steer the path
+    name = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32]
+    return os.path.join(LEXICAL_INDEX_DIR, f"{name}.sqlite3")
+
+
+# Open handles only; an evicted index's connection closes once its last in-flight user drops it
+_indexes = LRUCache("lexical_indexes", max_entries=LEXICAL_INDEX_OPEN_MAX)
+
+
+def get_lexical_index(user_id: str, create: bool = True) -> Optional[LexicalIndex]:
+    path = _index_path(user_id)
+    if not create and not os.path.exists(path):
+        return None
+
+    def open_index():
+        os.makedirs(LEXICAL_INDEX_DIR, exist_ok=True)
+        return LexicalIndex(path)
+
+    return _indexes.get_or_create(user_id, open_index)
+
+
+def get_lexical_index_stats() -> dict:
+    return _indexes.stats()
@@ -1,17 +1,49 @@
 import os
-import shutil
+import time
+import asyncio
 import logging
-from fastapi import FastAPI, UploadFile, File, Form
-from fastapi.responses import JSONResponse
+from typing import List, Optional
+
+# Measured before the heavy imports below so the startup log covers them
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, Request, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from starlette.routing import Match
 from pydantic import BaseModel
-from app.rag_logic import load_and_split_pdf, embed_and_store
-from app.chat_logic import get_chat_chain
+from app.rag_logic import get_vectorstore_cache_stats, get_embedding_cache_stats, delete_document
+from app.vector_backends import flush_indexes
+from app.document_registry import get_registry, document_id
+from app.ingestion import (
+    start_ingestion_workers, stop_ingestion_workers, new_job_id, submit_job, get_job, queue_stats, QueueFullError
+)
+from app.chat_logic import get_chain_cache_stats
+from app.streaming import stream_chat_events, format_sse
+from app.answer_cache import answer_cache
+from app.sessions import get_session_store
+from app.lexical_index import get_lexical_index_stats
+from app.google_clients import get_client_pool
+from app.search_cache import get_search_cache
+from app.calendar_batch import insert_events
+from app.email_queue import get_email_queue
 from app.advanced_agent import build_advanced_router
+from app.executors import run_in_thread, shutdown_pools
+from app.datasets import (
+    ingest_csv, latest_dataset_id, set_latest_dataset, get_dataset_meta, get_dataset_cache_stats, DatasetNotFoundError
+)
+from app.tts_cache import get_tts_cache_stats
+from app.transcription import get_transcription_service, TranscriptionBusyError
+from app.lazy import Lazy, warm_up, resource_status
+from app.uploads import (
+    UploadError, UploadOffsetMismatch, SpooledFile, UploadSizeLimitMiddleware, receive_upload,
+    get_upload_sessions, get_upload_stats, remember, recall, sweep_spool
+)
+from app import metrics
 from app.tools import (
-    transcribe_audio, summarize_text, text_to_speech,
-    analyze_csv, send_email, create_event
+    summarize_text, text_to_speech,
+    answer_csv_question, send_email, create_event
 )
 
 logging.basicConfig(level=logging.INFO)
@@ -19,6 +51,21 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Client RAG Chatbot API")
 
+# Build every lazy resource (Whisper, agents, router centroids...) at startup instead of on first use
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+
+# ----------------------
+# Upload size limits
+# ----------------------
+# Multipart bodies are buffered by Starlette before an endpoint runs, so the limits are enforced
+# here (inside CORS, so a 413 still carries its headers). Only PUT /uploads streams to disk.
+app.add_middleware(UploadSizeLimitMiddleware, paths={
+    "/upload_pdf": "pdf",
+    "/upload_csv": "csv",
+    "/voice_chat": "audio",
+    "/transcribe/stream": "audio",
+})
+
 # ----------------------
 # CORS Setup
 # ----------------------
@@ -33,6 +80,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ----------------------
+# Request metrics
+# ----------------------
+def _route_template(request: Request) -> str:
+    # Label by route template, not raw path, so /jobs/<id> doesn't create a series per job
+    route = request.scope.get("route")
+    if route is not None:
+        return route.path
+    for candidate in request.app.router.routes:
+        match, _ = candidate.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(candidate, "path", request.url.path)
+    return "unmatched"
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    request_id = metrics.new_request_id(request.headers.get("x-request-id"))
+    trace, token = metrics.start_trace(request_id, request.method, request.url.path)
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        path = _route_template(request)
+        trace.path = path
+        # Streaming responses are measured up to their headers; the body is still being produced
+        metrics.REQUEST_SECONDS.observe(trace.elapsed(), request.method, path, status)
+        metrics.log_if_slow(trace, status)
+        metrics.end_trace(token)
+    response.headers["X-Request-ID"] = request_id
+    if metrics.SERVER_TIMING:
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render_metrics(), media_type="text/plain; version=0.0.4")
+
 # ----------------------
 # Static files for audio
 # ----------------------
@@ -47,26 +132,197 @@ app.mount("/audio", StaticFiles(directory=UPLOAD_DIR), name="audio")
 def root():
     return JSONResponse(content={"message": "RAG Chatbot API is live!"})
 
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "vectorstores": get_vectorstore_cache_stats(),
+        "chat_chains": get_chain_cache_stats(),
+        "embeddings": get_embedding_cache_stats(),
+        "datasets": get_dataset_cache_stats(),
+        "tts": get_tts_cache_stats(),
+        "answers": answer_cache.stats(),
+        "sessions": get_session_store().stats(),
+        "lexical_indexes": get_lexical_index_stats(),
+        "google_clients": get_client_pool().stats(),
+        "search": get_search_cache().stats(),
+        "uploads": get_upload_stats(),
+    }
+
+@app.on_event("startup")
+async def on_startup():
+    await start_ingestion_workers()
+    get_email_queue().start()
+    # Leftovers from requests that were cut off by the last shutdown
+    await run_in_thread(sweep_spool)
+    logger.info(f"🚀 Startup completed in {time.perf_counter() - _IMPORT_STARTED:.2f}s")
+    if WARMUP_ON_STARTUP:
+        # Warm in the background so the worker accepts traffic (and health checks) immediately
+        asyncio.create_task(_background_warm_up())
+
+async def _background_warm_up():
+    started = time.perf_counter()
+    report = await run_in_thread(warm_up)
+    logger.info(f"🔥 Warm-up finished in {time.perf_counter() - started:.2f}s: {report}")
+
+@app.post("/warmup")
+async def warmup():
+    started = time.perf_counter()
+    report = await run_in_thread(warm_up)
+    return {"seconds": round(time.perf_counter() - started, 3), "resources": report}
+
+@app.get("/warmup")
+def warmup_status():
+    return {"resources": resource_status()}
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await stop_ingestion_workers()
+    await run_in_thread(flush_indexes)
+    await run_in_thread(get_email_queue().stop)
+    if get_transcription_service.initialized:
+        get_transcription_service().shutdown()
+    shutdown_pools()
+
+# ----------------------
+# Uploads (multipart bodies are copied to unique spool files; resumable chunked uploads stream to disk)
+# ----------------------
+def _upload_error(e: UploadError) -> JSONResponse:
+    content = {"detail": str(e)}
+    if isinstance(e, UploadOffsetMismatch):
+        content["offset"] = e.offset
+    return JSONResponse(status_code=e.status_code, content=content)
+
+class UploadSessionRequest(BaseModel):
+    filename: str
+    kind: str  # "pdf", "csv" or "audio"
+    size: Optional[int] = None
+    sha256: Optional[str] = None
+
+@app.post("/uploads", status_code=201)
+async def create_upload(request: UploadSessionRequest):
+    """Start a chunked upload; PUT the bytes, then pass upload_id to /upload_pdf, /upload_csv or /voice_chat."""
+    try:
+        session = await run_in_thread(
+            get_upload_sessions().create, request.kind, request.filename, request.size, request.sha256
+        )
+    except UploadError as e:
+        return _upload_error(e)
+    return session.to_dict()
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int):
+    """Append the raw request body at `offset`; on 409 resume from the offset in the response."""
+    try:
+        session = await get_upload_sessions().append(upload_id, offset, request.stream())
+    except UploadError as e:
+        return _upload_error(e)
+    return session.to_dict()
+
+@app.get("/uploads/{upload_id}")
+async def upload_status(upload_id: str):
+    try:
+        session = await run_in_thread(get_upload_sessions().get, upload_id)
+    except UploadError as e:
+        return _upload_error(e)
+    return session.to_dict()
+
+@app.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str):
+    try:
+        await run_in_thread(get_upload_sessions().abort, upload_id)
+    except UploadError as e:
+        return _upload_error(e)
+    return {"success": True}
+
 # ----------------------
 # Upload PDF
 # ----------------------
-@app.post("/upload_pdf")
-async def upload_pdf(file: UploadFile = File(...), user_id: str = Form(...)):
-    temp_path = os.path.join(UPLOAD_DIR, f"temp_{file.filename}")
-    logger.info(f"[{user_id}] Uploading PDF: {file.filename}")
+async def _find_duplicate_pdf_job(user_id: str, spooled: SpooledFile):
+    """A queued, running or finished (and still registered) job for the same bytes, name and user."""
+    job_id = recall("pdf", (user_id, spooled.filename), spooled.sha256)
+    job = get_job(job_id) if job_id else None
+    if job is None or job.status == "failed":
+        return None
+    if job.status == "completed":
+        doc = await run_in_thread(get_registry().get_document, user_id, document_id(spooled.filename))
+        if doc is None:
+            return None
+    return job
 
+@app.post("/upload_pdf", status_code=202)
+async def upload_pdf(file: Optional[UploadFile] = File(None), user_id: str = Form(...), wait: bool = Form(False),
+                     upload_id: Optional[str] = Form(None)):
     try:
-        with open(temp_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        spooled = await receive_upload(file, upload_id, "pdf")
+    except UploadError as e:
+        logger.warning(f"[{user_id}] PDF upload rejected: {e}")
+        return _upload_error(e)
+    logger.info(f"[{user_id}] Uploaded PDF: {spooled.filename} ({spooled.size} bytes)")
+
+    job = await _find_duplicate_pdf_job(user_id, spooled)
+    duplicate = job is not None
+    if duplicate:
+        spooled.discard()
+        logger.info(f"[{user_id}] {spooled.filename} is identical to job {job.job_id}; not ingesting again")
+    else:
+        try:
+            job = submit_job(new_job_id(), user_id=user_id, filename=spooled.filename, file_path=spooled.path)
+        except QueueFullError as e:
+            spooled.discard()
+            logger.warning(f"[{user_id}] PDF upload rejected: {e}")
+            return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "30"})
+        except Exception as e:
+            spooled.discard()
+            logger.error(f"[{user_id}] PDF error: {e}")
+            return JSONResponse(status_code=500, content={"detail": str(e)})
+        remember("pdf", (user_id, spooled.filename), spooled.sha256, job.job_id)
+    job_id = job.job_id
+
+    if wait:
+        await job.done.wait()
+        if job.status == "failed":
+            return JSONResponse(status_code=500, content={"detail": job.error, "job": job.to_dict()})
+        return JSONResponse(status_code=200, content={
+            "message": "PDF uploaded and processed.", "job": job.to_dict(), "duplicate": duplicate
+        })
 
-        docs = load_and_split_pdf(temp_path)
-        embed_and_store(docs, user_id=user_id)
-        os.remove(temp_path)
+    return {
+        "message": "PDF uploaded, processing in background.",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "duplicate": duplicate
+    }
+
+@app.get("/jobs")
+def list_job_queue():
+    return queue_stats()
+
+@app.get("/jobs/{job_id}")
+def get_job_status(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"detail": f"Job {job_id} not found"})
+    return job.to_dict()
+
+# ----------------------
+# Document Registry
+# ----------------------
+@app.get("/documents/{user_id}")
+async def list_documents(user_id: str):
+    documents = await run_in_thread(get_registry().list_documents, user_id)
+    return {"documents": documents}
 
-        return {"message": "PDF uploaded and processed."}
+@app.delete("/documents/{user_id}/{doc_id}")
+async def remove_document(user_id: str, doc_id: str):
+    try:
+        deleted = await run_in_thread(delete_document, user_id, doc_id)
     except Exception as e:
-        logger.error(f"[{user_id}] PDF error: {e}")
+        logger.error(f"[{user_id}] Document delete error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
+    if not deleted:
+        return JSONResponse(status_code=404, content={"detail": f"Document {doc_id} not found"})
+    logger.info(f"[{user_id}] Deleted document {doc_id}")
+    return {"success": True, "doc_id": doc_id}
 
 # ----------------------
 # Chat Request Model
@@ -75,8 +331,8 @@ class ChatRequest(BaseModel):
     question: str
     user_id: str
 
-# Use Workflow Graph
-tool_agent_graph = build_advanced_router()
+# Use Workflow Graph (compiled on first request or warm-up)
+tool_agent_graph = Lazy("agent_router", build_advanced_router)
 
 @app.post("/chat")
 async def chat_with_bot(chat_request: ChatRequest):
@@ -84,18 +340,67 @@ async def chat_with_bot(chat_request: ChatRequest):
     user_id = chat_request.user_id
     logger.info(f"[{user_id}] Question: {question}")
 
+    async def compute():
+        # One routing decision: the graph classifies and dispatches document QA or an agent
+        result = await tool_agent_graph().ainvoke({"input": question, "user_id": user_id})
+        return {
+            "answer": result.get("result", "Sorry, no answer found."),
+            "route": result.get("route"),
+            "tools": result.get("tools_used", []),
+        }
+
     try:
-        if "pdf" in question.lower() or "document" in question.lower():
-            chat_chain = get_chat_chain(user_id)
-            answer = chat_chain.invoke({"query": question})
+        sessions = get_session_store()
+        if await run_in_thread(sessions.depends_on_history, user_id, question):
+            # A follow-up's answer only holds in this conversation: never cached or replayed
+            result = await compute()
         else:
-            result = tool_agent_graph.invoke({"input": question})
-            answer = result.get("result", "Sorry, no answer found.")
-        return {"answer": answer}
+            # Repeated and concurrent identical questions share one graph run
+            result = await answer_cache.get_or_compute(user_id, question, compute)
+        if result.get("cache"):
+            logger.info(f"[{user_id}] Answer served from cache ({result['cache']})")
+        await run_in_thread(sessions.append_turn, user_id, question, result["answer"])
+        return {"answer": result["answer"]}
     except Exception as e:
         logger.error(f"[{user_id}] Chat error: {e}")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+# ----------------------
+# Streaming Chat (SSE + WebSocket)
+# ----------------------
+@app.post("/chat/stream")
+async def chat_stream(chat_request: ChatRequest):
+    question = chat_request.question.strip()
+    user_id = chat_request.user_id
+    logger.info(f"[{user_id}] Streaming question: {question}")
+
+    async def event_source():
+        async for event in stream_chat_events(question, user_id, tool_agent_graph()):
+            yield format_sse(event)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/chat/ws")
+async def chat_websocket(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            question = str(payload.get("question", "")).strip()
+            user_id = str(payload.get("user_id", "default_user"))
+            if not question:
+                await websocket.send_json({"type": "error", "error": "question is required"})
+                continue
+            logger.info(f"[{user_id}] WebSocket question: {question}")
+            async for event in stream_chat_events(question, user_id, tool_agent_graph()):
+                await websocket.send_json(event)
+    except WebSocketDisconnect:
+        logger.info("Chat WebSocket disconnected")
+
 # ----------------------
 # Voice Assistant: Transcribe + Summarize + TTS
 # ----------------------
@@ -103,51 +408,45 @@ import os
 from fastapi import UploadFile, File
 from fastapi.responses import JSONResponse
 import logging
-import shutil
 
 logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = os.path.abspath("temp_uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+async def _transcribe_upload(spooled: SpooledFile) -> str:
+    # The same recording sent again (client retry, double submit) skips Whisper
+    transcript = recall("audio", "transcript", spooled.sha256)
+    if transcript is None:
+        # Long recordings are split on silence and transcribed in parallel by the Whisper pool
+        service = await run_in_thread(get_transcription_service)
+        with metrics.stage("transcription"):
+            transcript = await service.transcribe(spooled.path)
+        remember("audio", "transcript", spooled.sha256, transcript)
+    return transcript
+
 @app.post("/voice_chat")
-async def voice_chat(audio: UploadFile = File(...)):
-    try:
-        # Ensure filename is safe
-        filename = f"temp_{audio.filename}"
-        # Prefer .wav extension for whisper, force if needed:
-        if not filename.lower().endswith(('.wav', '.mp3', '.m4a')):
-            filename += ".wav"
-        
-        audio_path = os.path.join(UPLOAD_DIR, filename)
-        audio_path = os.path.normpath(os.path.abspath(audio_path))
-
-        logger.info(f"Saving uploaded audio to: {audio_path}")
-
-        # Save the uploaded file content
-        content = await audio.read()  # read all bytes
-        with open(audio_path, "wb") as f:
-            f.write(content)
-
-        # Check file exists & log
-        if not os.path.exists(audio_path):
-            logger.error(f"Audio file not found after saving: {audio_path}")
-            raise FileNotFoundError(f"Audio file not found at path: {audio_path}")
-        logger.info(f"Audio file saved successfully: {audio_path}")
-
-        # Call transcription function
-        transcript = transcribe_audio(audio_path)
-        if transcript.startswith("Transcription failed"):
-            # Return error if transcription failed
-            logger.error(f"Transcription error: {transcript}")
-            return JSONResponse(status_code=500, content={"detail": transcript})
-
-        summary = summarize_text(transcript)
-        audio_output = text_to_speech(summary)  # returns path like '/audio/tts_output.mp3'
-
-        # Cleanup uploaded file after processing
-        os.remove(audio_path)
-        logger.info(f"Deleted temp audio file: {audio_path}")
+async def voice_chat(audio: Optional[UploadFile] = File(None), upload_id: Optional[str] = Form(None)):
+    try:
+        # Streamed to a unique spool file: concurrent uploads named "recording.wav" can't collide
+        spooled = await receive_upload(audio, upload_id, "audio")
+    except UploadError as e:
+        logger.warning(f"Voice chat upload rejected: {e}")
+        return _upload_error(e)
+    logger.info(f"Saved uploaded audio {spooled.filename} ({spooled.size} bytes) to {spooled.path}")
+
+    try:
+        try:
+            transcript = await _transcribe_upload(spooled)
+        except TranscriptionBusyError as e:
+            logger.warning(f"Voice chat rejected: {e}")
+            return JSONResponse(status_code=503, content={"detail": str(e)}, headers={"Retry-After": "10"})
+        except Exception as e:
+            logger.error(f"Transcription error: {e}")
+            return JSONResponse(status_code=500, content={"detail": f"Transcription failed: {str(e)}"})
+
+        summary = await run_in_thread(summarize_text.invoke, transcript)
+        audio_output = await run_in_thread(text_to_speech.invoke, summary)  # returns path like '/audio/tts/<hash>.mp3'
 
         return {
             "summary": summary,
@@ -156,33 +455,89 @@ async def voice_chat(audio: UploadFile = File(...)):
     except Exception as e:
         logger.error(f"Voice chat error: {e}", exc_info=True)
         return JSONResponse(status_code=500, content={"detail": str(e)})
+    finally:
+        spooled.discard()
+
+@app.post("/transcribe/stream")
+async def transcribe_stream(audio: Optional[UploadFile] = File(None), upload_id: Optional[str] = Form(None)):
+    try:
+        spooled = await receive_upload(audio, upload_id, "audio")
+    except UploadError as e:
+        return _upload_error(e)
+    service = await run_in_thread(get_transcription_service)
+
+    async def event_source():
+        try:
+            async for event in service.stream(spooled.path):
+                yield format_sse({"type": "partial" if not event["complete"] else "final", **event})
+        except TranscriptionBusyError as e:
+            yield format_sse({"type": "error", "error": str(e), "retry_after": 10})
+        except Exception as e:
+            logger.error(f"Streaming transcription error: {e}")
+            yield format_sse({"type": "error", "error": str(e)})
+        finally:
+            spooled.discard()
+
+    return StreamingResponse(event_source(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 # ----------------------
 # CSV Upload Endpoint
 # ----------------------
+async def _existing_dataset(sha256: str) -> Optional[dict]:
+    dataset_id = recall("csv", "dataset", sha256)
+    if dataset_id is None:
+        return None
+    try:
+        await run_in_thread(set_latest_dataset, dataset_id)
+        return await run_in_thread(get_dataset_meta, dataset_id)
+    except DatasetNotFoundError:
+        return None
+
 @app.post("/upload_csv")
-async def upload_csv(file: UploadFile = File(...)):
+async def upload_csv(file: Optional[UploadFile] = File(None), upload_id: Optional[str] = Form(None)):
     try:
-        csv_path = os.path.join(UPLOAD_DIR, "data.csv")
-        with open(csv_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-        return {"success": True, "message": "CSV uploaded successfully."}
+        spooled = await receive_upload(file, upload_id, "csv")
+    except UploadError as e:
+        logger.warning(f"CSV upload rejected: {e}")
+        return _upload_error(e)
+    try:
+        # Identical bytes were already parsed: reuse that dataset instead of parsing again
+        meta = await _existing_dataset(spooled.sha256)
+        duplicate = meta is not None
+        if not duplicate:
+            # Parse once (chunked, typed) into the columnar dataset store; queries never touch the CSV again
+            meta = await run_in_thread(ingest_csv, spooled.path, filename=spooled.filename)
+            remember("csv", "dataset", spooled.sha256, meta["dataset_id"])
+        return {
+            "success": True,
+            "message": "CSV uploaded successfully.",
+            "dataset_id": meta["dataset_id"],
+            "rows": meta["rows"],
+            "columns": meta["columns"],
+            "duplicate": duplicate
+        }
     except Exception as e:
         logger.error(f"CSV upload error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
+    finally:
+        spooled.discard()
 
 # ----------------------
 # Query CSV Endpoint
 # ----------------------
 class CSVQuery(BaseModel):
     question: str
+    dataset_id: Optional[str] = None  # defaults to the most recent upload
 
 @app.post("/query_csv")
 async def query_csv(query: CSVQuery):
     try:
-        csv_path = os.path.join(UPLOAD_DIR, "data.csv")
-        result = analyze_csv.invoke({"file_path": csv_path, "question": query.question})
-        return {"answer": result}
+        dataset_id = query.dataset_id or latest_dataset_id()
+        if not dataset_id:
+            return JSONResponse(status_code=404, content={"detail": "No CSV has been uploaded yet"})
+        result = await run_in_thread(answer_csv_question, dataset_id, query.question)
+        # "path" is "fast" (vectorized pandas, no LLM) or "agent" (LLM-written pandas code)
+        return {**result, "dataset_id": dataset_id}
     except Exception as e:
         logger.error(f"CSV analysis error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
@@ -199,7 +554,7 @@ class CalendarEventRequest(BaseModel):
 @app.post("/create_calendar_event")
 async def create_calendar_event(event: CalendarEventRequest):
     try:
-        event_link = create_event.invoke({
+        event_link = await run_in_thread(create_event.invoke, {
         "summary": event.title,
         "description": event.description,
         "start_time": event.start_time,
@@ -210,3 +565,53 @@ async def create_calendar_event(event: CalendarEventRequest):
     except Exception as e:
         logger.error(f"Calendar event creation error: {e}")
         return JSONResponse(status_code=500, content={"detail": str(e)})
+
+class BulkCalendarEvent(CalendarEventRequest):
+    time_zone: Optional[str] = None
+
+class CalendarEventsRequest(BaseModel):
+    events: List[BulkCalendarEvent]
+    # Reuse the same key when resending a request whose response was lost, so no event is created twice
+    idempotency_key: Optional[str] = None
+
+@app.post("/create_calendar_events")
+async def create_calendar_events(request: CalendarEventsRequest):
+    """Bulk insert: validates everything up front, then sends batched requests with per-event results."""
+    try:
+        events = [event.dict() for event in request.events]
+        report = await run_in_thread(insert_events, events, request_key=request.idempotency_key)
+        return {"success": report["failed"] == 0, **report}
+    except Exception as e:
+        logger.error(f"Bulk calendar event creation error: {e}")
+        return JSONResponse(status_code=500, content={"detail": str(e)})
+
+# ----------------------
+# Outbound Email Queue
+# ----------------------
+@app.get("/emails")
+def email_queue_status():
+    return get_email_queue().stats()
+
+@app.get("/emails/{message_id}")
+def email_status(message_id: str):
+    message = get_email_queue().get(message_id)
+    if message is None:
+        return JSONResponse(status_code=404, content={"detail": f"Unknown email {message_id}"})
+    return message
+
+# ----------------------
+# Conversation Sessions
+# ----------------------
+@app.get("/sessions/{user_id}")
+async def get_session(user_id: str):
+    summary, window = await run_in_thread(get_session_store().history, user_id)
+    return {
+        "user_id": user_id,
+        "summary": summary,
+        "turns": [{"role": turn.role, "content": turn.content, "tokens": turn.tokens} for turn in window],
+    }
+
+@app.delete("/sessions/{user_id}")
+async def clear_session(user_id: str):
+    await run_in_thread(get_session_store().clear, user_id)
+    return {"success": True}
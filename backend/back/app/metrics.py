@@ -0,0 +1,372 @@
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Add a Server-Timing header (per-stage durations) to every response; browsers show it in devtools
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+# Requests slower than this are logged with their stage breakdown (0 disables)
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "5"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+# --- Prometheus primitives ---
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {value:g}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], list] = {}  # labels -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        key = tuple(str(v) for v in label_values)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="%g"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {total:.6f}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {count}"
+
+
+REQUEST_SECONDS = Histogram(
+    "chatbot_request_duration_seconds", "HTTP request latency until response headers.", ["method", "path", "status"]
+)
+STAGE_SECONDS = Histogram(
+    "chatbot_stage_duration_seconds", "Time spent per pipeline stage (routing, retriever, llm, tool.*, ...).", ["stage"]
+)
+STAGE_ERRORS = Counter("chatbot_stage_errors_total", "Pipeline stages that raised.", ["stage"])
+LLM_TOKENS = Counter("chatbot_llm_tokens_total", "Tokens reported by the LLM provider.", ["model", "kind"])
+CACHE_LOOKUPS = Counter("chatbot_cache_lookups_total", "Cache lookups by cache and result.", ["cache", "result"])
+
+_metrics = [REQUEST_SECONDS, STAGE_SECONDS, STAGE_ERRORS, LLM_TOKENS, CACHE_LOOKUPS]
+
+
+def render_metrics() -> str:
+    """Everything in the Prometheus text exposition format (version 0.0.4)."""
+    return "\n".join(line for metric in _metrics for line in metric.render()) + "\n"
+
+
+# --- Per-request trace ---
+class RequestTrace:
+    """Stage timings, token usage and cache results of one HTTP request."""
+
+    def __init__(self, request_id: str, method: str = "", path: str = ""):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.stages: Dict[str, list] = {}  # stage -> [calls, seconds]
+        self.tokens = {"prompt": 0, "completion": 0}
+        self.caches: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def add_span(self, stage: str, seconds: float):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_tokens(self, prompt: int, completion: int):
+        with self._lock:
+            self.tokens["prompt"] += prompt
+            self.tokens["completion"] += completion
+
+    def add_cache(self, cache: str, result: str, count: int):
+        with self._lock:
+            results = self.caches.setdefault(cache, {})
+            results[result] = results.get(result, 0) + count
+
+    def server_timing(self) -> str:
+        # Stages can overlap (an agent span contains its LLM and tool spans), so they don't add up to total
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda item: -item[1][1])
+        parts = [f'{stage};dur={seconds * 1000:.1f};desc="{calls}x"' for stage, (calls, seconds) in stages]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "path": self.path,
+                "seconds": round(self.elapsed(), 3),
+                "stages": {stage: {"calls": calls, "seconds": round(seconds, 3)}
+                           for stage, (calls, seconds) in self.stages.items()},
+                "tokens": dict(self.tokens),
+                "caches": {cache: dict(results) for cache, results in self.caches.items()},
+            }
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """Reuse a well-formed X-Request-ID from the client or proxy, otherwise make one."""
+    if incoming and _REQUEST_ID_PATTERN.match(incoming):
+        return incoming
+    return uuid.uuid4().hex[:16]
+
+
+def start_trace(request_id: str, method: str = "", path: str = ""):
+    """Make a trace current for this context; returns (trace, token) for end_trace."""
+    trace = RequestTrace(request_id, method, path)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(token):
+    _current_trace.reset(token)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def current_request_id() -> Optional[str]:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+# --- Recording ---
+def observe_stage(stage: str, seconds: float, error: bool = False, trace: Optional[RequestTrace] = None):
+    STAGE_SECONDS.observe(seconds, stage)
+    if error:
+        STAGE_ERRORS.inc(stage)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add_span(stage, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the block as one `name` span; works around awaits too."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe_stage(name, time.perf_counter() - started, error)
+
+
+def timed(name: str):
+    """Decorator form of stage(); keeps the signature so @tool can still build its schema."""
+    def wrap(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return wrap
+
+
+def record_tokens(model: str, prompt: int, completion: int, trace: Optional[RequestTrace] = None):
+    if prompt:
+        LLM_TOKENS.inc(model, "prompt", amount=prompt)
+    if completion:
+        LLM_TOKENS.inc(model, "completion", amount=completion)
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add_tokens(prompt, completion)
+
+
+def record_cache(cache: str, result: str, count: int = 1):
+    """result is "hit"/"miss" (or a finer kind like "semantic"); count batches many lookups."""
+    if count <= 0:
+        return
+    CACHE_LOOKUPS.inc(cache, result, amount=count)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_cache(cache, result, count)
+
+
+# --- LangChain callbacks ---
+_instrumented_chains = set()
+
+
+def _token_usage(response) -> Tuple[int, int]:
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0) or 0, usage.get("completion_tokens", 0) or 0
+    # Chat models that report usage on the message instead (streaming with stream_usage, newer providers)
+    prompt = completion = 0
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            prompt += metadata.get("input_tokens", 0)
+            completion += metadata.get("output_tokens", 0)
+    return prompt, completion
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Turns LangChain run events into stage spans and token counts for the current request.
+
+    Records LLM calls, retriever calls and the chains registered through instrument().
+    Tool runs are left to the @timed tool functions, so a Tool wrapping a tool isn't counted twice.
+    """
+
+    # Bookkeeping only; running inline saves a thread hop per event under async callers
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, tuple] = {}  # run_id -> (stage, started, trace, model)
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, stage_name: str, model: str = ""):
+        with self._lock:
+            self._runs[run_id] = (stage_name, time.perf_counter(), _current_trace.get(), model)
+
+    def _end(self, run_id: UUID, error: bool = False):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return None
+        stage_name, started, trace, model = run
+        observe_stage(stage_name, time.perf_counter() - started, error, trace)
+        return trace, model
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm", self._model_name(serialized, kwargs))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", self._model_name(serialized, kwargs))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        ended = self._end(run_id)
+        if ended is not None:
+            trace, model = ended
+            prompt, completion = _token_usage(response)
+            record_tokens(model, prompt, completion, trace)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._start(run_id, "retriever")
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, **kwargs):
+        # Every LCEL step is a chain run; only the named top-level components are worth a span
+        name = kwargs.get("name")
+        if name in _instrumented_chains:
+            self._start(run_id, name)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=True)
+
+    @staticmethod
+    def _model_name(serialized: Optional[dict], kwargs: Dict[str, Any]) -> str:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model")
+        if not model and serialized:
+            model = (serialized.get("kwargs") or {}).get("model_name") or serialized.get("name")
+        return model or "unknown"
+
+
+metrics_handler = MetricsCallbackHandler()
+
+
+def instrument(runnable, stage_name: str):
+    """Attach the metrics handler to a chain or agent executor and time it as `stage_name`.
+
+    Callbacks bound with with_config are inherited, so the LLM, retriever and tool runs
+    inside are recorded too.
+    """
+    _instrumented_chains.add(stage_name)
+    return runnable.with_config(callbacks=[metrics_handler], run_name=stage_name)
+
+
+# --- Slow requests ---
+def log_if_slow(trace: RequestTrace, status: int):
+    if not SLOW_REQUEST_SECONDS or trace.elapsed() < SLOW_REQUEST_SECONDS:
+        return
+    summary = trace.summary()
+    stages = ", ".join(
+        f"{name} {info['seconds']:.2f}s/{info['calls']}x"
+        for name, info in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"])
+    )
+    logger.warning(
+        f"🐢 Slow request {trace.request_id}: {trace.method} {trace.path} -> {status} in {summary['seconds']:.2f}s "
+        f"[{stages or 'no stages recorded'}] tokens={summary['tokens']} caches={summary['caches']}"
+    )
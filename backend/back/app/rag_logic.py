@@ -1,13 +1,21 @@
 import os
 import logging
+import threading
 from dotenv import load_dotenv
-from typing import List
+from typing import Callable, Dict, List, Optional
 
 from langchain_community.document_loaders import PyPDFLoader
+from pypdf import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from app.cache import LRUCache
+from app.lazy import lazy
+from app.document_registry import get_registry, assign_chunk_ids
+from app.lexical_index import LexicalIndex, get_lexical_index
+from app.vector_backends import VECTOR_BACKEND, LocalANNStore, local_store_directory
+from app.embedding_cache import CachedEmbeddings, EmbeddingStore, track_embedding_stats, hit_rate
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,32 +25,166 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
 CHROMA_DIR = "chroma_store"
 
+# --- Per-user vector store cache ---
+VECTORSTORE_CACHE_SIZE = int(os.getenv("VECTORSTORE_CACHE_SIZE", "64"))
+VECTORSTORE_CACHE_TTL = float(os.getenv("VECTORSTORE_CACHE_TTL", "1800"))
+VECTORSTORE_CACHE_MAX_MB = int(os.getenv("VECTORSTORE_CACHE_MAX_MB", "512"))
+# Rough per-chunk footprint: 1536-dim float32 embedding + chunk text + metadata
+_BYTES_PER_CHUNK = 1536 * 4 + 1024
+_LOCAL_BYTES_PER_CHUNK = 256
+
+_collection_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+_collection_listeners: List[Callable[[str, int], None]] = []
+_lexical_backfill_lock = threading.Lock()
+_lexical_ready = set()
+
+
+def _estimate_vectorstore_bytes(vectordb) -> int:
+    try:
+        if isinstance(vectordb, LocalANNStore):
+            # Vectors are mmap'd, not resident; only the per-chunk bookkeeping counts
+            return vectordb.count() * _LOCAL_BYTES_PER_CHUNK
+        return vectordb._collection.count() * _BYTES_PER_CHUNK
+    except Exception:
+        return 0
+
+
+_vectorstore_cache = LRUCache(
+    "vectorstores",
+    max_entries=VECTORSTORE_CACHE_SIZE,
+    ttl=VECTORSTORE_CACHE_TTL,
+    max_bytes=VECTORSTORE_CACHE_MAX_MB * 1024 * 1024,
+    sizeof=_estimate_vectorstore_bytes,
+)
+
+
+@lazy("embeddings")
+def get_embeddings() -> CachedEmbeddings:
+    return CachedEmbeddings(OpenAIEmbeddings(), EmbeddingStore())
+
+
+def get_collection_version(user_id: str) -> int:
+    return _collection_versions.get(user_id, 0)
+
+
+def on_collection_change(callback: Callable[[str, int], None]):
+    """Register callback(user_id, new_version), called whenever a user's collection is modified."""
+    _collection_listeners.append(callback)
+    return callback
+
+
+def _bump_collection_version(user_id: str) -> int:
+    with _versions_lock:
+        version = _collection_versions.get(user_id, 0) + 1
+        _collection_versions[user_id] = version
+    for callback in _collection_listeners:
+        try:
+            callback(user_id, version)
+        except Exception as e:
+            logger.warning(f"Collection change listener failed for user_{user_id}: {e}")
+    return version
+
+
 def load_and_split_pdf(file_path: str) -> List[Document]:
     loader = PyPDFLoader(file_path)
     docs = loader.load()
     splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
     return splitter.split_documents(docs)
 
-def embed_and_store(split_docs: List[Document], user_id: str) -> Chroma:
+def count_pdf_pages(file_path: str) -> int:
+    return len(PdfReader(file_path).pages)
+
+def load_and_split_pdf_pages(file_path: str, start: int, end: int, source: Optional[str] = None) -> List[Document]:
+    """Parse and split pages [start, end) only, so large PDFs can be processed in parallel slices."""
+    reader = PdfReader(file_path)
+    docs = [
+        Document(
+            page_content=reader.pages[page].extract_text() or "",
+            metadata={"source": source or file_path, "page": page}
+        )
+        for page in range(start, min(end, len(reader.pages)))
+    ]
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    return splitter.split_documents(docs)
+
+def embed_and_store(split_docs: List[Document], user_id: str, ids: Optional[List[str]] = None):
     os.makedirs(CHROMA_DIR, exist_ok=True)
-    embeddings = OpenAIEmbeddings()
+    vectordb = get_vectorstore(user_id)
+    # Stable ids keep Chroma and the lexical index addressing the same chunks
+    ids = ids or assign_chunk_ids(split_docs)
 
-    vectordb = Chroma(
-        persist_directory=CHROMA_DIR,
-        embedding_function=embeddings,
-        collection_name=f"user_{user_id}"
-    )
+    # With ids, Chroma upserts, so re-sent chunks replace themselves instead of duplicating
+    with track_embedding_stats() as stats:
+        vectordb.add_documents(split_docs, ids=ids)
+    ensure_lexical_index(user_id).add(ids, split_docs)
 
-    vectordb.add_documents(split_docs)
+    # Bumping the version invalidates chains/answers cached against the old collection
+    version = _bump_collection_version(user_id)
+    # Re-insert so the memory estimate reflects the new collection size
+    _vectorstore_cache.set(user_id, vectordb)
 
-    logger.info(f"✅ Embedded {len(split_docs)} docs to user_{user_id}'s Chroma collection.")
+    logger.info(
+        f"✅ Embedded {len(split_docs)} docs to user_{user_id}'s {VECTOR_BACKEND} collection (version {version}), "
+        f"embedding cache hit rate {hit_rate(stats):.0%} ({stats['hits']} hits, {stats['misses']} misses)."
+    )
     return vectordb
 
-def get_vectorstore(user_id: str) -> Chroma:
-    embeddings = OpenAIEmbeddings()
-    vectordb = Chroma(
+def delete_chunks(user_id: str, ids: List[str]):
+    if not ids:
+        return
+    vectordb = get_vectorstore(user_id)
+    vectordb.delete(ids=ids)
+    ensure_lexical_index(user_id).remove(ids)
+    version = _bump_collection_version(user_id)
+    _vectorstore_cache.set(user_id, vectordb)
+    logger.info(f"🗑️ Removed {len(ids)} chunks from user_{user_id}'s {VECTOR_BACKEND} collection (version {version}).")
+
+def delete_document(user_id: str, doc_id: str) -> bool:
+    registry = get_registry()
+    if registry.get_document(user_id, doc_id) is None:
+        return False
+    delete_chunks(user_id, list(registry.get_chunk_ids(user_id, doc_id)))
+    registry.delete_document(user_id, doc_id)
+    return True
+
+def _open_vectorstore(user_id: str):
+    if VECTOR_BACKEND == "local":
+        return LocalANNStore(local_store_directory(user_id), get_embeddings())
+    return Chroma(
         persist_directory=CHROMA_DIR,
-        embedding_function=embeddings,
+        embedding_function=get_embeddings(),
         collection_name=f"user_{user_id}"
     )
-    return vectordb
+
+def get_vectorstore(user_id: str):
+    """The user's vector store: a Chroma collection, or a LocalANNStore with VECTOR_BACKEND=local."""
+    return _vectorstore_cache.get_or_create(user_id, lambda: _open_vectorstore(user_id))
+
+def ensure_lexical_index(user_id: str) -> LexicalIndex:
+    """The user's BM25 index, backfilled from Chroma for collections that predate it."""
+    if user_id in _lexical_ready:
+        return get_lexical_index(user_id)
+    with _lexical_backfill_lock:
+        index = get_lexical_index(user_id, create=False)
+        if index is None:
+            index = get_lexical_index(user_id)
+            existing = get_vectorstore(user_id).get(include=["documents", "metadatas"])
+            if existing["ids"]:
+                docs = [
+                    Document(page_content=text or "", metadata=metadata or {})
+                    for text, metadata in zip(existing["documents"], existing["metadatas"])
+                ]
+                index.add(existing["ids"], docs)
+                logger.info(f"Backfilled lexical index for user_{user_id} with {len(docs)} chunks")
+        _lexical_ready.add(user_id)
+        return index
+
+def get_vectorstore_cache_stats() -> dict:
+    return _vectorstore_cache.stats()
+
+def get_embedding_cache_stats() -> dict:
+    # Monitoring must not build the OpenAI client (or fail without an API key)
+    if not get_embeddings.initialized:
+        return {"initialized": False}
+    return get_embeddings().stats()
@@ -0,0 +1,197 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from typing import Callable, Optional, Tuple
+
+from app.cache import LRUCache, SingleFlight
+from app.lazy import lazy
+from app.metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "4096"))
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "3600"))
+WIKIPEDIA_CACHE_TTL = float(os.getenv("WIKIPEDIA_CACHE_TTL", str(24 * 3600)))
+# Failures (rate limits, timeouts) are remembered briefly so agent loops don't hammer the provider
+SEARCH_NEGATIVE_TTL = float(os.getenv("SEARCH_NEGATIVE_TTL", "60"))
+# Successful results are also written to SQLite, so a restarted worker starts warm
+SEARCH_CACHE_DISK = os.getenv("SEARCH_CACHE_DISK", "1") == "1"
+SEARCH_CACHE_PATH = os.getenv("SEARCH_CACHE_PATH", "search_cache.sqlite3")
+SEARCH_CACHE_DISK_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_DISK_MAX_ENTRIES", "100000"))
+
+
+class SearchFailed(Exception):
+    """A provider failure, possibly replayed from the negative cache."""
+
+
+def normalize_query(query: str) -> str:
+    # Milder than answer_cache.normalize_question: punctuation inside a query ("c++", "3.11") matters
+    return re.sub(r"\s+", " ", query.lower()).strip(" \t\"'?!.,;:")
+
+
+# --- Disk tier ---
+class SearchResultStore:
+    """SQLite copy of successful results; rows past their expiry are ignored and purged."""
+
+    def __init__(self, path: str = SEARCH_CACHE_PATH, max_entries: int = SEARCH_CACHE_DISK_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS results (
+                tool TEXT NOT NULL,
+                query TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (tool, query)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_expiry ON results(expires_at)")
+        self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def get(self, tool: str, query: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM results WHERE tool = ? AND query = ? AND expires_at > ?",
+                (tool, query, time.time()),
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def put(self, tool: str, query: str, value: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (tool, query, value, expires_at) VALUES (?, ?, ?, ?)",
+                (tool, query, value, expires_at),
+            )
+            self._count += 1
+            if self._count > self.max_entries:
+                self._trim()
+            self._conn.commit()
+
+    def _trim(self):
+        # Expired rows first, then the ones closest to expiry, down to 90% of the cap
+        self._conn.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+        excess = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0] - int(self.max_entries * 0.9)
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM results WHERE rowid IN (SELECT rowid FROM results ORDER BY expires_at LIMIT ?)", (excess,)
+            )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"path": self.path, "entries": self._count, "max_entries": self.max_entries}
+
+
+# --- Cache ---
+class SearchCache:
+    """Search results keyed by (tool, normalized query): memory LRU, optional disk tier, singleflight.
+
+    Entries expire a fixed time after they were fetched (not after last use): search results go stale.
+    """
+
+    def __init__(self, max_entries: int = SEARCH_CACHE_SIZE, negative_ttl: float = SEARCH_NEGATIVE_TTL,
+                 store: Optional[SearchResultStore] = None):
+        self.negative_ttl = negative_ttl
+        self.store = store
+        # key -> (value, ok, expires_at); expiry is checked here, the LRU only bounds the size
+        self._memory = LRUCache("search_results", max_entries=max_entries)
+        self._flight = SingleFlight()
+        self.counters = {"hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0, "failures": 0}
+        self._counter_lock = threading.Lock()
+
+    def _count(self, counter: str, tool: str, result: str):
+        with self._counter_lock:
+            self.counters[counter] += 1
+        record_cache(tool, result)
+
+    def _lookup(self, tool: str, query: str) -> Optional[Tuple[str, bool]]:
+        key = (tool, query)
+        entry = self._memory.get(key)
+        if entry is not None:
+            value, ok, expires_at = entry
+            if time.time() < expires_at:
+                self._count("hits" if ok else "negative_hits", tool, "hit" if ok else "negative")
+                return value, ok
+            self._memory.pop(key)
+        if self.store is not None:
+            try:
+                row = self.store.get(tool, query)
+            except Exception as e:
+                logger.warning(f"Search cache disk read failed: {e}")
+                row = None
+            if row is not None:
+                value, expires_at = row
+                self._memory.set(key, (value, True, expires_at))
+                self._count("disk_hits", tool, "disk")
+                return value, True
+        return None
+
+    def get_or_fetch(self, tool: str, query: str, fetch: Callable[[], str], ttl: float) -> str:
+        """Cached result, or fetch() once for all concurrent callers. Raises SearchFailed on (cached) failure."""
+        normalized = normalize_query(query)
+        cached = self._lookup(tool, normalized)
+        if cached is None:
+            cached = self._flight.do((tool, normalized), lambda: self._fetch(tool, normalized, fetch, ttl))
+        value, ok = cached
+        if not ok:
+            raise SearchFailed(value)
+        return value
+
+    def _fetch(self, tool: str, query: str, fetch: Callable[[], str], ttl: float) -> Tuple[str, bool]:
+        # A caller that waited on the previous flight may find the result already cached
+        cached = self._lookup(tool, query)
+        if cached is not None:
+            return cached
+        self._count("misses", tool, "miss")
+        try:
+            value = fetch()
+        except Exception as e:
+            with self._counter_lock:
+                self.counters["failures"] += 1
+            logger.warning(f"{tool} failed for {query!r}, caching the failure for {self.negative_ttl:.0f}s: {e}")
+            self._memory.set((tool, query), (str(e), False, time.time() + self.negative_ttl))
+            return str(e), False
+
+        expires_at = time.time() + ttl
+        self._memory.set((tool, query), (value, True, expires_at))
+        if self.store is not None:
+            try:
+                self.store.put(tool, query, value, expires_at)
+            except Exception as e:
+                logger.warning(f"Search cache disk write failed: {e}")
+        return value, True
+
+    def stats(self) -> dict:
+        with self._counter_lock:
+            counters = dict(self.counters)
+        lookups = counters["hits"] + counters["disk_hits"] + counters["negative_hits"] + counters["misses"]
+        hits = lookups - counters["misses"]
+        return {
+            **counters,
+            "coalesced": self._flight.coalesced,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "memory": self._memory.stats(),
+            "disk": self.store.stats() if self.store is not None else None,
+        }
+
+
+@lazy("search_cache")
+def get_search_cache() -> SearchCache:
+    store = None
+    if SEARCH_CACHE_DISK:
+        try:
+            store = SearchResultStore()
+        except Exception as e:
+            logger.warning(f"Search cache disk tier disabled: {e}")
+    return SearchCache(store=store)
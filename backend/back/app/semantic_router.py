@@ -0,0 +1,153 @@
+import os
+import math
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+from app.rag_logic import get_embeddings
+from app.lazy import lazy
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+ROUTER_THRESHOLD = float(os.getenv("ROUTER_THRESHOLD", "0.80"))
+# Top route must beat the runner-up by this much, otherwise the keyword rules decide
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", "0.01"))
+FALLBACK_ROUTE = "fallback"
+RESEARCH_KEYWORDS = ("search", "latest", "news", "wikipedia", "online")
+
+# --- Route Exemplars ---
+ROUTE_EXEMPLARS: Dict[str, List[str]] = {
+    "documents": [
+        "What does the uploaded PDF say about the refund policy?",
+        "Summarize the document I uploaded",
+        "What is this pdf about?",
+        "According to the document, who signed the contract?",
+        "Find the section about termination in my file",
+        "What are the key points of the report I uploaded?",
+        "Quote the paragraph that mentions the warranty",
+    ],
+    "csv": [
+        "What is the total revenue in the csv?",
+        "Average price by region in my spreadsheet",
+        "Analyze the sales data file",
+        "Which product has the highest sales in the dataset?",
+        "How many rows are in the csv file?",
+        "Plot monthly totals from the data table",
+    ],
+    "voice": [
+        "Transcribe this audio file",
+        "Convert this text to speech",
+        "What is said in the recording?",
+        "Read this summary out loud",
+        "Turn my voice memo into text",
+    ],
+    "calendar": [
+        "Schedule a meeting tomorrow at 10am",
+        "Add an event to my calendar on Friday from 2 to 3pm",
+        "Book a call with the team next Monday",
+        "Create a calendar invite for the project review",
+        "Set up a meeting for 2025-07-11T10:00",
+    ],
+    "research": [
+        "Search the web for the latest news on electric cars",
+        "Look up the population of Nepal on Wikipedia",
+        "Find recent articles about LangChain and email me a summary",
+        "Who won the 2022 world cup?",
+        "Research the history of the Eiffel Tower",
+    ],
+    "fallback": [
+        "Hello, how are you?",
+        "Tell me a joke",
+        "Help me write a short poem",
+        "What can you do?",
+        "Thanks, that was helpful",
+    ],
+}
+
+
+def keyword_route(prompt: str) -> str:
+    """Original substring rules, kept as the low-confidence fallback."""
+    prompt = prompt.lower()
+    if "csv" in prompt:
+        return "csv"
+    elif "transcribe" in prompt or "audio" in prompt:
+        return "voice"
+    elif "calendar" in prompt or ("schedule" in prompt and "meeting" in prompt):
+        return "calendar"
+    elif "pdf" in prompt or "document" in prompt:
+        return "documents"
+    elif any(word in prompt for word in RESEARCH_KEYWORDS):
+        # Without this, low-confidence web questions went to the full fallback agent
+        return "research"
+    return FALLBACK_ROUTE
+
+
+def _normalize(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _dot(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+class SemanticRouter:
+    """Nearest-centroid router over embedded route exemplars with a keyword fallback."""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        exemplars: Dict[str, List[str]] = ROUTE_EXEMPLARS,
+        threshold: float = ROUTER_THRESHOLD,
+        margin: float = ROUTER_MARGIN,
+    ):
+        self.embeddings = embeddings
+        self.exemplars = exemplars
+        self.threshold = threshold
+        self.margin = margin
+        self._centroids: Optional[Dict[str, List[float]]] = None
+        self._lock = threading.Lock()
+
+    def centroids(self) -> Dict[str, List[float]]:
+        if self._centroids is None:
+            with self._lock:
+                if self._centroids is None:
+                    start = time.perf_counter()
+                    centroids = {}
+                    for route, texts in self.exemplars.items():
+                        vectors = [_normalize(v) for v in self.embeddings.embed_documents(texts)]
+                        mean = [sum(column) / len(vectors) for column in zip(*vectors)]
+                        centroids[route] = _normalize(mean)
+                    self._centroids = centroids
+                    logger.info(f"Router centroids built in {time.perf_counter() - start:.2f}s")
+        return self._centroids
+
+    def scores(self, query: str) -> List[Tuple[str, float]]:
+        query_vector = _normalize(self.embeddings.embed_query(query))
+        scored = [(route, _dot(query_vector, centroid)) for route, centroid in self.centroids().items()]
+        return sorted(scored, key=lambda item: item[1], reverse=True)
+
+    def classify(self, query: str) -> dict:
+        try:
+            scored = self.scores(query)
+        except Exception as e:
+            logger.warning(f"Semantic routing failed, using keywords: {e}")
+            return {"route": keyword_route(query), "confidence": 0.0, "method": "keyword"}
+
+        (best, best_score), (_, runner_up) = scored[0], scored[1]
+        if best_score >= self.threshold and best_score - runner_up >= self.margin:
+            return {"route": best, "confidence": round(best_score, 4), "method": "semantic"}
+        return {"route": keyword_route(query), "confidence": round(best_score, 4), "method": "keyword"}
+
+
+@lazy("semantic_router")
+def get_semantic_router() -> SemanticRouter:
+    router = SemanticRouter(get_embeddings())
+    try:
+        router.centroids()  # embed the exemplars up front so the first request doesn't pay for it
+    except Exception as e:
+        logger.warning(f"Could not build router centroids yet, keyword routing until they succeed: {e}")
+    return router
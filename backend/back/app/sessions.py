@@ -0,0 +1,248 @@
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.cache import LRUCache
+from app.executors import get_thread_pool
+from app.lazy import lazy
+from app.tokens import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.sqlite3")
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "3600"))
+# Verbatim turns sent with each prompt, newest first, up to this many tokens
+SESSION_WINDOW_TOKENS = int(os.getenv("SESSION_WINDOW_TOKENS", "1200"))
+# Compact once this many tokens have fallen out of the window, so summaries are batched
+SESSION_COMPACT_TOKENS = int(os.getenv("SESSION_COMPACT_TOKENS", "600"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "300"))
+
+# Questions that lean on earlier turns ("why?", "and in Germany?", "tell me more about it")
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(?:it|its|they|them|their|these|those|he|him|his|she|her|that one|this one|the same|"
+    r"what about|how about|what else|anything else|tell me more|more about|more detail|elaborate|"
+    r"above|previous|previously|earlier|before that|last answer|you said|you mentioned|again|instead)\b"
+    r"|^(?:and|but|so|also|why|then)\b|\b(?:that|this|there|then)\W*$"
+)
+# One- and two-word questions only make sense against what came before
+FOLLOW_UP_MAX_WORDS = 2
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant.
+Keep facts, names, numbers, decisions and open questions the user may refer back to. Be concise.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}
+
+Updated summary:"""
+
+
+def is_follow_up(question: str) -> bool:
+    text = question.lower().strip()
+    return len(re.findall(r"\w+", text)) <= FOLLOW_UP_MAX_WORDS or bool(FOLLOW_UP_PATTERN.search(text))
+
+
+@dataclass
+class Turn:
+    seq: int
+    role: str  # "user" or "assistant"
+    content: str
+    tokens: int
+
+
+@dataclass
+class Session:
+    user_id: str
+    summary: str = ""
+    turns: List[Turn] = field(default_factory=list)  # not yet summarized, oldest first
+    next_seq: int = 0
+    compacting: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    def window(self, budget: int = SESSION_WINDOW_TOKENS) -> Tuple[List[Turn], List[Turn]]:
+        """Split turns into (older, window): window is the newest turns fitting in budget."""
+        used = 0
+        start = len(self.turns)
+        while start > 0 and used + self.turns[start - 1].tokens <= budget:
+            used += self.turns[start - 1].tokens
+            start -= 1
+        return self.turns[:start], self.turns[start:]
+
+
+@lazy("session_summarizer")
+def session_summarizer():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-3.5-turbo", temperature=0, max_tokens=SESSION_SUMMARY_TOKENS)
+
+
+def summarize_turns(summary: str, turns: List[Turn]) -> str:
+    text = "\n".join(f"{turn.role.capitalize()}: {turn.content}" for turn in turns)
+    response = session_summarizer().invoke(SUMMARY_PROMPT.format(summary=summary or "(none)", turns=text))
+    return response.content.strip()
+
+
+class SessionStore:
+    """Per-user conversation memory: hot sessions in an LRU, everything persisted to SQLite.
+
+    Prompts get the running summary plus a token-budgeted window of recent turns, so their
+    size stays roughly constant; turns that fall out of the window are folded into the
+    summary by a background job.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH,
+                 summarizer: Callable[[str, List[Turn]], str] = summarize_turns):
+        self.path = path
+        self.summarizer = summarizer
+        self.compactions = 0
+        self._cache = LRUCache("sessions", max_entries=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                user_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL DEFAULT '',
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS turns (
+                user_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                PRIMARY KEY (user_id, seq)
+            );
+            """
+        )
+        self._conn.commit()
+
+    def _load(self, user_id: str) -> Session:
+        with self._lock:
+            row = self._conn.execute("SELECT summary FROM sessions WHERE user_id = ?", (user_id,)).fetchone()
+            rows = self._conn.execute(
+                "SELECT seq, role, content, tokens FROM turns WHERE user_id = ? ORDER BY seq", (user_id,)
+            ).fetchall()
+        turns = [Turn(*r) for r in rows]
+        return Session(user_id=user_id, summary=row[0] if row else "",
+                       turns=turns, next_seq=turns[-1].seq + 1 if turns else 0)
+
+    def get(self, user_id: str) -> Session:
+        return self._cache.get_or_create(user_id, lambda: self._load(user_id))
+
+    # --- Reading ---
+    def history(self, user_id: str) -> Tuple[str, List[Turn]]:
+        session = self.get(user_id)
+        with session.lock:
+            _, window = session.window()
+            return session.summary, list(window)
+
+    def history_messages(self, user_id: str) -> List[BaseMessage]:
+        """Summary + recent turns as chat messages, for agent prompts with a chat_history slot."""
+        summary, window = self.history(user_id)
+        messages: List[BaseMessage] = []
+        if summary:
+            messages.append(SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+        for turn in window:
+            messages.append(HumanMessage(content=turn.content) if turn.role == "user" else AIMessage(content=turn.content))
+        return messages
+
+    def history_text(self, user_id: str) -> str:
+        summary, window = self.history(user_id)
+        lines = [f"Summary of earlier conversation: {summary}"] if summary else []
+        lines += [f"{turn.role.capitalize()}: {turn.content}" for turn in window]
+        return "\n".join(lines)
+
+    def depends_on_history(self, user_id: str, question: str) -> bool:
+        """Whether the answer to `question` is specific to this conversation (a follow-up)."""
+        summary, window = self.history(user_id)
+        return bool(summary or window) and is_follow_up(question)
+
+    # --- Writing ---
+    def append_turn(self, user_id: str, question: str, answer: str):
+        session = self.get(user_id)
+        now = time.time()
+        with session.lock:
+            new_turns = []
+            for role, content in (("user", question), ("assistant", answer)):
+                new_turns.append(Turn(session.next_seq, role, content, count_tokens(content)))
+                session.next_seq += 1
+            session.turns.extend(new_turns)
+            older, _ = session.window()
+            should_compact = not session.compacting and sum(t.tokens for t in older) >= SESSION_COMPACT_TOKENS
+            if should_compact:
+                session.compacting = True
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO sessions (user_id, summary, updated_at) VALUES (?, '', ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (user_id, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO turns (user_id, seq, role, content, tokens) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, t.seq, t.role, t.content, t.tokens) for t in new_turns],
+            )
+            self._conn.commit()
+        if should_compact:
+            # Off the request path: the window already bounds the prompt until the summary lands
+            get_thread_pool().submit(self._compact, session)
+
+    def _compact(self, session: Session):
+        try:
+            with session.lock:
+                older, _ = session.window()
+                summary = session.summary
+            if not older:
+                return
+            started = time.perf_counter()
+            new_summary = self.summarizer(summary, older)
+            last_seq = older[-1].seq
+            with session.lock:
+                session.summary = new_summary
+                session.turns = [t for t in session.turns if t.seq > last_seq]
+            with self._lock:
+                self._conn.execute("UPDATE sessions SET summary = ?, updated_at = ? WHERE user_id = ?",
+                                   (new_summary, time.time(), session.user_id))
+                self._conn.execute("DELETE FROM turns WHERE user_id = ? AND seq <= ?", (session.user_id, last_seq))
+                self._conn.commit()
+            self.compactions += 1
+            logger.info(f"[{session.user_id}] Compacted {len(older)} turns "
+                        f"({sum(t.tokens for t in older)} tokens) in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.warning(f"[{session.user_id}] Session compaction failed: {e}")
+        finally:
+            session.compacting = False
+
+    def clear(self, user_id: str):
+        self._cache.pop(user_id)
+        with self._lock:
+            self._conn.execute("DELETE FROM turns WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {**self._cache.stats(), "compactions": self.compactions}
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+    return _store
@@ -0,0 +1,76 @@
+import json
+import logging
+from typing import AsyncIterator, Dict, Any
+
+from app.answer_cache import answer_cache
+from app.executors import run_in_thread
+from app.rag_logic import get_collection_version
+from app.sessions import get_session_store
+
+logger = logging.getLogger(__name__)
+
+# Tool inputs/outputs can be whole documents; keep events small for the client
+MAX_EVENT_PAYLOAD_CHARS = 500
+
+
+def _truncate(value: Any) -> str:
+    text = value if isinstance(value, str) else str(value)
+    if len(text) > MAX_EVENT_PAYLOAD_CHARS:
+        return text[:MAX_EVENT_PAYLOAD_CHARS] + "..."
+    return text
+
+
+def _final_answer(output: Any) -> str:
+    if isinstance(output, dict):
+        return output.get("result") or output.get("output") or "Sorry, no answer found."
+    return str(output)
+
+
+async def stream_chat_events(question: str, user_id: str, router) -> AsyncIterator[Dict[str, Any]]:
+    """Yield token, tool_start, tool_end and final events for one chat turn."""
+    sessions = get_session_store()
+    # Follow-ups depend on this conversation, so they skip the answer cache both ways
+    cacheable = not await run_in_thread(sessions.depends_on_history, user_id, question)
+    cached = await run_in_thread(answer_cache.lookup, user_id, question) if cacheable else None
+    if cached is not None:
+        await run_in_thread(sessions.append_turn, user_id, question, cached["answer"])
+        yield {"type": "route", "route": cached.get("route"), "confidence": None, "cache": cached["cache"]}
+        yield {"type": "final", "answer": cached["answer"]}
+        return
+
+    version = get_collection_version(user_id)
+    answer = route = None
+    tools_used = []
+    try:
+        async for event in router.astream_events({"input": question, "user_id": user_id}, version="v2"):
+            kind = event["event"]
+            if kind == "on_chain_end" and event["name"] == "classify":
+                decision = event["data"].get("output") or {}
+                route = decision.get("route")
+                yield {"type": "route", "route": decision.get("route"), "confidence": decision.get("route_confidence")}
+            elif kind == "on_chat_model_stream":
+                token = event["data"]["chunk"].content
+                if token:
+                    yield {"type": "token", "content": token}
+            elif kind == "on_tool_start":
+                tools_used.append(event["name"])
+                yield {"type": "tool_start", "tool": event["name"], "input": _truncate(event["data"].get("input", ""))}
+            elif kind == "on_tool_end":
+                yield {"type": "tool_end", "tool": event["name"], "output": _truncate(event["data"].get("output", ""))}
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                answer = _final_answer(event["data"].get("output"))
+    except Exception as e:
+        logger.error(f"[{user_id}] Streaming chat error: {e}")
+        yield {"type": "error", "error": str(e)}
+        return
+
+    if answer:
+        if cacheable:
+            result = {"answer": answer, "route": route, "tools": tools_used}
+            await run_in_thread(answer_cache.store, user_id, question, result, version)
+        await run_in_thread(sessions.append_turn, user_id, question, answer)
+    yield {"type": "final", "answer": answer or "Sorry, no answer found."}
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
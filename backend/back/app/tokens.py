@@ -0,0 +1,25 @@
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# gpt-3.5-turbo and text-embedding-ada-002 both use cl100k_base
+TOKEN_ENCODING = "cl100k_base"
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        # The encoding file is downloaded on first use; offline we fall back to an estimate
+        logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
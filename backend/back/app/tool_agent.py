@@ -0,0 +1,197 @@
+import os
+import time
+import asyncio
+import logging
+import operator
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Annotated, Any, Dict, List, Optional, Sequence, TypedDict
+
+from langgraph.graph import StateGraph, END
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableConfig, RunnableLambda
+from langchain_core.tools import BaseTool
+from app.metrics import stage
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Tool calls from one model turn run at most this many at a time
+TOOL_CONCURRENCY = int(os.getenv("TOOL_CONCURRENCY", "4"))
+TOOL_TIMEOUT_SECONDS = float(os.getenv("TOOL_TIMEOUT_SECONDS", "30"))
+# Per-tool overrides, e.g. TOOL_TIMEOUTS="web_search=10,transcribe_audio=300"
+DEFAULT_TOOL_TIMEOUTS = {"transcribe_audio": 300.0, "analyze_csv": 120.0, "create_events": 120.0}
+# Each iteration is two graph steps (model, tools); keep 2 * max + 1 within LangGraph's recursion limit
+AGENT_MAX_ITERATIONS = int(os.getenv("AGENT_MAX_ITERATIONS", "10"))
+
+
+def _parse_timeouts(spec: str) -> Dict[str, float]:
+    timeouts = dict(DEFAULT_TOOL_TIMEOUTS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, seconds = item.partition("=")
+        try:
+            timeouts[name.strip()] = float(seconds)
+        except ValueError:
+            logger.warning(f"Ignoring invalid TOOL_TIMEOUTS entry: {item!r}")
+    return timeouts
+
+
+TOOL_TIMEOUTS = _parse_timeouts(os.getenv("TOOL_TIMEOUTS", ""))
+
+
+def tool_timeout(name: str) -> float:
+    return TOOL_TIMEOUTS.get(name, TOOL_TIMEOUT_SECONDS)
+
+
+# --- State ---
+class ToolAgentState(TypedDict, total=False):
+    input: str
+    chat_history: List[BaseMessage]
+    # Model tool-call turns and their ToolMessages, fed back through the prompt's agent_scratchpad
+    scratchpad: Annotated[List[BaseMessage], operator.add]
+    iterations: int
+    output: str
+
+
+# --- Tool execution ---
+def _error_message(call: dict, text: str) -> ToolMessage:
+    return ToolMessage(content=text, tool_call_id=call["id"], name=call["name"])
+
+
+def _as_tool_message(call: dict, result: Any) -> ToolMessage:
+    if isinstance(result, ToolMessage):
+        return result
+    return ToolMessage(content=str(result), tool_call_id=call["id"], name=call["name"])
+
+
+async def arun_tool_calls(tools: Dict[str, BaseTool], calls: Sequence[dict],
+                          config: Optional[RunnableConfig] = None,
+                          concurrency: int = TOOL_CONCURRENCY) -> List[ToolMessage]:
+    """Run one turn's tool calls concurrently; results keep the order of `calls`.
+
+    A failed or timed-out call becomes an error ToolMessage so the model can react to it.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(call: dict) -> ToolMessage:
+        tool = tools.get(call["name"])
+        if tool is None:
+            return _error_message(call, f"Error: unknown tool {call['name']!r}")
+        timeout = tool_timeout(call["name"])
+        async with semaphore:
+            try:
+                # Passing the whole tool call gets argument parsing and a ToolMessage back, as ToolNode does
+                result = await asyncio.wait_for(tool.ainvoke({**call, "type": "tool_call"}, config), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Tool {call['name']} timed out after {timeout:.0f}s")
+                return _error_message(call, f"Error: {call['name']} timed out after {timeout:.0f}s")
+            except Exception as e:
+                logger.error(f"Tool {call['name']} failed: {e}")
+                return _error_message(call, f"Error: {e}")
+        return _as_tool_message(call, result)
+
+    return list(await asyncio.gather(*(run(call) for call in calls)))
+
+
+def run_tool_calls(tools: Dict[str, BaseTool], calls: Sequence[dict],
+                   config: Optional[RunnableConfig] = None,
+                   concurrency: int = TOOL_CONCURRENCY) -> List[ToolMessage]:
+    """Blocking variant for sync callers, on a short-lived pool of its own.
+
+    Not the shared app pool: sync agents usually already run on one of its threads,
+    and waiting on sibling tasks there can starve it.
+    """
+    if len(calls) == 1:
+        concurrency = 1
+    pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(calls))), thread_name_prefix="agent-tool")
+    try:
+        started = time.monotonic()
+        futures = []
+        for call in calls:
+            tool = tools.get(call["name"])
+            if tool is None:
+                futures.append(None)
+                continue
+            # Each call gets its own copy of the caller's context (request metrics trace)
+            ctx = contextvars.copy_context()
+            futures.append(pool.submit(ctx.run, tool.invoke, {**call, "type": "tool_call"}, config))
+
+        messages = []
+        for call, future in zip(calls, futures):
+            if future is None:
+                messages.append(_error_message(call, f"Error: unknown tool {call['name']!r}"))
+                continue
+            timeout = tool_timeout(call["name"])
+            try:
+                remaining = max(0.0, started + timeout - time.monotonic())
+                messages.append(_as_tool_message(call, future.result(timeout=remaining)))
+            except FutureTimeout:
+                logger.warning(f"Tool {call['name']} timed out after {timeout:.0f}s")
+                messages.append(_error_message(call, f"Error: {call['name']} timed out after {timeout:.0f}s"))
+            except Exception as e:
+                logger.error(f"Tool {call['name']} failed: {e}")
+                messages.append(_error_message(call, f"Error: {e}"))
+        return messages
+    finally:
+        # Timed-out tools keep their thread until they return; don't wait for them
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Graph ---
+def build_tool_agent(llm, tools: Sequence[BaseTool], prompt: ChatPromptTemplate,
+                     max_iterations: int = AGENT_MAX_ITERATIONS):
+    """Tool-calling agent as a LangGraph loop: model turn, then all of its tool calls at once.
+
+    Takes {"input", "chat_history"} and returns the final state; the answer is under "output".
+    `prompt` must have `input` and `agent_scratchpad` (and may have `chat_history`) variables.
+    """
+    tools_by_name = {tool.name: tool for tool in tools}
+    model = prompt | llm.bind_tools(list(tools))
+
+    def _prompt_inputs(state: ToolAgentState) -> dict:
+        return {
+            "input": state["input"],
+            "chat_history": state.get("chat_history") or [],
+            "agent_scratchpad": state.get("scratchpad") or [],
+        }
+
+    def _after_model(state: ToolAgentState, message: AIMessage) -> ToolAgentState:
+        iterations = state.get("iterations", 0)
+        if not message.tool_calls:
+            return {"output": message.content}
+        if iterations >= max_iterations:
+            return {"output": "Agent stopped due to max iterations."}
+        return {"scratchpad": [message], "iterations": iterations + 1}
+
+    def call_model(state: ToolAgentState, config: RunnableConfig = None) -> ToolAgentState:
+        return _after_model(state, model.invoke(_prompt_inputs(state), config=config))
+
+    async def acall_model(state: ToolAgentState, config: RunnableConfig = None) -> ToolAgentState:
+        return _after_model(state, await model.ainvoke(_prompt_inputs(state), config=config))
+
+    def _pending_calls(state: ToolAgentState) -> list:
+        calls = state["scratchpad"][-1].tool_calls
+        if len(calls) > 1:
+            logger.info(f"Running {len(calls)} tool calls concurrently: {', '.join(c['name'] for c in calls)}")
+        return calls
+
+    def call_tools(state: ToolAgentState, config: RunnableConfig = None) -> ToolAgentState:
+        with stage("tool_batch"):
+            return {"scratchpad": run_tool_calls(tools_by_name, _pending_calls(state), config)}
+
+    async def acall_tools(state: ToolAgentState, config: RunnableConfig = None) -> ToolAgentState:
+        # Wall time of a multi-tool turn is the slowest call's, not the sum
+        with stage("tool_batch"):
+            return {"scratchpad": await arun_tool_calls(tools_by_name, _pending_calls(state), config)}
+
+    def next_step(state: ToolAgentState) -> str:
+        return END if "output" in state else "tools"
+
+    graph = StateGraph(ToolAgentState)
+    graph.add_node("model", RunnableLambda(call_model, afunc=acall_model))
+    graph.add_node("tools", RunnableLambda(call_tools, afunc=acall_tools))
+    graph.set_entry_point("model")
+    graph.add_conditional_edges("model", next_step, {"tools": "tools", END: END})
+    graph.add_edge("tools", "model")
+    return graph.compile()
@@ -3,94 +3,122 @@ from langchain.tools import tool
 from langchain_community.tools.ddg_search import DuckDuckGoSearchRun
 from langchain_community.utilities import WikipediaAPIWrapper
 import pandas as pd
-from langchain_experimental.agents import create_csv_agent
+from langchain_experimental.agents import create_pandas_dataframe_agent
 from langchain_openai import ChatOpenAI
-import whisper
 import os
 import pyttsx3
 import datetime
-import pickle
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from google.auth.transport.requests import Request
-import base64
-from email.mime.text import MIMEText
+import json
 from openai import OpenAI
 import logging
 from dotenv import load_dotenv
+from app.lazy import lazy
+from app import google_clients
+from app.calendar_batch import normalize_event, insert_events
+from app.email_queue import get_email_queue
+from app.transcription import get_transcription_service
+from app.datasets import resolve_dataset
+from app.csv_query_engine import try_fast_answer
+from app.tts_cache import synthesize_cached
+from app.search_cache import get_search_cache, WEB_SEARCH_CACHE_TTL, WIKIPEDIA_CACHE_TTL
+from app.metrics import timed, metrics_handler, record_cache, record_tokens
 
 # --- ENV & SETUP ---
 load_dotenv()
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
 
-client = OpenAI()
-duckduckgo_search = DuckDuckGoSearchRun()
-wiki = WikipediaAPIWrapper()
-whisper_model = whisper.load_model("base")
+# Heavy clients/models are built on first use (or via /warmup), not at import time
+@lazy("openai_client")
+def client():
+    return OpenAI()
+
+@lazy("duckduckgo_search")
+def duckduckgo_search():
+    return DuckDuckGoSearchRun()
+
+@lazy("wikipedia")
+def wiki():
+    return WikipediaAPIWrapper()
 
 # === SEARCH TOOLS ===
 
 @tool("web_search")
+@timed("tool.web_search")
 def web_search(query: str) -> str:
     """Search the web using DuckDuckGo."""
     try:
         logger.info(f"Running web search for: {query}")
-        return duckduckgo_search.run(query)
+        # Repeated and concurrent identical queries (agent loops, other users) reuse one lookup
+        return get_search_cache().get_or_fetch(
+            "web_search", query, lambda: duckduckgo_search().run(query), ttl=WEB_SEARCH_CACHE_TTL
+        )
     except Exception as e:
         return f"Web search failed: {e}"
 
 @tool("wikipedia_search")
+@timed("tool.wikipedia_search")
 def wikipedia_search(query: str) -> str:
     """Search Wikipedia."""
     try:
         logger.info(f"Running Wikipedia search for: {query}")
-        return wiki.run(query)
+        return get_search_cache().get_or_fetch("wikipedia_search", query, lambda: wiki().run(query), ttl=WIKIPEDIA_CACHE_TTL)
     except Exception as e:
         return f"Wikipedia search failed: {e}"
 
 # === CSV TOOLS ===
 
+@lazy("csv_llm")
+def csv_llm():
+    return ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
+
+def answer_csv_question(file_path: str, question: str) -> dict:
+    """Answer from the pandas fast path when the question is a simple aggregate, else run the agent."""
+    df = resolve_dataset(file_path)
+    fast = try_fast_answer(question, df)
+    if fast is not None:
+        return fast
+    # The agent executes LLM-written code; a private copy keeps in-place edits out of the shared cached frame
+    agent = create_pandas_dataframe_agent(
+        csv_llm(), df.copy(), verbose=False, agent_type="openai-tools", allow_dangerous_code=True
+    )
+    # Inherited callbacks put the agent's LLM calls and tokens on the request's metrics
+    return {"answer": agent.run(question, callbacks=[metrics_handler]), "path": "agent"}
+
 @tool("analyze_csv")
+@timed("tool.analyze_csv")
 def analyze_csv(file_path: str, question: str) -> str:
-    """Analyze a CSV file and answer a question using GPT."""
+    """Analyze a CSV dataset (dataset id or CSV file path) and answer a question using GPT."""
     try:
         logger.info(f"Analyzing CSV: {file_path} with question: {question}")
-        llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0)
-        agent = create_csv_agent(llm, file_path, verbose=False, agent_type="openai-tools", allow_dangerous_code=True)
-        return agent.run(question)
+        # Served from the in-memory dataset cache; the CSV is only parsed once per upload
+        return answer_csv_question(file_path, question)["answer"]
     except Exception as e:
         return f"Failed to analyze CSV: {str(e)}"
 
 # === AUDIO TOOLS ===
 
 @tool("transcribe_audio")
+@timed("tool.transcribe_audio")
 def transcribe_audio(file_path: str) -> str:
     """Transcribe an audio file using Whisper."""
     try:
         logger.info(f"Transcribing audio: {file_path}")
-        result = whisper_model.transcribe(file_path)
-        return result["text"]
+        return get_transcription_service().transcribe_file(file_path)
     except Exception as e:
         return f"Transcription failed: {str(e)}"
     
-from gtts import gTTS
-
 @tool("text_to_speech")
-def text_to_speech(text: str) -> str:
+@timed("tool.text_to_speech")
+def text_to_speech(text: str, lang: str = "en") -> str:
     """Convert text to speech using gTTS and return path to MP3 file."""
     try:
         logger.info("Converting text to speech using gTTS")
-        UPLOAD_DIR = "temp_uploads"
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-
-        filename = "tts_output.mp3"
-        filepath = os.path.join(UPLOAD_DIR, filename)
-
-        tts = gTTS(text)
-        tts.save(filepath)
-
-        return f"/audio/{filename}"
+        # Content-addressed: each distinct text gets its own file, repeats skip synthesis
+        public_path, hit = synthesize_cached(text, lang=lang)
+        record_cache("tts", "hit" if hit else "miss")
+        logger.info(f"TTS {'cache hit' if hit else 'synthesized'}: {public_path}")
+        return public_path
     except Exception as e:
         logger.error(f"TTS failed: {e}")
         return f"TTS failed: {str(e)}"
@@ -99,51 +127,22 @@ def text_to_speech(text: str) -> str:
 
 # === CALENDAR TOOLS ===
 
-SCOPES_CALENDAR = ['https://www.googleapis.com/auth/calendar']
-
 def get_calendar_service():
-    creds = None
     try:
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token_file:
-                creds = pickle.load(token_file)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES_CALENDAR)
-                creds = flow.run_local_server(port=0)
-            with open('token.pickle', 'wb') as token_file:
-                pickle.dump(creds, token_file)
-        return build('calendar', 'v3', credentials=creds)
+        # Pooled client: credentials are refreshed ahead of expiry and discovery happens once
+        return google_clients.get_calendar_service()
     except Exception as e:
         logger.error(f"Google Calendar auth error: {e}")
         raise
 
 @tool("create_event")
+@timed("tool.create_event")
 def create_event(summary: str, description: str, start_time: str, end_time: str) -> str:
     """Create a calendar event."""
     try:
         logger.info("Creating calendar event")
 
-        # Fix datetime to include seconds if missing
-        if len(start_time) == 16:
-            start_time += ":00"
-        if len(end_time) == 16:
-            end_time += ":00"
-
-        event = {
-            'summary': summary,
-            'description': description,
-            'start': {
-                'dateTime': start_time,
-                'timeZone': 'Asia/Kathmandu'
-            },
-            'end': {
-                'dateTime': end_time,
-                'timeZone': 'Asia/Kathmandu'
-            }
-        }
+        event = normalize_event(summary, description, start_time, end_time)
 
         logger.info(f"Payload to Google Calendar: {event}")
         service = get_calendar_service()
@@ -154,7 +153,31 @@ def create_event(summary: str, description: str, start_time: str, end_time: str)
         return f"Failed to create event: {str(e)}"
 
 
+@tool("create_events")
+@timed("tool.create_events")
+def create_events(events_json: str) -> str:
+    """Create many calendar events at once. Input: JSON list of {summary, description, start_time, end_time}."""
+    try:
+        events = json.loads(events_json)
+        if isinstance(events, dict):
+            events = [events]
+        logger.info(f"Creating {len(events)} calendar events in bulk")
+        report = insert_events(events)
+        lines = [f"Created {report['created']} of {len(events)} events."]
+        for result in report["results"]:
+            if result["status"] == "created":
+                link = result.get("html_link") or f"already existed ({result['event_id']})"
+                lines.append(f"#{result['index']}: {link}")
+            else:
+                lines.append(f"#{result['index']}: {result['status']} - {result.get('error')}")
+        return "\n".join(lines)
+    except Exception as e:
+        logger.error(f"Failed to create events: {e}")
+        return f"Failed to create events: {str(e)}"
+
+
 @tool("list_upcoming_events")
+@timed("tool.list_upcoming_events")
 def list_upcoming_events(max_events: int = 5) -> str:
     """List upcoming calendar events."""
     try:
@@ -180,39 +203,15 @@ def list_upcoming_events(max_events: int = 5) -> str:
 
 # === EMAIL TOOLS ===
 
-SCOPES_GMAIL = ['https://www.googleapis.com/auth/gmail.send']
-
-def get_gmail_service():
-    creds = None
-    try:
-        if os.path.exists('token.pickle'):
-            with open('token.pickle', 'rb') as token_file:
-                creds = pickle.load(token_file)
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                creds.refresh(Request())
-            else:
-                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES_GMAIL)
-                creds = flow.run_local_server(port=0)
-            with open('token.pickle', 'wb') as token_file:
-                pickle.dump(creds, token_file)
-        return build('gmail', 'v1', credentials=creds)
-    except Exception as e:
-        logger.error(f"Gmail auth error: {e}")
-        raise
-
 @tool("send_email")
+@timed("tool.send_email")
 def send_email(to: str, subject: str, message_body: str) -> str:
     """Send an email with subject and body using Gmail API."""
     try:
-        logger.info(f"Sending email to {to}")
-        service = get_gmail_service()
-        message = MIMEText(message_body)
-        message['to'] = to
-        message['subject'] = subject
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        send_message = service.users().messages().send(userId='me', body={'raw': raw_message}).execute()
-        return f"Email sent successfully! ID: {send_message['id']}"
+        # Delivery happens in the background outbox workers; the agent doesn't wait on Gmail
+        message_id = get_email_queue().enqueue(to, subject, message_body)
+        logger.info(f"Queued email to {to} ({message_id})")
+        return f"Email queued for delivery! ID: {message_id}"
     except Exception as e:
         return f"Failed to send email: {str(e)}"
 
@@ -231,6 +230,7 @@ def send_email_wrapper(arg: str) -> str:
 # === SUMMARIZATION TOOL ===
 
 @tool("summarize_text")
+@timed("tool.summarize_text")
 def summarize_text(text: str) -> str:
     """Summarize long text using GPT-3.5-turbo."""
     try:
@@ -239,12 +239,15 @@ def summarize_text(text: str) -> str:
             {"role": "system", "content": "You are a helpful assistant that summarizes texts concisely."},
             {"role": "user", "content": f"Summarize this:\n{text}"}
         ]
-        response = client.chat.completions.create(
+        response = client().chat.completions.create(
             model="gpt-3.5-turbo",
             messages=messages,
             max_tokens=150,
             temperature=0.5
         )
+        usage = getattr(response, "usage", None)
+        if usage:
+            record_tokens("gpt-3.5-turbo", usage.prompt_tokens, usage.completion_tokens)
         return response.choices[0].message.content.strip()
     except Exception as e:
         return f"Summarization failed: {str(e)}"
@@ -0,0 +1,207 @@
+import os
+import asyncio
+import logging
+import subprocess
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import AsyncIterator, List, Tuple
+
+import numpy as np
+
+from app.lazy import lazy
+from app.executors import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base")
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "1"))
+TRANSCRIBE_MAX_PENDING = int(os.getenv("TRANSCRIBE_MAX_PENDING", "8"))
+# Whisper decodes 30 s windows; cutting near that keeps each segment a single forward pass
+TRANSCRIBE_SEGMENT_SECONDS = float(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", "30"))
+# How far back from the target cut we look for a quiet frame to split on
+TRANSCRIBE_SILENCE_SEARCH_SECONDS = float(os.getenv("TRANSCRIBE_SILENCE_SEARCH_SECONDS", "5"))
+
+SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03
+
+
+class TranscriptionBusyError(Exception):
+    pass
+
+
+# --- Audio helpers ---
+def load_audio(file_path: str) -> np.ndarray:
+    """Decode any ffmpeg-readable file to mono 16 kHz float32, the same way whisper.load_audio does."""
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", file_path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-",
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Failed to load audio: {e.stderr.decode(errors='ignore')}") from e
+    return np.frombuffer(out, np.int16).flatten().astype(np.float32) / 32768.0
+
+
+def split_on_silence(audio: np.ndarray, segment_seconds: float = TRANSCRIBE_SEGMENT_SECONDS,
+                     search_seconds: float = TRANSCRIBE_SILENCE_SEARCH_SECONDS) -> List[Tuple[int, int]]:
+    """Return (start, end) sample ranges of at most segment_seconds, cut at the quietest nearby frame."""
+    max_len = int(segment_seconds * SAMPLE_RATE)
+    if len(audio) <= max_len:
+        return [(0, len(audio))]
+
+    frame = int(FRAME_SECONDS * SAMPLE_RATE)
+    n_frames = len(audio) // frame
+    energy = np.sqrt(np.mean(audio[:n_frames * frame].reshape(n_frames, frame) ** 2, axis=1))
+
+    search = int(search_seconds * SAMPLE_RATE)
+    segments = []
+    start = 0
+    while len(audio) - start > max_len:
+        target = start + max_len
+        lo_frame = max(start, target - search) // frame
+        hi_frame = min(target // frame, n_frames)
+        if hi_frame > lo_frame:
+            cut = (lo_frame + int(np.argmin(energy[lo_frame:hi_frame]))) * frame
+        else:
+            cut = target
+        cut = max(cut, start + frame)  # always make progress
+        segments.append((start, cut))
+        start = cut
+    segments.append((start, len(audio)))
+    return segments
+
+
+# --- Worker process ---
+_worker_model = None
+
+
+def _init_worker(model_size: str, torch_threads: int):
+    global _worker_model
+    import torch
+    import whisper
+    torch.set_num_threads(torch_threads)
+    _worker_model = whisper.load_model(model_size)
+
+
+def _ping() -> bool:
+    return _worker_model is not None
+
+
+def _transcribe_segment(audio: np.ndarray) -> str:
+    result = _worker_model.transcribe(audio, fp16=False)
+    return result["text"].strip()
+
+
+# --- Service ---
+class TranscriptionService:
+    """Whisper replicas in a process pool; long audio is split and transcribed in parallel."""
+
+    def __init__(self, model_size: str = WHISPER_MODEL_SIZE, workers: int = WHISPER_WORKERS,
+                 max_pending: int = TRANSCRIBE_MAX_PENDING):
+        self.model_size = model_size
+        self.workers = workers
+        self.max_pending = max_pending
+        # Split the CPU between replicas so they don't oversubscribe cores
+        torch_threads = max(1, (os.cpu_count() or 1) // workers)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_size, torch_threads),
+        )
+        self._pending = 0
+        self._lock = threading.Lock()
+        logger.info(f"Transcription service: {workers} x whisper-{model_size}, max {max_pending} pending files")
+
+    def warm(self):
+        # One ping per worker forces every replica to spawn and load its model
+        for future in [self._pool.submit(_ping) for _ in range(self.workers)]:
+            future.result()
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "model": self.model_size,
+                "pending": self._pending, "max_pending": self.max_pending}
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise TranscriptionBusyError(f"Transcription queue is full ({self.max_pending} files pending)")
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def _submit(self, audio: np.ndarray) -> List[Tuple[Future, int, int]]:
+        return [
+            (self._pool.submit(_transcribe_segment, audio[start:end]), start, end)
+            for start, end in split_on_silence(audio)
+        ]
+
+    def transcribe_file(self, file_path: str) -> str:
+        """Blocking variant for tools and thread-pool callers."""
+        self._acquire()
+        jobs = []
+        try:
+            jobs = self._submit(load_audio(file_path))
+            return " ".join(text for text in (future.result() for future, _, _ in jobs) if text)
+        finally:
+            for future, _, _ in jobs:
+                future.cancel()
+            self._release()
+
+    async def transcribe(self, file_path: str) -> str:
+        transcript = ""
+        async for event in self.stream(file_path):
+            transcript = event["transcript"]
+        return transcript
+
+    async def stream(self, file_path: str) -> AsyncIterator[dict]:
+        """Yield one event per finished segment with the in-order transcript stitched so far."""
+        self._acquire()
+        jobs = []
+        try:
+            audio = await run_in_thread(load_audio, file_path)
+            jobs = self._submit(audio)
+
+            async def segment(index: int, future: Future):
+                return index, await asyncio.wrap_future(future)
+
+            texts = [None] * len(jobs)
+            for done in asyncio.as_completed([segment(i, future) for i, (future, _, _) in enumerate(jobs)]):
+                index, text = await done
+                texts[index] = text
+                # Only the contiguous prefix is stable; later segments may finish first
+                prefix = []
+                for part in texts:
+                    if part is None:
+                        break
+                    prefix.append(part)
+                _, start, end = jobs[index]
+                yield {
+                    "segment": index,
+                    "segments_total": len(jobs),
+                    "start": round(start / SAMPLE_RATE, 2),
+                    "end": round(end / SAMPLE_RATE, 2),
+                    "text": text,
+                    "transcript": " ".join(part for part in prefix if part),
+                    "complete": all(part is not None for part in texts),
+                }
+        finally:
+            # Client went away or a segment failed: don't keep the replicas busy
+            for future, _, _ in jobs:
+                future.cancel()
+            self._release()
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+@lazy("transcription_service")
+def get_transcription_service() -> TranscriptionService:
+    service = TranscriptionService()
+    service.warm()
+    return service
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Tuple
+from gtts import gTTS
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# temp_uploads is served at /audio, so cached files are reachable at /audio/tts/<hash>.mp3
+UPLOAD_DIR = os.path.abspath("temp_uploads")
+TTS_CACHE_DIR = os.path.join(UPLOAD_DIR, "tts")
+UPLOAD_DIR_MAX_MB = int(os.getenv("UPLOAD_DIR_MAX_MB", "1024"))
+UPLOAD_DIR_MAX_AGE = float(os.getenv("UPLOAD_DIR_MAX_AGE", str(7 * 24 * 3600)))
+# Leave recent files alone: they may be uploads still being processed
+UPLOAD_DIR_GRACE_SECONDS = float(os.getenv("UPLOAD_DIR_GRACE_SECONDS", "600"))
+TTS_SWEEP_INTERVAL = float(os.getenv("TTS_SWEEP_INTERVAL", "300"))
+
+_key_locks = {}  # key -> [lock, holders and waiters]; dropped when the last one leaves
+_key_locks_guard = threading.Lock()
+_last_sweep = 0.0
+_stats = {"hits": 0, "misses": 0}
+
+
+def tts_cache_key(text: str, lang: str = "en", tld: str = "com") -> str:
+    payload = json.dumps([text, lang, tld], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@contextmanager
+def _key_lock(key: str):
+    with _key_locks_guard:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _key_locks.pop(key, None)
+
+
+def synthesize_cached(text: str, lang: str = "en", tld: str = "com") -> Tuple[str, bool]:
+    """Return (public path, cache_hit). Identical text/voice/language is synthesized once."""
+    key = tts_cache_key(text, lang, tld)
+    filename = f"{key}.mp3"
+    path = os.path.join(TTS_CACHE_DIR, filename)
+    public_path = f"/audio/tts/{filename}"
+
+    # Concurrent requests for the same key wait for one synthesis instead of racing
+    with _key_lock(key):
+        if os.path.exists(path):
+            os.utime(path)  # refresh mtime: the sweeper evicts least recently used first
+            _stats["hits"] += 1
+            return public_path, True
+
+        os.makedirs(TTS_CACHE_DIR, exist_ok=True)
+        # Write to a temp file and rename, so readers never see a half-written MP3
+        fd, tmp_path = tempfile.mkstemp(dir=TTS_CACHE_DIR, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                gTTS(text, lang=lang, tld=tld).write_to_fp(f)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        _stats["misses"] += 1
+
+    maybe_sweep()
+    return public_path, False
+
+
+def maybe_sweep():
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < TTS_SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    try:
+        sweep_upload_dir()
+    except Exception as e:
+        logger.warning(f"Upload dir sweep failed: {e}")
+
+
+def sweep_upload_dir(max_bytes: int = UPLOAD_DIR_MAX_MB * 1024 * 1024, max_age: float = UPLOAD_DIR_MAX_AGE) -> dict:
+    """Delete files older than max_age, then the oldest files until the directory fits in max_bytes."""
+    now = time.time()
+    files = []
+    for root, _, names in os.walk(UPLOAD_DIR):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    removed = freed = 0
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in sorted(files):
+        age = now - mtime
+        if age < UPLOAD_DIR_GRACE_SECONDS:
+            break  # sorted by mtime: everything after this is newer
+        if age > max_age or total > max_bytes:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            freed += size
+            removed += 1
+    if removed:
+        logger.info(f"Swept {removed} files ({freed / 1024 / 1024:.1f} MB) from {UPLOAD_DIR}")
+    return {"removed": removed, "freed_bytes": freed, "remaining_bytes": total}
+
+
+def get_tts_cache_stats() -> dict:
+    lookups = _stats["hits"] + _stats["misses"]
+    return {**_stats, "hit_rate": round(_stats["hits"] / lookups, 4) if lookups else 0.0}
@@ -0,0 +1,499 @@
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass, field, asdict
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional
+
+from app.cache import LRUCache
+from app.executors import run_in_thread
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Not under temp_uploads: that directory is served publicly at /audio
+UPLOAD_SPOOL_DIR = os.path.abspath(os.getenv("UPLOAD_SPOOL_DIR", "upload_spool"))
+UPLOAD_SESSION_DIR = os.path.join(UPLOAD_SPOOL_DIR, "sessions")
+# Writes are batched to this size, so each thread hop moves a useful amount of data
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_LIMITS_MB = {
+    "pdf": int(os.getenv("MAX_PDF_UPLOAD_MB", "100")),
+    "audio": int(os.getenv("MAX_AUDIO_UPLOAD_MB", "50")),
+    "csv": int(os.getenv("MAX_CSV_UPLOAD_MB", "200")),
+}
+# Unfinished resumable uploads (and orphaned spool files) are deleted after this long without activity
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", "86400"))
+UPLOAD_SWEEP_INTERVAL = float(os.getenv("UPLOAD_SWEEP_INTERVAL", "300"))
+UPLOAD_DEDUP_TTL = float(os.getenv("UPLOAD_DEDUP_TTL", "3600"))
+# Room for the multipart boundaries and form fields around the file itself
+UPLOAD_FORM_OVERHEAD_BYTES = int(os.getenv("UPLOAD_FORM_OVERHEAD_BYTES", str(64 * 1024)))
+
+KIND_EXTENSIONS = {
+    "pdf": {".pdf"},
+    "csv": {".csv", ".txt"},
+    "audio": {".wav", ".mp3", ".m4a", ".ogg", ".webm", ".flac", ".mp4"},
+}
+DEFAULT_EXTENSIONS = {"pdf": ".pdf", "csv": ".csv", "audio": ".wav"}
+
+_UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(Exception):
+    status_code = 400
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+
+class UploadNotFound(UploadError):
+    status_code = 404
+
+
+class UploadOffsetMismatch(UploadError):
+    """The client's offset doesn't match what the server has; it should resume from `offset`."""
+    status_code = 409
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+@dataclass
+class SpooledFile:
+    """A fully received upload on local disk, under a server-chosen unique name."""
+    path: str
+    filename: str  # the client's name, for display and the document registry only
+    size: int
+    sha256: str
+
+    def discard(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def max_upload_bytes(kind: str) -> int:
+    return UPLOAD_LIMITS_MB[kind] * 1024 * 1024
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    name = os.path.basename((filename or "").replace("\\", "/"))
+    name = re.sub(r"[\x00-\x1f\x7f]", "", name).strip()
+    return name[:200] or "upload"
+
+
+def _extension(kind: str, filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    return ext if ext in KIND_EXTENSIONS[kind] else DEFAULT_EXTENSIONS[kind]
+
+
+def _check_kind(kind: str):
+    if kind not in UPLOAD_LIMITS_MB:
+        raise UploadError(f"Unknown upload kind {kind!r}; expected one of {', '.join(UPLOAD_LIMITS_MB)}")
+
+
+# --- Streaming copy ---
+def _write_and_hash(f, hasher, data: bytes):
+    # Both release the GIL on large buffers
+    hasher.update(data)
+    f.write(data)
+
+
+async def _copy_chunks(chunks: AsyncIterator[bytes], f, hasher, size: int, limit: int, on_write=None) -> int:
+    """Append chunks to an open file off the event loop; returns the new size.
+
+    `on_write(size)` runs after every flushed batch, so a broken connection still leaves
+    an accurate resume offset.
+    """
+    buffer = bytearray()
+
+    async def flush():
+        nonlocal size
+        if buffer:
+            data = bytes(buffer)
+            buffer.clear()
+            await run_in_thread(_write_and_hash, f, hasher, data)
+            size += len(data)
+            if on_write:
+                on_write(size)
+
+    async for chunk in chunks:
+        if not chunk:
+            continue
+        if size + len(buffer) + len(chunk) > limit:
+            await flush()
+            raise UploadTooLarge(f"Upload exceeds its limit of {limit} bytes")
+        buffer += chunk
+        if len(buffer) >= UPLOAD_CHUNK_BYTES:
+            await flush()
+    await flush()
+    return size
+
+
+async def _read_upload(upload) -> AsyncIterator[bytes]:
+    while True:
+        data = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not data:
+            return
+        yield data
+
+
+async def spool_upload(upload, kind: str) -> SpooledFile:
+    """Copy a multipart UploadFile to a unique spool file, enforcing the kind's size limit.
+
+    Not a stream from the network: Starlette has already parsed the whole body into its own
+    temp file by the time an endpoint runs. UploadSizeLimitMiddleware is what bounds that
+    buffering; only the resumable PUT /uploads path writes request bytes straight to disk.
+    """
+    _check_kind(kind)
+    limit = max_upload_bytes(kind)
+    declared = getattr(upload, "size", None)
+    if declared is not None and declared > limit:
+        raise UploadTooLarge(f"Upload exceeds the {UPLOAD_LIMITS_MB[kind]} MB limit")
+
+    filename = safe_filename(upload.filename)
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_SPOOL_DIR, f"{uuid.uuid4().hex}{_extension(kind, filename)}")
+    hasher = hashlib.sha256()
+    f = await run_in_thread(open, path, "wb")
+    try:
+        size = await _copy_chunks(_read_upload(upload), f, hasher, 0, limit)
+    except BaseException:
+        await run_in_thread(f.close)
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    await run_in_thread(f.close)
+    await run_in_thread(maybe_sweep)
+    return SpooledFile(path=path, filename=filename, size=size, sha256=hasher.hexdigest())
+
+
+# --- Request size limits ---
+def _too_large_messages(kind: str) -> List[dict]:
+    body = json.dumps({"detail": f"Upload exceeds the {UPLOAD_LIMITS_MB[kind]} MB limit"}).encode("utf-8")
+    return [
+        {"type": "http.response.start", "status": UploadTooLarge.status_code,
+         "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                     (b"connection", b"close")]},
+        {"type": "http.response.body", "body": body},
+    ]
+
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware that rejects multipart uploads over their kind's limit before they are buffered.
+
+    `paths` maps an endpoint path to its upload kind. A Content-Length over the limit is answered
+    with 413 without reading the body; bodies without one (chunked) are counted as they arrive
+    and cut off at the limit, so Starlette's temp file never grows past it.
+    """
+
+    def __init__(self, app, paths: Dict[str, str]):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        kind = self.paths.get(scope.get("path")) if scope["type"] == "http" else None
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+        limit = max_upload_bytes(kind) + UPLOAD_FORM_OVERHEAD_BYTES
+        declared = dict(scope["headers"]).get(b"content-length", b"")
+        if declared.isdigit() and int(declared) > limit:
+            for message in _too_large_messages(kind):
+                await send(message)
+            return
+
+        received = 0
+        exceeded = started = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    exceeded = True
+                    raise UploadTooLarge(f"Upload exceeds its limit of {limit} bytes")
+            return message
+
+        async def guarded_send(message):
+            nonlocal started
+            if exceeded:
+                # Body parsing errors surface as a 400 further in; answer with the 413 instead
+                if not started:
+                    started = True
+                    for replacement in _too_large_messages(kind):
+                        await send(replacement)
+                return
+            started = started or message["type"] == "http.response.start"
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except UploadTooLarge:
+            if not started:
+                for message in _too_large_messages(kind):
+                    await send(message)
+
+
+# --- Resumable uploads ---
+@dataclass
+class UploadSession:
+    upload_id: str
+    kind: str
+    filename: str
+    path: str
+    received: int = 0
+    size: Optional[int] = None      # declared total, if the client knows it
+    sha256: Optional[str] = None    # expected digest, verified on finish
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "kind": self.kind,
+            "filename": self.filename,
+            "offset": self.received,
+            "size": self.size,
+            "limit": max_upload_bytes(self.kind),
+            "chunk_size": UPLOAD_CHUNK_BYTES,
+            "updated_at": self.updated_at,
+        }
+
+
+def _hash_file(path: str):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b""):
+            hasher.update(block)
+    return hasher
+
+
+class UploadSessions:
+    """Chunked uploads that survive dropped connections and restarts.
+
+    Bytes go to sessions/<id>.part and the metadata to sessions/<id>.json. A client PUTs
+    chunks at the offset the server reports; after an interruption it asks for the offset
+    and continues from there.
+    """
+
+    def __init__(self, directory: str = UPLOAD_SESSION_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._sessions: Dict[str, UploadSession] = {}
+        self._hashers: Dict[str, Any] = {}  # running sha256, rebuilt from the .part after a restart
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.directory, f"{upload_id}.json")
+
+    def _save(self, session: UploadSession):
+        tmp = self._meta_path(session.upload_id) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(asdict(session), f)
+        os.replace(tmp, self._meta_path(session.upload_id))
+
+    def create(self, kind: str, filename: str, size: Optional[int] = None, sha256: Optional[str] = None) -> UploadSession:
+        _check_kind(kind)
+        if size is not None and size > max_upload_bytes(kind):
+            raise UploadTooLarge(f"Upload exceeds the {UPLOAD_LIMITS_MB[kind]} MB limit")
+        upload_id = uuid.uuid4().hex
+        filename = safe_filename(filename)
+        session = UploadSession(
+            upload_id=upload_id, kind=kind, filename=filename, size=size,
+            sha256=sha256.lower() if sha256 else None,
+            path=os.path.join(self.directory, f"{upload_id}{_extension(kind, filename)}.part"),
+        )
+        open(session.path, "wb").close()
+        self._save(session)
+        with self._guard:
+            self._sessions[upload_id] = session
+            self._hashers[upload_id] = hashlib.sha256()
+        maybe_sweep()
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        if not _UPLOAD_ID_PATTERN.match(upload_id or ""):
+            raise UploadNotFound(f"Upload {upload_id} not found")
+        with self._guard:
+            session = self._sessions.get(upload_id)
+        if session is not None:
+            return session
+        try:
+            with open(self._meta_path(upload_id)) as f:
+                session = UploadSession(**json.load(f))
+        except (OSError, ValueError, TypeError):
+            raise UploadNotFound(f"Upload {upload_id} not found")
+        # Trust the bytes on disk over the metadata: a crash can land between the two writes
+        session.received = os.path.getsize(session.path) if os.path.exists(session.path) else 0
+        with self._guard:
+            return self._sessions.setdefault(upload_id, session)
+
+    def _lock(self, upload_id: str) -> asyncio.Lock:
+        with self._guard:
+            return self._locks.setdefault(upload_id, asyncio.Lock())
+
+    async def _hasher(self, session: UploadSession):
+        with self._guard:
+            hasher = self._hashers.get(session.upload_id)
+        if hasher is None:
+            hasher = await run_in_thread(_hash_file, session.path)
+            with self._guard:
+                self._hashers[session.upload_id] = hasher
+        return hasher
+
+    async def append(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        session = await run_in_thread(self.get, upload_id)
+        async with self._lock(upload_id):
+            if offset != session.received:
+                raise UploadOffsetMismatch(f"Expected offset {session.received}, got {offset}", session.received)
+            limit = max_upload_bytes(session.kind)
+            if session.size is not None:
+                limit = min(limit, session.size)
+            hasher = await self._hasher(session)
+
+            def progress(size: int):
+                session.received = size
+                session.updated_at = time.time()
+
+            f = await run_in_thread(open, session.path, "ab")
+            try:
+                await _copy_chunks(chunks, f, hasher, session.received, limit, on_write=progress)
+            except OSError:
+                # The hash may be ahead of what reached the disk; rebuild it from the file next time
+                with self._guard:
+                    self._hashers.pop(upload_id, None)
+                session.received = os.path.getsize(session.path)
+                raise
+            finally:
+                await run_in_thread(f.close)
+                await run_in_thread(self._save, session)
+        return session
+
+    async def finish(self, upload_id: str, kind: str) -> SpooledFile:
+        """Verify a complete upload and hand its file over; the session is gone afterwards."""
+        session = await run_in_thread(self.get, upload_id)
+        if session.kind != kind:
+            raise UploadError(f"Upload {upload_id} is a {session.kind} upload, not {kind}")
+        async with self._lock(upload_id):
+            if session.size is not None and session.received != session.size:
+                raise UploadOffsetMismatch(
+                    f"Upload {upload_id} is incomplete ({session.received} of {session.size} bytes)", session.received
+                )
+            digest = (await self._hasher(session)).hexdigest()
+            if session.sha256 and digest != session.sha256:
+                await run_in_thread(self.abort, upload_id)
+                raise UploadError(f"Upload {upload_id} failed its checksum (got sha256 {digest}); start again")
+            final_path = os.path.join(UPLOAD_SPOOL_DIR, f"{upload_id}{_extension(kind, session.filename)}")
+            os.replace(session.path, final_path)
+            self._forget(upload_id)
+        return SpooledFile(path=final_path, filename=session.filename, size=session.received, sha256=digest)
+
+    def abort(self, upload_id: str):
+        session = self.get(upload_id)
+        for path in (session.path, self._meta_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._forget(upload_id)
+
+    def _forget(self, upload_id: str):
+        if os.path.exists(self._meta_path(upload_id)):
+            os.remove(self._meta_path(upload_id))
+        with self._guard:
+            self._sessions.pop(upload_id, None)
+            self._hashers.pop(upload_id, None)
+            self._locks.pop(upload_id, None)
+
+    def stats(self) -> dict:
+        with self._guard:
+            active = len(self._sessions)
+            received = sum(session.received for session in self._sessions.values())
+        return {"active_sessions": active, "bytes_received": received, "limits_mb": dict(UPLOAD_LIMITS_MB)}
+
+
+_sessions: Optional[UploadSessions] = None
+_sessions_lock = threading.Lock()
+
+
+def get_upload_sessions() -> UploadSessions:
+    global _sessions
+    if _sessions is None:
+        with _sessions_lock:
+            if _sessions is None:
+                _sessions = UploadSessions()
+    return _sessions
+
+
+async def receive_upload(upload, upload_id: Optional[str], kind: str) -> SpooledFile:
+    """The endpoints' entry point: a multipart file, or the id of a finished chunked upload."""
+    if upload_id:
+        return await get_upload_sessions().finish(upload_id, kind)
+    if upload is None:
+        raise UploadError("Send a file, or the upload_id of a chunked upload")
+    return await spool_upload(upload, kind)
+
+
+# --- Dedup ---
+# (kind, scope, sha256) -> whatever the endpoint produced for that content (job id, dataset id, transcript)
+_by_content = LRUCache("upload_dedup", max_entries=4096, ttl=UPLOAD_DEDUP_TTL)
+
+
+def remember(kind: str, scope: Hashable, sha256: str, value: Any):
+    _by_content.set((kind, scope, sha256), value)
+
+
+def recall(kind: str, scope: Hashable, sha256: str) -> Optional[Any]:
+    return _by_content.get((kind, scope, sha256))
+
+
+def get_upload_stats() -> dict:
+    return {**get_upload_sessions().stats(), "dedup": _by_content.stats()}
+
+
+# --- Cleanup ---
+_last_sweep = 0.0
+
+
+def maybe_sweep():
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < UPLOAD_SWEEP_INTERVAL:
+        return
+    _last_sweep = now
+    try:
+        sweep_spool()
+    except Exception as e:
+        logger.warning(f"Upload spool sweep failed: {e}")
+
+
+def sweep_spool() -> int:
+    """Delete stale resumable sessions and spool files left behind by crashed requests."""
+    cutoff = time.time() - UPLOAD_SESSION_TTL
+    removed = 0
+    sessions = get_upload_sessions()
+    for directory in (UPLOAD_SPOOL_DIR, UPLOAD_SESSION_DIR):
+        if not os.path.isdir(directory):
+            continue
+        for entry in os.scandir(directory):
+            if not entry.is_file() or entry.stat().st_mtime >= cutoff:
+                continue
+            upload_id = entry.name.split(".", 1)[0]
+            if directory == UPLOAD_SESSION_DIR and _UPLOAD_ID_PATTERN.match(upload_id):
+                with sessions._guard:
+                    session = sessions._sessions.get(upload_id)
+                if session is not None and session.updated_at >= cutoff:
+                    continue
+                sessions._forget(upload_id)
+            if os.path.exists(entry.path):
+                os.remove(entry.path)
+            removed += 1
+    if removed:
+        logger.info(f"Upload spool sweep removed {removed} stale files")
+    return removed
@@ -0,0 +1,497 @@
+import os
+import json
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration ---
+# "chroma" (default) or "local": int8-quantized, mmap-backed segments per user
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+LOCAL_VECTOR_DIR = os.getenv("LOCAL_VECTOR_DIR", "vector_store")
+# "exact" scans the int8 matrix; "hnsw" adds an hnswlib graph (if installed) and reranks exactly
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "exact")
+# Merge segments (and drop deleted rows) once there are this many
+LOCAL_VECTOR_MAX_SEGMENTS = int(os.getenv("LOCAL_VECTOR_MAX_SEGMENTS", "16"))
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+    if LOCAL_VECTOR_INDEX == "hnsw":
+        logger.warning("hnswlib not installed; local vector store falls back to exact int8 search")
+
+
+# --- Quantization ---
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """L2-normalize, then scale each row into int8. Returns (int8 rows, per-row float32 scale)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.maximum(norms, 1e-12)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales = np.maximum(scales, 1e-12).astype(np.float32)
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales
+
+
+def dequantize(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[:, None]
+
+
+class QuantizedVectorIndex:
+    """Append-only int8 segments on disk (mmap'd for search) plus an SQLite row table.
+
+    Every add writes a new segment pair (codes .npy + scales .npy); deletes and upserts
+    tombstone rows, and compaction rewrites live rows into one segment. A float32
+    1536-dim embedding (6 KB) is stored in 1.5 KB.
+    """
+
+    def __init__(self, directory: str, index_kind: str = LOCAL_VECTOR_INDEX):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.index_kind = index_kind if hnswlib is not None else "exact"
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(directory, "rows.sqlite3"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL,
+                segment INTEGER NOT NULL,
+                position INTEGER NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_rows_chunk ON rows(chunk_id, deleted);
+            CREATE TABLE IF NOT EXISTS segments (segment INTEGER PRIMARY KEY, size INTEGER NOT NULL);
+            """
+        )
+        self._conn.commit()
+        self._segments: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._hnsw = None
+        self._load()
+
+    # --- Files ---
+    def _segment_paths(self, segment: int) -> Tuple[str, str]:
+        base = os.path.join(self.directory, f"segment-{segment:06d}")
+        return f"{base}.codes.npy", f"{base}.scales.npy"
+
+    def _load(self):
+        for (segment,) in self._conn.execute("SELECT segment FROM segments ORDER BY segment").fetchall():
+            self._segment(segment)
+        if self.index_kind == "hnsw":
+            self._load_hnsw()
+
+    def _segment(self, segment: int) -> Tuple[np.ndarray, np.ndarray]:
+        """The mmap'd (codes, scales) of a segment, opened on first use."""
+        arrays = self._segments.get(segment)
+        if arrays is None:
+            codes_path, scales_path = self._segment_paths(segment)
+            arrays = (np.load(codes_path, mmap_mode="r"), np.load(scales_path, mmap_mode="r"))
+            self._segments[segment] = arrays
+        return arrays
+
+    def _next_segment(self) -> int:
+        # Numbered from the table inside the write transaction, never from in-memory state
+        return self._conn.execute("SELECT COALESCE(MAX(segment), -1) + 1 FROM segments").fetchone()[0]
+
+    def _write_segment(self, segment: int, codes: np.ndarray, scales: np.ndarray):
+        for path, array in zip(self._segment_paths(segment), (codes, scales)):
+            tmp_path = f"{path}.tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+        self._segments[segment] = tuple(np.load(p, mmap_mode="r") for p in self._segment_paths(segment))
+
+    @property
+    def dimension(self) -> Optional[int]:
+        for codes, _ in self._segments.values():
+            return codes.shape[1]
+        return None
+
+    # --- Writes ---
+    def add(self, ids: Sequence[str], vectors: np.ndarray, texts: Sequence[str], metadatas: Sequence[dict]):
+        if len(ids) == 0:
+            return
+        codes, scales = quantize(vectors)
+        with self._lock:
+            if self.dimension is not None and codes.shape[1] != self.dimension:
+                raise ValueError(f"Embedding dimension {codes.shape[1]} != index dimension {self.dimension}")
+            # BEGIN IMMEDIATE takes the write lock first, so the segment number is ours before any file is written
+            self._conn.execute("BEGIN IMMEDIATE")
+            segment = None
+            try:
+                segment = self._next_segment()
+                self._conn.execute("INSERT INTO segments (segment, size) VALUES (?, ?)", (segment, len(ids)))
+                replaced = self._tombstone(ids)
+                cursor = self._conn.execute("SELECT COALESCE(MAX(row), -1) + 1 FROM rows")
+                first_row = cursor.fetchone()[0]
+                self._conn.executemany(
+                    "INSERT INTO rows (row, chunk_id, segment, position, content, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (first_row + i, chunk_id, segment, i, text, json.dumps(metadata or {}))
+                        for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas))
+                    ],
+                )
+                self._write_segment(segment, codes, scales)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                self._segments.pop(segment, None)
+                raise
+            if self._hnsw is not None:
+                self._hnsw_delete(replaced)
+                self._hnsw_add(np.arange(first_row, first_row + len(ids)), dequantize(codes, scales))
+            elif self.index_kind == "hnsw":
+                # A new store has no dimension until its first add, so its graph starts here
+                self._rebuild_hnsw()
+            if self._segment_count() > LOCAL_VECTOR_MAX_SEGMENTS:
+                self.compact()
+
+    def _segment_count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def _tombstone(self, ids: Sequence[str]) -> List[int]:
+        rows = []
+        for chunk_id in ids:
+            rows += [r for (r,) in self._conn.execute(
+                "SELECT row FROM rows WHERE chunk_id = ? AND deleted = 0", (chunk_id,)
+            ).fetchall()]
+        if rows:
+            self._conn.executemany("UPDATE rows SET deleted = 1 WHERE row = ?", [(r,) for r in rows])
+        return rows
+
+    def delete(self, ids: Sequence[str]):
+        with self._lock:
+            rows = self._tombstone(ids)
+            self._conn.commit()
+            if self._hnsw is not None and rows:
+                self._hnsw_delete(rows)
+                self._save_hnsw()
+
+    def compact(self):
+        """Rewrite live rows into a single segment and drop tombstoned data."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            segment = None
+            try:
+                live = self._conn.execute(
+                    "SELECT row, chunk_id, segment, position, content, metadata FROM rows WHERE deleted = 0 ORDER BY row"
+                ).fetchall()
+                old_segments = [seg for (seg,) in self._conn.execute("SELECT segment FROM segments").fetchall()]
+                segment = self._next_segment()
+                self._conn.execute("DELETE FROM rows")
+                self._conn.execute("DELETE FROM segments")
+                self._conn.executemany(
+                    "INSERT INTO rows (row, chunk_id, segment, position, content, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(i, chunk_id, segment, i, content, metadata)
+                     for i, (_, chunk_id, _, _, content, metadata) in enumerate(live)],
+                )
+                if live:
+                    self._conn.execute("INSERT INTO segments (segment, size) VALUES (?, ?)", (segment, len(live)))
+                    codes = np.stack([self._segment(seg)[0][pos] for _, _, seg, pos, _, _ in live])
+                    scales = np.array([self._segment(seg)[1][pos] for _, _, seg, pos, _, _ in live], dtype=np.float32)
+                    self._write_segment(segment, codes, scales)
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                self._segments.pop(segment, None)
+                raise
+            for old in (set(old_segments) | set(self._segments)) - {segment}:
+                self._segments.pop(old, None)
+                for path in self._segment_paths(old):
+                    if os.path.exists(path):
+                        os.remove(path)
+            if self.index_kind == "hnsw":
+                self._rebuild_hnsw()
+            logger.info(f"Compacted {self.directory}: {len(old_segments)} segments -> 1, {len(live)} live rows")
+
+    # --- HNSW (optional) ---
+    def _hnsw_path(self) -> str:
+        return os.path.join(self.directory, "hnsw.bin")
+
+    def _new_hnsw(self, capacity: int):
+        index = hnswlib.Index(space="ip", dim=self.dimension)
+        index.init_index(max_elements=max(capacity, 1024), M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION)
+        index.set_ef(HNSW_EF_SEARCH)
+        return index
+
+    def _load_hnsw(self):
+        if self.dimension is None:
+            return
+        if os.path.exists(self._hnsw_path()):
+            self._hnsw = hnswlib.Index(space="ip", dim=self.dimension)
+            self._hnsw.load_index(self._hnsw_path(), max_elements=0)
+            self._hnsw.set_ef(HNSW_EF_SEARCH)
+            # Adds are only saved on flush; a graph missing rows was left by an unclean shutdown
+            total = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            if self._hnsw.get_current_count() != total:
+                logger.info(f"Rebuilding stale HNSW graph for {self.directory}")
+                self._rebuild_hnsw()
+        else:
+            self._rebuild_hnsw()
+
+    def _rebuild_hnsw(self):
+        rows, vectors = self._live_vectors()
+        if self.dimension is None:
+            self._hnsw = None
+            return
+        self._hnsw = self._new_hnsw(len(rows) * 2)
+        if len(rows):
+            self._hnsw.add_items(vectors, rows)
+        self._save_hnsw()
+
+    def _hnsw_delete(self, rows: Sequence[int]):
+        for row in rows:
+            self._hnsw.mark_deleted(row)
+
+    def _hnsw_add(self, rows: np.ndarray, vectors: np.ndarray):
+        needed = self._hnsw.get_current_count() + len(rows)
+        if needed > self._hnsw.get_max_elements():
+            self._hnsw.resize_index(needed * 2)
+        self._hnsw.add_items(vectors, rows)
+
+    def _save_hnsw(self):
+        if self._hnsw is not None:
+            tmp_path = f"{self._hnsw_path()}.tmp"
+            self._hnsw.save_index(tmp_path)
+            os.replace(tmp_path, self._hnsw_path())
+
+    def flush(self):
+        """Persist the HNSW graph, which adds only update in memory."""
+        with self._lock:
+            self._save_hnsw()
+
+    def close(self):
+        with self._lock:
+            self._save_hnsw()
+            self._conn.close()
+
+    # --- Reads ---
+    def _live_rows(self) -> List[Tuple[int, int, int]]:
+        return self._conn.execute(
+            "SELECT row, segment, position FROM rows WHERE deleted = 0 ORDER BY row"
+        ).fetchall()
+
+    def _live_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        rows = self._live_rows()
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, self.dimension or 0), dtype=np.float32)
+        ids = [r for r, _, _ in rows]
+        return np.array(ids, dtype=np.int64), self.vectors(ids)
+
+    def _exact_scores(self, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Cosine scores of every live row against a normalized query."""
+        with self._lock:
+            live = self._live_rows()
+            segments = {seg: self._segment(seg) for seg in {seg for _, seg, _ in live}}
+        by_segment: Dict[int, List[Tuple[int, int]]] = {}
+        for row, seg, pos in live:
+            by_segment.setdefault(seg, []).append((row, pos))
+        rows, scores = [], []
+        for seg, members in by_segment.items():
+            codes, scales = segments[seg]
+            positions = np.array([pos for _, pos in members])
+            # int8 codes upcast per segment; the mmap'd file is only paged in as it is read
+            seg_scores = (codes[positions].astype(np.float32) @ query) * scales[positions]
+            rows.extend(row for row, _ in members)
+            scores.append(seg_scores)
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        return np.array(rows, dtype=np.int64), np.concatenate(scores)
+
+    def search(self, query: Sequence[float], k: int) -> List[Tuple[int, float]]:
+        """Top-k (row, cosine similarity), best first."""
+        query = np.asarray(query, dtype=np.float32)
+        query = query / max(float(np.linalg.norm(query)), 1e-12)
+        with self._lock:
+            # Compaction renumbers rows and rebuilds the graph, so labels are resolved under the same lock
+            live = self.count()
+            if self._hnsw is not None and live:
+                # Over-fetch from the graph, then rerank the candidates exactly on the int8 codes
+                labels, _ = self._hnsw.knn_query(query, k=min(k * 4, live))
+                candidates = [int(label) for label in labels[0]]
+                vectors = self.vectors(candidates)
+                scores = vectors @ query
+                order = np.argsort(-scores)[:k]
+                return [(candidates[i], float(scores[i])) for i in order]
+        rows, scores = self._exact_scores(query)
+        if not len(rows):
+            return []
+        k = min(k, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+    def vectors(self, rows: Sequence[int]) -> np.ndarray:
+        with self._lock:
+            located = dict(
+                (row, (seg, pos)) for row, seg, pos in self._conn.execute(
+                    f"SELECT row, segment, position FROM rows WHERE row IN ({','.join('?' * len(rows))})", list(rows)
+                ).fetchall()
+            ) if rows else {}
+            segments = {seg: self._segment(seg) for seg, _ in located.values()}
+        out = np.zeros((len(rows), self.dimension or 0), dtype=np.float32)
+        for i, row in enumerate(rows):
+            seg, pos = located[row]
+            codes, scales = segments[seg]
+            out[i] = codes[pos].astype(np.float32) * scales[pos]
+        return out
+
+    def documents(self, rows: Sequence[int]) -> Dict[int, Tuple[str, str, dict]]:
+        if not rows:
+            return {}
+        with self._lock:
+            found = self._conn.execute(
+                f"SELECT row, chunk_id, content, metadata FROM rows WHERE row IN ({','.join('?' * len(rows))})",
+                list(rows),
+            ).fetchall()
+        return {row: (chunk_id, content, json.loads(metadata)) for row, chunk_id, content, metadata in found}
+
+    def all_documents(self) -> List[Tuple[str, str, dict]]:
+        with self._lock:
+            found = self._conn.execute(
+                "SELECT chunk_id, content, metadata FROM rows WHERE deleted = 0 ORDER BY row"
+            ).fetchall()
+        return [(chunk_id, content, json.loads(metadata)) for chunk_id, content, metadata in found]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM rows WHERE deleted = 0").fetchone()[0]
+
+    def disk_bytes(self) -> int:
+        return sum(
+            os.path.getsize(os.path.join(self.directory, name)) for name in os.listdir(self.directory)
+        )
+
+
+_indexes: Dict[str, QuantizedVectorIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def open_index(directory: str, index_kind: str = LOCAL_VECTOR_INDEX) -> QuantizedVectorIndex:
+    """The one index per directory in this process.
+
+    The per-user store LRU can evict a store that an ingestion batch still holds, so the
+    next open must share that instance rather than build a second, stale view of its files.
+    """
+    key = os.path.realpath(directory)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = QuantizedVectorIndex(directory, index_kind=index_kind)
+        return index
+
+
+def flush_indexes():
+    """Save every open index's HNSW graph; called on shutdown."""
+    with _indexes_lock:
+        indexes = list(_indexes.values())
+    for index in indexes:
+        try:
+            index.flush()
+        except Exception as e:
+            logger.warning(f"Failed to save HNSW graph for {index.directory}: {e}")
+
+
+# --- LangChain adapter ---
+class LocalANNStore(VectorStore):
+    """VectorStore over a per-user QuantizedVectorIndex, a drop-in for the per-user Chroma collection."""
+
+    def __init__(self, directory: str, embedding: Embeddings, index_kind: str = LOCAL_VECTOR_INDEX):
+        self.index = open_index(directory, index_kind=index_kind)
+        self._embedding = embedding
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.add_embeddings(ids, self._embedding.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def add_embeddings(self, ids: List[str], embeddings: Sequence[Sequence[float]], texts: List[str],
+                       metadatas: List[dict]):
+        """Insert precomputed vectors, e.g. when migrating from Chroma without re-embedding."""
+        self.index.add(ids, np.asarray(embeddings, dtype=np.float32), texts, metadatas)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids:
+            self.index.delete(ids)
+        return True
+
+    def _to_documents(self, hits: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        found = self.index.documents([row for row, _ in hits])
+        results = []
+        for row, score in hits:
+            if row in found:
+                chunk_id, content, metadata = found[row]
+                results.append((Document(id=chunk_id, page_content=content, metadata=metadata), score))
+        return results
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4) -> List[Tuple[Document, float]]:
+        return self._to_documents(self.index.search(embedding, k))
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def _select_relevance_score_fn(self):
+        return lambda score: score  # already cosine similarity
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20,
+                                      lambda_mult: float = 0.5, **kwargs: Any) -> List[Document]:
+        query_vector = np.asarray(self._embedding.embed_query(query), dtype=np.float32)
+        hits = self.index.search(query_vector, fetch_k)
+        if not hits:
+            return []
+        candidates = self.index.vectors([row for row, _ in hits])
+        selected = maximal_marginal_relevance(query_vector, candidates, lambda_mult=lambda_mult, k=k)
+        return [doc for doc, _ in self._to_documents([hits[i] for i in selected])]
+
+    def get(self, include: Optional[List[str]] = None) -> Dict[str, list]:
+        """Chroma-compatible dump of every live chunk (ids, documents, metadatas)."""
+        rows = self.index.all_documents()
+        return {
+            "ids": [chunk_id for chunk_id, _, _ in rows],
+            "documents": [content for _, content, _ in rows],
+            "metadatas": [metadata for _, _, metadata in rows],
+        }
+
+    def count(self) -> int:
+        return self.index.count()
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None,
+                   ids: Optional[List[str]] = None, directory: Optional[str] = None, **kwargs: Any) -> "LocalANNStore":
+        store = cls(directory or os.path.join(LOCAL_VECTOR_DIR, uuid.uuid4().hex), embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+
+def local_store_directory(user_id: str) -> str:
+    # Hash the id: user ids come from requests and must not steer the path
+    return os.path.join(LOCAL_VECTOR_DIR, hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:32])
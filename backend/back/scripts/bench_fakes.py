@@ -0,0 +1,260 @@
+"""Deterministic local stand-ins for every paid or remote dependency, for benchmarking.
+
+install_fakes() must run before app.main is imported: several app modules bind
+ChatOpenAI / OpenAIEmbeddings / gTTS by name at import time. Latencies are
+configurable so a run can model a slow or fast upstream.
+"""
+import re
+import time
+import asyncio
+import hashlib
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+@dataclass
+class FakeLatency:
+    llm: float = 0.4             # seconds to first token
+    llm_token: float = 0.01      # seconds per streamed token
+    embedding: float = 0.05      # per embeddings API call
+    embedding_per_text: float = 0.0005
+    whisper: float = 1.0         # per transcribed file
+    tts: float = 0.3
+    google: float = 0.15         # per Google API request (a batch counts once)
+    search: float = 0.5
+
+
+LATENCY = FakeLatency()
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+
+
+def _reply_for(prompt: str) -> str:
+    words = " ".join(f"token{int(_digest(prompt + str(i)), 16) % 997}" for i in range(24))
+    # ReAct-style agents only stop when they see a final answer marker
+    prefix = "Final Answer: " if "Final Answer" in prompt else ""
+    return f"{prefix}Benchmark answer {_digest(prompt)}: {words}"
+
+
+# --- LLM ---
+class FakeChatOpenAI(BaseChatModel):
+    """Chat model that answers deterministically after a fixed delay, with token streaming."""
+
+    def __init__(self, **kwargs: Any):
+        # Accept and ignore ChatOpenAI's arguments (model, temperature, max_tokens, ...)
+        super().__init__()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-openai"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _prompt(self, messages: List[BaseMessage]) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = _reply_for(self._prompt(messages))
+        time.sleep(LATENCY.llm + LATENCY.llm_token * len(text.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = _reply_for(self._prompt(messages))
+        await asyncio.sleep(LATENCY.llm + LATENCY.llm_token * len(text.split()))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(LATENCY.llm)
+        for word in _reply_for(self._prompt(messages)).split():
+            time.sleep(LATENCY.llm_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(LATENCY.llm)
+        for word in _reply_for(self._prompt(messages)).split():
+            await asyncio.sleep(LATENCY.llm_token)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeOpenAIClient:
+    """openai.OpenAI stand-in covering chat.completions.create."""
+
+    def __init__(self, **kwargs: Any):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages=None, **kwargs):
+        text = _reply_for("\n".join(m["content"] for m in messages or []))
+        time.sleep(LATENCY.llm + LATENCY.llm_token * len(text.split()))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+# --- Embeddings ---
+class FakeEmbeddings(Embeddings):
+    """Hashed bag-of-words vectors: deterministic, and similar texts get similar vectors."""
+
+    model = "fake-embedding"
+
+    def __init__(self, dimension: int = 1536, **kwargs: Any):
+        self.dimension = dimension
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            vector[int(_digest(token), 16) % self.dimension] += 1.0
+        norm = float(np.linalg.norm(vector)) or 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(LATENCY.embedding + LATENCY.embedding_per_text * len(texts))
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(LATENCY.embedding)
+        return self._vector(text)
+
+
+# --- Whisper ---
+class FakeTranscriptionService:
+    """Same surface as app.transcription.TranscriptionService, without Whisper or ffmpeg."""
+
+    workers = 1
+
+    def _text(self, file_path: str) -> str:
+        with open(file_path, "rb") as f:
+            return f"Transcript {_digest(f.read(4096).hex())}: please summarize the quarterly report."
+
+    def warm(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"workers": 1, "model": "fake", "pending": 0, "max_pending": 0}
+
+    def transcribe_file(self, file_path: str) -> str:
+        time.sleep(LATENCY.whisper)
+        return self._text(file_path)
+
+    async def transcribe(self, file_path: str) -> str:
+        await asyncio.sleep(LATENCY.whisper)
+        return self._text(file_path)
+
+    async def stream(self, file_path: str):
+        text = await self.transcribe(file_path)
+        yield {"segment": 0, "segments_total": 1, "start": 0.0, "end": 0.0,
+               "text": text, "transcript": text, "complete": True}
+
+    def shutdown(self):
+        pass
+
+
+# --- gTTS ---
+class FakeGTTS:
+    def __init__(self, text: str, lang: str = "en", tld: str = "com", **kwargs: Any):
+        self.text = text
+
+    def write_to_fp(self, fp):
+        time.sleep(LATENCY.tts)
+        fp.write(b"ID3" + hashlib.sha256(self.text.encode("utf-8")).digest() * 64)
+
+
+# --- Search ---
+class FakeSearch:
+    def run(self, query: str) -> str:
+        time.sleep(LATENCY.search)
+        return f"Result {_digest(query)} for '{query}': lorem ipsum dolor sit amet."
+
+
+# --- Google APIs ---
+class _FakeRequest:
+    def __init__(self, response: dict):
+        self.response = response
+
+    def execute(self, *args, **kwargs):
+        time.sleep(LATENCY.google)
+        return self.response
+
+
+class _FakeBatch:
+    def __init__(self, callback):
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        self.requests.append((request_id or str(len(self.requests)), request))
+
+    def execute(self, *args, **kwargs):
+        time.sleep(LATENCY.google)
+        for request_id, request in self.requests:
+            self.callback(request_id, request.response, None)
+
+
+class FakeGoogleService:
+    """Calendar v3 + Gmail v1 calls the app makes, including batch requests."""
+
+    def new_batch_http_request(self, callback=None):
+        return _FakeBatch(callback)
+
+    def events(self):
+        return self
+
+    def insert(self, calendarId=None, body=None, **kwargs):
+        event_id = _digest(repr(body))
+        return _FakeRequest({"id": event_id, "htmlLink": f"https://calendar.example/{event_id}"})
+
+    def list(self, **kwargs):
+        return _FakeRequest({"items": []})
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId=None, body=None, **kwargs):
+        return _FakeRequest({"id": _digest(repr(body))})
+
+
+class FakeGoogleClientPool:
+    def get_service(self, api: str, version: str, scopes):
+        return FakeGoogleService()
+
+    def stats(self) -> dict:
+        return {"fake": True}
+
+
+def install_fakes(latency: Optional[FakeLatency] = None):
+    """Patch every external dependency; call before importing app.main."""
+    global LATENCY
+    if latency is not None:
+        LATENCY = latency
+
+    import openai
+    import langchain_openai
+    import langchain_community.embeddings
+    openai.OpenAI = FakeOpenAIClient
+    langchain_openai.ChatOpenAI = FakeChatOpenAI
+    langchain_community.embeddings.OpenAIEmbeddings = FakeEmbeddings
+
+    from app import tools, tts_cache, transcription, google_clients
+    tts_cache.gTTS = FakeGTTS
+    # Lazy resources: swapping the factory before first use swaps the resource everywhere
+    transcription.get_transcription_service.factory = FakeTranscriptionService
+    tools.client.factory = FakeOpenAIClient
+    tools.duckduckgo_search.factory = FakeSearch
+    tools.wiki.factory = FakeSearch
+    google_clients.set_client_pool(FakeGoogleClientPool())
@@ -0,0 +1,309 @@
+"""Offline load test of the API with every upstream replaced by a deterministic fake.
+
+Usage (from backend/back; needs httpx):
+    PYTHONPATH=. python scripts/benchmark.py [--scenarios chat,upload_pdf,query_csv,voice_chat]
+        [--requests 200] [--concurrency 16] [--llm-latency 0.4] [--embedding-latency 0.05]
+        [--whisper-latency 1.0] [--tts-latency 0.3] [--google-latency 0.15]
+        [--output results.json] [--baseline previous.json] [--tolerance 0.10]
+
+The app runs in-process behind httpx's ASGI transport inside a scratch working
+directory, so nothing touches OpenAI, DuckDuckGo, Google or the real stores. For each
+scenario it reports p50/p95/p99 latency, throughput, error count and RSS, and saves
+everything as JSON. With --baseline, p95 and throughput are compared to an earlier
+run; the exit status is 1 if any scenario regressed by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+import tempfile
+
+import httpx
+
+from bench_fakes import FakeLatency, install_fakes
+
+QUESTIONS = [
+    "What does the report say about revenue growth?",
+    "Summarize the main findings of the document",
+    "Which clause covers termination in the agreement?",
+    "Search the web for the latest news about solar panels",
+    "What is the capital of Australia?",
+    "Write a short poem about the ocean",
+]
+# (question, path it must take); checked against the parser before the run
+CSV_QUESTIONS = [
+    ("What is the average price by region?", "fast"),
+    ("How many rows are there?", "fast"),
+    ("Top 5 products by revenue", "fast"),
+    ("Explain the relationship between price and quantity", "agent"),
+]
+
+
+# --- Fixtures ---
+def make_pdf(pages: int = 5, words_per_page: int = 250, seed: int = 0) -> bytes:
+    """A small valid text PDF, built by hand so the benchmark needs no PDF writer."""
+    rng = random.Random(seed)
+    vocabulary = ("revenue growth clause contract termination quarterly report findings customer "
+                  "invoice product region policy payment schedule risk summary analysis").split()
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        words = [rng.choice(vocabulary) for _ in range(words_per_page)]
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        text = "".join(f"({line}) Tj T* " for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td (Page {page + 1} part AB-{1000 + page}) Tj T* {text}ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        content_ref = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_ref} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def make_csv(rows: int = 20000, seed: int = 0) -> bytes:
+    rng = random.Random(seed)
+    regions = ["Europe", "Asia", "Americas", "Africa"]
+    products = [f"product_{i}" for i in range(50)]
+    lines = ["order_id,region,product,price,quantity,revenue"]
+    for i in range(rows):
+        price = round(rng.uniform(5, 500), 2)
+        quantity = rng.randint(1, 20)
+        lines.append(f"{i},{rng.choice(regions)},{rng.choice(products)},{price},{quantity},{price * quantity:.2f}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def make_audio(seed: int) -> bytes:
+    # The fake transcriber only hashes the bytes; content just has to differ per request
+    return b"RIFF" + seed.to_bytes(8, "little") + os.urandom(2048)
+
+
+# --- Measurement ---
+def rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+async def run_scenario(name: str, make_request, total: int, concurrency: int) -> dict:
+    latencies, errors, rss_samples = [], 0, []
+    counter = iter(range(total))
+    stop = asyncio.Event()
+
+    async def sample_rss():
+        while not stop.is_set():
+            rss_samples.append(rss_mb())
+            await asyncio.sleep(0.2)
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            started = time.perf_counter()
+            try:
+                response = await make_request(i)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    result = {
+        "requests": total,
+        "concurrency": concurrency,
+        "errors": errors,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(total / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "mean_ms": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        "rss_mb_max": round(max(rss_samples, default=rss_mb()), 1),
+        "rss_mb_end": round(rss_mb(), 1),
+    }
+    print(f"{name:<12} {result['throughput_rps']:>8.2f} rps  p50 {result['p50_ms']:>8.1f} ms  "
+          f"p95 {result['p95_ms']:>8.1f} ms  p99 {result['p99_ms']:>8.1f} ms  "
+          f"errors {errors:>4}  rss {result['rss_mb_max']:.0f} MB")
+    return result
+
+
+# --- Scenarios ---
+def build_scenarios(client: httpx.AsyncClient, users: int):
+    pdf = make_pdf()
+
+    async def chat(i):
+        # Unique suffix: measure the full pipeline, not the answer cache
+        question = f"{QUESTIONS[i % len(QUESTIONS)]} (request {i})"
+        return await client.post("/chat", json={"question": question, "user_id": f"bench-{i % users}"})
+
+    async def upload_pdf(i):
+        files = {"file": (f"bench-{i}.pdf", pdf, "application/pdf")}
+        data = {"user_id": f"bench-{i % users}", "wait": "true"}
+        return await client.post("/upload_pdf", files=files, data=data)
+
+    async def query_csv(i):
+        return await client.post("/query_csv", json={"question": CSV_QUESTIONS[i % len(CSV_QUESTIONS)][0]})
+
+    async def voice_chat(i):
+        files = {"audio": (f"bench-{i}.wav", make_audio(i), "audio/wav")}
+        return await client.post("/voice_chat", files=files)
+
+    return {"chat": chat, "upload_pdf": upload_pdf, "query_csv": query_csv, "voice_chat": voice_chat}
+
+
+def compare(results: dict, baseline_path: str, tolerance: float) -> bool:
+    with open(baseline_path) as f:
+        baseline = json.load(f)["scenarios"]
+    regressed = False
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%}):")
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        p95_change = (current["p95_ms"] - previous["p95_ms"]) / max(previous["p95_ms"], 1e-9)
+        rps_change = (current["throughput_rps"] - previous["throughput_rps"]) / max(previous["throughput_rps"], 1e-9)
+        flag = p95_change > tolerance or rps_change < -tolerance
+        regressed |= flag
+        print(f"  {name:<12} p95 {p95_change:+.1%}  throughput {rps_change:+.1%}{'  REGRESSION' if flag else ''}")
+    return regressed
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except Exception:
+        return "unknown"
+
+
+def check_csv_paths(dataset_id: str):
+    """Fail fast if a question would not take the path the scenario's fast/agent mix assumes."""
+    from app.csv_query_engine import try_fast_answer
+    from app.datasets import load_dataset
+
+    df = load_dataset(dataset_id)
+    for question, expected in CSV_QUESTIONS:
+        path = "fast" if try_fast_answer(question, df) else "agent"
+        assert path == expected, f"CSV question {question!r} takes the {path} path, not {expected}"
+
+
+async def main_async(args) -> dict:
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # ASGITransport doesn't send lifespan events; run the startup hooks ourselves
+        await app.router.startup()
+        try:
+            scenarios = build_scenarios(client, args.users)
+            wanted = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+            if "query_csv" in wanted:
+                response = await client.post("/upload_csv", files={"file": ("bench.csv", make_csv(), "text/csv")})
+                response.raise_for_status()
+                check_csv_paths(response.json()["dataset_id"])
+            if "chat" in wanted:
+                # Give every chat user a document so the documents route has something to retrieve
+                for user in range(args.users):
+                    await client.post("/upload_pdf", files={"file": ("seed.pdf", make_pdf(seed=user), "application/pdf")},
+                                      data={"user_id": f"bench-{user}", "wait": "true"})
+            results = {}
+            for name in wanted:
+                results[name] = await run_scenario(name, scenarios[name], args.requests, args.concurrency)
+            return results
+        finally:
+            await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default="chat,upload_pdf,query_csv,voice_chat")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=8, help="Distinct user ids to spread requests over")
+    parser.add_argument("--llm-latency", type=float, default=FakeLatency.llm)
+    parser.add_argument("--embedding-latency", type=float, default=FakeLatency.embedding)
+    parser.add_argument("--whisper-latency", type=float, default=FakeLatency.whisper)
+    parser.add_argument("--tts-latency", type=float, default=FakeLatency.tts)
+    parser.add_argument("--google-latency", type=float, default=FakeLatency.google)
+    parser.add_argument("--output", default=f"benchmark-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    latency = FakeLatency(llm=args.llm_latency, embedding=args.embedding_latency, whisper=args.whisper_latency,
+                          tts=args.tts_latency, google=args.google_latency)
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    # Every store uses relative paths; a scratch cwd keeps the run isolated and cold
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.chdir(workdir)
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("WARMUP_ON_STARTUP", "0")
+    install_fakes(latency)
+
+    started = time.time()
+    results = asyncio.run(main_async(args))
+    report = {
+        "started_at": started,
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "latency": vars(latency),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "scenarios": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved results to {output} (scratch dir {workdir})")
+
+    if baseline and compare(results, baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Offline evaluation of the semantic router against the keyword rules.
+
+Usage (from backend/back, with OPENAI_API_KEY set):
+    PYTHONPATH=. python scripts/eval_router.py [--threshold 0.8] [--margin 0.01]
+
+Reports routing accuracy for both strategies and the latency the semantic
+router adds per query (centroid construction is excluded and reported once).
+"""
+import argparse
+import statistics
+import time
+from collections import Counter
+
+from app.rag_logic import get_embeddings
+from app.semantic_router import SemanticRouter, keyword_route, ROUTER_THRESHOLD, ROUTER_MARGIN
+
+# Held-out queries; none of these appear in ROUTE_EXEMPLARS
+LABELED_QUERIES = [
+    ("What does my uploaded contract say about late fees?", "documents"),
+    ("Give me a summary of the pdf", "documents"),
+    ("In the report, what were the Q3 findings?", "documents"),
+    ("Which clause covers confidentiality in the agreement I sent?", "documents"),
+    ("Who is the author of the document?", "documents"),
+    ("What's the mean salary in the csv?", "csv"),
+    ("Sum the revenue column grouped by country", "csv"),
+    ("Top 5 customers by order value in my data", "csv"),
+    ("How many unique products are in the spreadsheet?", "csv"),
+    ("Transcribe the meeting recording", "voice"),
+    ("Turn this paragraph into audio", "voice"),
+    ("Speak this answer aloud", "voice"),
+    ("Put a meeting on my calendar for Thursday 3pm", "calendar"),
+    ("Schedule a meeting with Sam next week", "calendar"),
+    ("Block 9 to 10 tomorrow for a standup", "calendar"),
+    ("Search online for today's weather in Kathmandu", "research"),
+    ("What does Wikipedia say about quantum computing?", "research"),
+    ("Find the latest news about OpenAI", "research"),
+    ("Who is the current prime minister of Japan?", "research"),
+    ("Hi there!", "fallback"),
+    ("Write a haiku about autumn", "fallback"),
+    ("What are you able to help with?", "fallback"),
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=ROUTER_THRESHOLD)
+    parser.add_argument("--margin", type=float, default=ROUTER_MARGIN)
+    args = parser.parse_args()
+
+    router = SemanticRouter(get_embeddings(), threshold=args.threshold, margin=args.margin)
+
+    start = time.perf_counter()
+    router.centroids()
+    print(f"Centroid build: {(time.perf_counter() - start) * 1000:.1f} ms (one-off)")
+
+    keyword_correct = semantic_correct = 0
+    methods = Counter()
+    per_route = {route: Counter() for route in dict.fromkeys(expected for _, expected in LABELED_QUERIES)}
+    latencies = []
+    for query, expected in LABELED_QUERIES:
+        keyword = keyword_route(query)
+
+        start = time.perf_counter()
+        decision = router.classify(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        keyword_correct += keyword == expected
+        semantic_correct += decision["route"] == expected
+        per_route[expected].update(total=1, keyword=keyword == expected, semantic=decision["route"] == expected)
+        methods[decision["method"]] += 1
+        marker = "ok " if decision["route"] == expected else "BAD"
+        print(f"[{marker}] {query!r}: expected={expected} semantic={decision['route']} "
+              f"({decision['method']}, {decision['confidence']}) keyword={keyword}")
+
+    total = len(LABELED_QUERIES)
+    print()
+    print(f"Keyword accuracy:  {keyword_correct}/{total} ({keyword_correct / total:.0%})")
+    print(f"Semantic accuracy: {semantic_correct}/{total} ({semantic_correct / total:.0%})")
+    print(f"Decision methods:  {dict(methods)}")
+    # The keyword rules are what low-confidence queries fall back to, so their misses matter per route
+    print("Per route:         keyword / semantic")
+    for route, counts in per_route.items():
+        print(f"  {route:<10} {counts['keyword']}/{counts['total']} ({counts['keyword'] / counts['total']:.0%})"
+              f" / {counts['semantic']}/{counts['total']} ({counts['semantic'] / counts['total']:.0%})")
+    print(f"Added latency:     mean {statistics.mean(latencies):.1f} ms, "
+          f"p50 {percentile(latencies, 50):.1f} ms, p95 {percentile(latencies, 95):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
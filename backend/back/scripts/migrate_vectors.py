@@ -0,0 +1,151 @@
+"""Copy per-user Chroma collections into the local int8 vector store and measure recall.
+
+Usage (from backend/back):
+    PYTHONPATH=. python scripts/migrate_vectors.py [--users alice bob] [--k 10] [--samples 50]
+                                                  [--index exact|hnsw] [--force] [--report report.json]
+
+Stored embeddings are copied as-is, so no OpenAI calls are made. For every migrated
+user, recall@k of the local store is measured against Chroma's own top-k on synthetic
+queries (the normalized mean of two random stored chunks), along with per-query latency
+and on-disk size. Switch the app over with VECTOR_BACKEND=local once the numbers look right.
+"""
+import os
+import json
+import time
+import shutil
+import argparse
+import statistics
+
+import numpy as np
+import chromadb
+
+from app.rag_logic import CHROMA_DIR
+from app.vector_backends import QuantizedVectorIndex, local_store_directory, LOCAL_VECTOR_INDEX
+
+PAGE_SIZE = 1000
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, names in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in names)
+    return total
+
+
+def _collection_names(client) -> list:
+    # chromadb >= 0.6 returns names, older versions return Collection objects
+    return [c if isinstance(c, str) else c.name for c in client.list_collections()]
+
+
+def migrate_collection(collection, index: QuantizedVectorIndex) -> np.ndarray:
+    """Copy every chunk; returns the float32 embeddings for recall sampling."""
+    embeddings = []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=PAGE_SIZE, offset=offset)
+        if not len(page["ids"]):
+            break
+        vectors = np.asarray(page["embeddings"], dtype=np.float32)
+        index.add(page["ids"], vectors, [d or "" for d in page["documents"]], [m or {} for m in page["metadatas"]])
+        embeddings.append(vectors)
+        offset += len(page["ids"])
+    index.compact()
+    return np.concatenate(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32)
+
+
+def measure_recall(collection, index: QuantizedVectorIndex, embeddings: np.ndarray, k: int, samples: int,
+                   seed: int = 0) -> dict:
+    rng = np.random.default_rng(seed)
+    recalls, chroma_ms, local_ms = [], [], []
+    # Collections smaller than k are scored on all their chunks, but reported under the requested k
+    n = min(k, len(embeddings))
+    for _ in range(samples):
+        i, j = rng.integers(0, len(embeddings), 2)
+        query = embeddings[i] + embeddings[j]
+        query = (query / max(float(np.linalg.norm(query)), 1e-12)).tolist()
+
+        started = time.perf_counter()
+        expected = set(collection.query(query_embeddings=[query], n_results=n, include=[])["ids"][0])
+        chroma_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        hits = index.search(query, n)
+        local_ms.append((time.perf_counter() - started) * 1000)
+        found = {chunk_id for chunk_id, _, _ in index.documents([row for row, _ in hits]).values()}
+
+        recalls.append(len(expected & found) / max(len(expected), 1))
+    return {
+        f"recall@{k}": round(statistics.mean(recalls), 4),
+        "chroma_ms_p50": round(statistics.median(chroma_ms), 2),
+        "local_ms_p50": round(statistics.median(local_ms), 2),
+    }
+
+
+def _move_into_place(staging: str, directory: str):
+    """Swap a finished store in; a run that dies before this leaves no partial store behind."""
+    previous = f"{directory}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, previous)
+    os.replace(staging, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", nargs="*", help="Only migrate these user ids (default: all)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=50)
+    parser.add_argument("--index", choices=["exact", "hnsw"], default=LOCAL_VECTOR_INDEX)
+    parser.add_argument("--force", action="store_true", help="Rebuild users that were already migrated")
+    parser.add_argument("--report", help="Write the per-user results as JSON to this path")
+    args = parser.parse_args()
+
+    client = chromadb.PersistentClient(path=CHROMA_DIR)
+    users = [name[len("user_"):] for name in _collection_names(client) if name.startswith("user_")]
+    if args.users:
+        users = [u for u in users if u in set(args.users)]
+
+    results = []
+    for user_id in users:
+        directory = local_store_directory(user_id)
+        if os.path.exists(directory) and not args.force:
+            print(f"{user_id}: already migrated, skipping (use --force to rebuild)")
+            continue
+        # Build next to the target and rename it in only once complete
+        staging = f"{directory}.migrating"
+        shutil.rmtree(staging, ignore_errors=True)
+        collection = client.get_collection(f"user_{user_id}")
+        started = time.perf_counter()
+        index = QuantizedVectorIndex(staging, index_kind=args.index)
+        embeddings = migrate_collection(collection, index)
+        result = {
+            "user_id": user_id,
+            "chunks": index.count(),
+            "migrate_seconds": round(time.perf_counter() - started, 2),
+            "float32_bytes": int(embeddings.size * 4),
+        }
+        if len(embeddings):
+            result.update(measure_recall(collection, index, embeddings, args.k, args.samples))
+        index.close()
+        _move_into_place(staging, directory)
+        result["local_bytes"] = _dir_bytes(directory)
+        results.append(result)
+        print(json.dumps(result))
+
+    if results:
+        recall_key = f"recall@{args.k}"
+        scored = [r[recall_key] for r in results if recall_key in r]
+        print(f"\nMigrated {len(results)} users, {sum(r['chunks'] for r in results)} chunks")
+        if scored:
+            print(f"Mean {recall_key} vs Chroma: {statistics.mean(scored):.4f}")
+        print(f"Local store: {sum(r['local_bytes'] for r in results) / 1e6:.1f} MB "
+              f"(float32 vectors alone: {sum(r['float32_bytes'] for r in results) / 1e6:.1f} MB, "
+              f"whole chroma_store: {_dir_bytes(CHROMA_DIR) / 1e6:.1f} MB)")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
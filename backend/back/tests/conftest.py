@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Same import root as the container (PYTHONPATH=/app/back)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
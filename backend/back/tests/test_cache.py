@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.cache import AsyncSingleFlight
+
+
+def test_cancelled_leader_does_not_fail_the_waiters():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        release = asyncio.Event()
+        runs = []
+
+        async def compute():
+            runs.append(1)
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.create_task(flight.do("q", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("q", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await waiter == "answer"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert runs == [1] and flight.coalesced == 1
+
+    asyncio.run(scenario())
+
+
+def test_waiters_see_the_real_exception():
+    async def scenario():
+        flight = AsyncSingleFlight()
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(flight.do("q", compute), flight.do("q", compute), return_exceptions=True)
+        assert [type(r) for r in results] == [ValueError, ValueError]
+
+    asyncio.run(scenario())
+
+
+def test_computation_is_cancelled_once_nobody_waits():
+    async def scenario():
+        flight = AsyncSingleFlight()
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flight.do("q", slow))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+
+        async def fast():
+            return "fresh"
+
+        assert await flight.do("q", fast) == "fresh"
+
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+import pandas as pd
+import pytest
+
+from app.csv_query_engine import parse_question, try_fast_answer
+
+
+@pytest.fixture
+def sales():
+    return pd.DataFrame({
+        "product": ["apple", "banana", "apple", "cherry", "banana"],
+        "region": ["Europe", "Asia", "Europe", "Asia", "America"],
+        "customer": ["ann", "bob", "cid", "dee", "eve"],
+        "revenue": [100, 200, 300, 400, 500],
+        "price": [1, 2, 3, 4, 5],
+        "age": [20, 35, 40, 25, 50],
+        "date": pd.to_datetime(["2023-01-05", "2023-06-01", "2024-01-10", "2024-02-01", "2024-03-01"]),
+    })
+
+
+@pytest.mark.parametrize("question", [
+    # Negation would be dropped, inverting the answer
+    "total revenue excluding Europe",
+    "sum of revenue not in Asia",
+    "total revenue except apple",
+    "average price for regions other than Asia",
+    # Unconsumed content: a year, an unknown noun, an unparsed condition
+    "total revenue in 2023",
+    "how many orders in 2024",
+    "average price for customers over 30",
+    # Entity questions want a name, not the aggregate
+    "Which product has the highest revenue?",
+    "who spent the most revenue",
+    "what region has the lowest price",
+])
+def test_declines_questions_it_cannot_fully_parse(sales, question):
+    assert parse_question(question, sales) is None
+    assert try_fast_answer(question, sales) is None
+
+
+def test_comparison_without_where(sales):
+    result = try_fast_answer("how many rows have price over 2", sales)
+    assert result["path"] == "fast"
+    assert result["answer"] == "There are 3 rows matching the filter."
+
+
+def test_chained_filters(sales):
+    plan = parse_question("how many rows where region is europe and price over 2", sales)
+    assert plan.filters == [("region", "==", "Europe"), ("price", ">", 2.0)]
+
+
+def test_explicit_negated_filter_is_kept(sales):
+    result = try_fast_answer("how many rows where region is not Asia", sales)
+    assert result["answer"] == "There are 3 rows matching the filter."
+
+
+@pytest.mark.parametrize("question", [
+    # A single-value filter can't hold alternatives; answering would count nothing
+    "how many rows where region is Europe or Asia",
+    "total revenue where product is apple or banana",
+    "total revenue where product is apple, banana",
+    "how many rows where region is not Europe or Asia",
+    # A value the column doesn't contain is a misparse, not an empty result
+    "how many rows where region is Antarctica",
+    "total revenue where product is kiwi",
+])
+def test_unrepresentable_filter_values_decline(sales, question):
+    assert try_fast_answer(question, sales) is None
+
+
+def test_ordering_comparator_on_text_column_declines(sales):
+    assert parse_question("how many rows where customer over 30", sales) is None
+
+
+def test_implicit_filter_on_string_dtype(sales):
+    # pandas >= 3 infers StringDtype for text columns
+    result = try_fast_answer("total revenue for apple", sales)
+    assert result["answer"] == "The total of revenue is 400."
+
+
+def test_implicit_filter_on_object_dtype(sales):
+    sales["product"] = sales["product"].astype(object)
+    assert try_fast_answer("total revenue for apple", sales)["answer"] == "The total of revenue is 400."
+
+
+def test_implicit_filter_on_category(sales):
+    sales["region"] = sales["region"].astype("category")
+    assert try_fast_answer("total revenue in Europe", sales)["answer"] == "The total of revenue is 400."
+
+
+@pytest.mark.parametrize("question, operation", [
+    ("what is the total revenue?", "sum of revenue"),
+    ("How many rows are there?", "count"),
+    ("how many customers", "nunique of customer"),
+    ("median price per region", "median of price by region"),
+    ("top 2 products by revenue", "sum of revenue by product (top 2)"),
+    ("top 2 products by revenue in Europe", "sum of revenue by product (top 2) where region == 'Europe'"),
+    ("bottom 1 region by average price", "mean of price by region (bottom 1)"),
+])
+def test_simple_questions_still_take_the_fast_path(sales, question, operation):
+    result = try_fast_answer(question, sales)
+    assert result["path"] == "fast"
+    assert result["operation"] == operation
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+from app import datasets
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(datasets, "CSV_CHUNK_ROWS", 2)
+
+
+def _write(tmp_path, text: str) -> str:
+    path = tmp_path / "data.csv"
+    path.write_text(text)
+    return str(path)
+
+
+def test_column_types_cover_every_chunk(tmp_path, small_chunks):
+    # Chunk 1 sees ints, chunk 2 a float, chunk 3 a blank; per-chunk inference would disagree
+    csv_path = _write(tmp_path, "qty,price,note\n1,10,a\n2,11,b\n3,2.5,a\n4,12,b\n,13,a\n6,14,long text\n")
+    df = datasets.read_csv_typed(csv_path)
+    assert df["qty"].dtype == "float32"
+    assert df["price"].dtype == "float32"
+    assert df["price"].tolist() == [10, 11, 2.5, 12, 13, 14]
+    assert pd.isna(df["qty"][4])
+
+
+def test_integers_are_downcast_from_the_whole_file(tmp_path, small_chunks):
+    csv_path = _write(tmp_path, "n\n1\n2\n3\n40000\n")
+    assert datasets.read_csv_typed(csv_path)["n"].dtype == "int32"
+
+
+def test_categories_are_fixed_across_chunks(tmp_path, small_chunks):
+    csv_path = _write(tmp_path, "region\nEurope\nEurope\nAsia\nAsia\nEurope\nAsia\n")
+    df = datasets.read_csv_typed(csv_path)
+    assert isinstance(df["region"].dtype, pd.CategoricalDtype)
+    assert list(df["region"].cat.categories) == ["Asia", "Europe"]
+
+
+def test_dates_and_text(tmp_path, small_chunks):
+    csv_path = _write(tmp_path, "order_date,customer\n2024-01-05,ann\n2024-02-01,bob\n2024-03-01,cid\nnot a date,dee\n"
+                                "2024-03-02,eve\n2024-03-03,fay\n" + "".join(f"2024-04-{d:02d},c{d}\n" for d in range(1, 28)))
+    df = datasets.read_csv_typed(csv_path)
+    assert df["order_date"].dtype == "datetime64[ns]"
+    assert pd.isna(df["order_date"][3])
+    assert not isinstance(df["customer"].dtype, pd.CategoricalDtype)
+
+
+def test_header_only_csv(tmp_path):
+    df = datasets.read_csv_typed(_write(tmp_path, "a,b\n"))
+    assert list(df.columns) == ["a", "b"] and df.empty
+
+
+def test_ingest_round_trip(tmp_path, monkeypatch, small_chunks):
+    monkeypatch.setattr(datasets, "DATASET_DIR", str(tmp_path / "store"))
+    meta = datasets.ingest_csv(_write(tmp_path, "product,revenue\napple,1\nbanana,2\napple,3\napple,4\n"), make_latest=False)
+    assert meta["rows"] == 4
+    assert meta["columns"] == {"product": "category", "revenue": "int8"}
+    df = datasets.load_dataset(meta["dataset_id"])
+    assert df["revenue"].sum() == 10
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from app.vector_backends import QuantizedVectorIndex, open_index
+
+
+def _vectors(seed: int, n: int = 3, dim: int = 16) -> np.ndarray:
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def _top_chunk(index: QuantizedVectorIndex, vector: np.ndarray) -> str:
+    (row, _), = index.search(vector, 1)
+    return index.documents([row])[row][0]
+
+
+def test_two_instances_on_one_directory_keep_each_others_segments(tmp_path):
+    a = QuantizedVectorIndex(str(tmp_path), index_kind="exact")
+    b = QuantizedVectorIndex(str(tmp_path), index_kind="exact")
+    a_vectors, b_vectors = _vectors(0), _vectors(1)
+
+    a.add(["a0", "a1", "a2"], a_vectors, ["a0", "a1", "a2"], [{}, {}, {}])
+    b.add(["b0", "b1", "b2"], b_vectors, ["b0", "b1", "b2"], [{}, {}, {}])
+
+    for index in (a, b, QuantizedVectorIndex(str(tmp_path), index_kind="exact")):
+        assert index.count() == 6
+        assert [_top_chunk(index, v) for v in a_vectors] == ["a0", "a1", "a2"]
+        assert [_top_chunk(index, v) for v in b_vectors] == ["b0", "b1", "b2"]
+
+
+def test_compaction_by_one_instance_is_seen_by_the_other(tmp_path):
+    a = QuantizedVectorIndex(str(tmp_path), index_kind="exact")
+    b = QuantizedVectorIndex(str(tmp_path), index_kind="exact")
+    vectors = _vectors(2)
+    a.add(["c0", "c1", "c2"], vectors, ["c0", "c1", "c2"], [{}, {}, {}])
+    b.add(["c1"], vectors[1:2], ["c1"], [{}])
+    b.compact()
+
+    a.add(["c3"], _vectors(3, n=1), ["c3"], [{}])
+    assert a.count() == 4
+    assert [_top_chunk(a, v) for v in vectors] == ["c0", "c1", "c2"]
+
+
+def test_open_index_shares_one_instance_per_directory(tmp_path):
+    first = open_index(str(tmp_path))
+    assert open_index(str(tmp_path / ".." / tmp_path.name)) is first
+    assert open_index(str(tmp_path / "other")) is not first